@@ -0,0 +1,277 @@
+"""Item analysis check and benchmark.
+
+Simulates a cohort answering two quizzes through the result-saving path used
+by quiz_app.attempts. On the "fixed" quiz everyone gets the whole bank, and
+on the "drawn" quiz each paper draws from a larger bank. Students answer
+with a probability set by their ability and the question's difficulty (a Rasch
+model), so items differ in difficulty and discrimination. Checks that the
+running sums give the same statistics as a computation from scratch over every
+stored response:
+
+  - difficulty (p-value), point-biserial discrimination and option picks
+    per question, overall and per section
+  - Cronbach's alpha on the fixed quiz (KR-20 over the full response matrix)
+  - rebuilding the sums from quiz_responses gives identical tables
+  - after an answer key correction and a re-grade the statistics follow
+    the new key
+
+Also reports the cost the sums add to each submission and how long the
+panel's read takes.
+
+    python benchmarks/item_analysis.py
+    python benchmarks/item_analysis.py --students 20000
+    python benchmarks/item_analysis.py --db-url postgresql://quiz@db-host/quiz_check
+
+Without --db-url (or QUIZ_DB_URL) a temporary SQLite file is used. Quiz ids
+carry a per-run prefix, so a database that already holds data can be used.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTIONS = ["A", "B", "C"]
+OPTIONS = 4
+# Share of questions left unanswered
+BLANK_RATE = 0.05
+TOLERANCE = 1e-9
+
+
+def build_bank(quiz_id, size, rng):
+    from quiz_app.questions import QuestionBank
+    questions = [{"id": qid, "topic": f"t{qid % 4}", "difficulty": "", "question": f"Question {qid}?",
+                  "options": [f"q{qid}-{o}" for o in range(OPTIONS)], "answer": f"q{qid}-{rng.randrange(OPTIONS)}",
+                  "b": rng.gauss(0, 1)} for qid in range(1, size + 1)]
+    return QuestionBank(quiz_id, questions)
+
+
+# One paper: (section, question ids, option indexes). Wrong answers favour
+# the option after the right one, so distractors differ in pull.
+def answer_paper(bank, qids, ability, rng):
+    picks = []
+    for qid in qids:
+        q = bank.by_id[qid]
+        right = q["options"].index(q["answer"])
+        if rng.random() < BLANK_RATE:
+            picks.append(-1)
+        elif rng.random() < 1 / (1 + math.exp(q["b"] - ability)):
+            picks.append(right)
+        else:
+            picks.append(rng.choice([(right + 1) % OPTIONS] * 2 + [(right + 2) % OPTIONS, (right + 3) % OPTIONS]))
+    return picks
+
+
+def save_papers(bank, papers):
+    from quiz_app.db import begin_write, get_db_connection
+    from quiz_app.grading import grade_attempt
+    from quiz_app.item_analysis import add_responses
+    from quiz_app.results import RESULTS_LOCK, save_quiz_result
+
+    timings = {"with_sums": [], "without_sums": []}
+    for i, (section, qids, picks) in enumerate(papers):
+        responses = (np.array(qids, dtype=np.int32), np.array(picks, dtype=np.int8))
+        score = grade_attempt(bank, *responses)
+        with_sums = i % 2 == 0
+        started = time.perf_counter()
+        with get_db_connection() as conn:
+            begin_write(conn, f"user:{bank.quiz_id}-{i}", shared=(RESULTS_LOCK,))
+            save_quiz_result(f"{bank.quiz_id}-{i}", "h", f"USN{i:06d}", section, score, 60.0,
+                             passed=score >= len(qids) / 2, responses=responses, conn=conn, quiz_id=bank.quiz_id)
+            if with_sums:
+                add_responses(conn, bank, section, *responses)
+            conn.commit()
+        timings["with_sums" if with_sums else "without_sums"].append(time.perf_counter() - started)
+    return timings
+
+
+# The same statistics computed from every paper
+def from_scratch(bank, papers, section=None):
+    papers = [p for p in papers if section is None or p[0] == section]
+    keys = {qid: q["options"].index(q["answer"]) for qid, q in bank.by_id.items()}
+    scores = defaultdict(list)
+    picks = Counter()
+    totals = []
+    for _, qids, chosen in papers:
+        correct = [int(keys[qid] == pick) for qid, pick in zip(qids, chosen)]
+        total = sum(correct)
+        totals.append(total)
+        for qid, pick, x in zip(qids, chosen, correct):
+            scores[qid].append((x, total - x))
+            picks[qid, pick] += 1
+    items = {}
+    for qid, pairs in scores.items():
+        x, rest = np.array(pairs, dtype=float).T
+        r = np.corrcoef(x, rest)[0, 1] if x.std() and rest.std() else np.nan
+        items[qid] = (len(pairs), x.mean(), r)
+    alpha = None
+    lengths = {len(qids) for _, qids, _ in papers}
+    if len(lengths) == 1 and all(set(qids) == set(papers[0][1]) for _, qids, _ in papers):
+        k = lengths.pop()
+        item_variance = sum(p * (1 - p) for _, p, _ in items.values())
+        alpha = k / (k - 1) * (1 - item_variance / np.var(totals))
+    return items, picks, alpha
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+        self.count = 0
+
+    def expect(self, name, ok, detail=""):
+        self.count += 1
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failures.append(name)
+
+
+def same_stats(bank, papers, section=None):
+    from quiz_app.item_analysis import get_item_stats
+    items, choices, summary = get_item_stats(bank, section)
+    expected_items, expected_picks, expected_alpha = from_scratch(bank, papers, section)
+    problems = []
+    for row in items.itertuples(index=False):
+        n, p, r = expected_items[row.Question]
+        if row.Responses != n or abs(row.Difficulty - round(p, 3)) > TOLERANCE:
+            problems.append(f"q{row.Question} p {row.Difficulty} vs {p}")
+        if not (np.isnan(r) and np.isnan(row.Discrimination)) and abs(row.Discrimination - round(r, 3)) > TOLERANCE:
+            problems.append(f"q{row.Question} r {row.Discrimination} vs {r}")
+    if set(items["Question"]) != set(expected_items):
+        problems.append("questions differ")
+    index = {qid: bank.by_id[qid]["options"] for qid in bank.by_id}
+    got_picks = {(row.Question, index[row.Question].index(row.Option) if row.Option in index[row.Question] else -1):
+                 row.Picks for row in choices.itertuples(index=False)}
+    if got_picks != dict(expected_picks):
+        problems.append("option picks differ")
+    if expected_alpha is not None and abs(summary["alpha"] - expected_alpha) > 1e-6:
+        problems.append(f"alpha {summary['alpha']} vs {expected_alpha}")
+    return problems, summary
+
+
+def table_rows(quiz_ids):
+    from quiz_app.db import backend, get_db_connection
+    placeholders = ", ".join([backend.PARAM] * len(quiz_ids))
+    with get_db_connection() as conn:
+        return {table: sorted(conn.execute(f"SELECT * FROM {table} WHERE quiz_id IN ({placeholders})",
+                                           quiz_ids).fetchall())
+                for table in ("item_stats", "item_choices", "paper_stats")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--fixed-questions", type=int, default=10)
+    parser.add_argument("--bank-size", type=int, default=40)
+    parser.add_argument("--paper-size", type=int, default=10)
+    parser.add_argument("--db-url", default=os.environ.get("QUIZ_DB_URL", ""),
+                        help="database to use (default: a temporary SQLite file)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="quiz-items-")
+    os.environ.update(QUIZ_DB_URL=args.db_url, QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"))
+    sys.path.insert(0, REPO_ROOT)
+    from quiz_app.db import begin_write, get_db_connection, init_db, is_postgres
+    from quiz_app.grading import regrade_all
+    from quiz_app.item_analysis import ensure_item_stats, get_item_stats, rebuild_item_stats, replace_item_stats
+    from quiz_app.questions import QuestionBank
+    from quiz_app.results import RESULTS_LOCK
+
+    init_db()
+    rng = random.Random(7)
+    run = uuid.uuid4().hex[:6]
+    fixed = build_bank(f"{run}-fixed", args.fixed_questions, rng)
+    drawn = build_bank(f"{run}-drawn", args.bank_size, rng)
+    abilities = [rng.gauss(0, 1) for _ in range(args.students)]
+    papers = {}
+    for bank, size in ((fixed, args.fixed_questions), (drawn, args.paper_size)):
+        papers[bank.quiz_id] = []
+        for i, ability in enumerate(abilities):
+            qids = sorted(bank.by_id) if bank is fixed else list(bank.paper_ids(rng.getrandbits(31), size))
+            papers[bank.quiz_id].append((SECTIONS[i % len(SECTIONS)], qids, answer_paper(bank, qids, ability, rng)))
+    checks = Checks()
+    print(f"{args.students} students, fixed quiz of {args.fixed_questions} questions, "
+          f"{args.paper_size} drawn from {args.bank_size}, {'PostgreSQL' if is_postgres() else 'SQLite'} backend")
+
+    # Every other paper skips the sums, to time them; they are rebuilt below
+    timings = {}
+    for bank in (fixed, drawn):
+        for key, values in save_papers(bank, papers[bank.quiz_id]).items():
+            timings.setdefault(key, []).extend(values)
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        for bank in (fixed, drawn):
+            rebuild_item_stats(bank, conn)
+        conn.commit()
+    built = table_rows([fixed.quiz_id, drawn.quiz_id])
+
+    # Streamed: clear the tables and add every paper again, one transaction each
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        for bank in (fixed, drawn):
+            replace_item_stats(conn, bank)
+        conn.commit()
+    from quiz_app.item_analysis import add_responses
+    for bank in (fixed, drawn):
+        for section, qids, picks in papers[bank.quiz_id]:
+            with get_db_connection() as conn:
+                add_responses(conn, bank, section, np.array(qids, dtype=np.int32), np.array(picks, dtype=np.int8))
+                conn.commit()
+    checks.expect("rebuilding from stored responses matches the running sums",
+                  table_rows([fixed.quiz_id, drawn.quiz_id]) == built)
+
+    summaries = {}
+    for bank in (fixed, drawn):
+        for section in (None, "B"):
+            problems, summary = same_stats(bank, papers[bank.quiz_id], section)
+            name = bank.quiz_id.split("-")[1] + (f" section {section}" if section else "")
+            checks.expect(f"{name}: statistics match a computation from scratch", not problems, "; ".join(problems[:3]))
+            summaries[name] = summary
+    print(f"alpha: fixed {summaries['fixed']['alpha']:.3f}, drawn (estimate) {summaries['drawn']['alpha']:.3f}")
+
+    # Answer key correction on the fixed quiz, then a re-grade
+    corrected = [dict(q, answer=q["options"][(q["options"].index(q["answer"]) + 1) % OPTIONS])
+                 if q["id"] == 1 else q for q in fixed.by_id.values()]
+    fixed = QuestionBank(fixed.quiz_id, corrected)
+    regrade_all(fixed)
+    problems, _ = same_stats(fixed, papers[fixed.quiz_id])
+    checks.expect("a re-grade after a key correction updates the statistics", not problems, "; ".join(problems[:3]))
+    ensure_item_stats(fixed)
+    problems, _ = same_stats(fixed, papers[fixed.quiz_id])
+    checks.expect("the one-time build leaves existing sums as they are", not problems, "; ".join(problems[:3]))
+
+    reads = []
+    for _ in range(20):
+        started = time.perf_counter()
+        get_item_stats(drawn)
+        reads.append(time.perf_counter() - started)
+    with_sums, without_sums = np.median(timings["with_sums"]), np.median(timings["without_sums"])
+    result = {
+        "students": args.students,
+        "backend": "postgresql" if is_postgres() else "sqlite",
+        "submission_ms": round(without_sums * 1000, 3),
+        "submission_with_sums_ms": round(with_sums * 1000, 3),
+        "panel_read_ms": round(float(np.median(reads)) * 1000, 2),
+        "alpha": {name: summary["alpha"] for name, summary in summaries.items()},
+        "checks": checks.count,
+        "failures": checks.failures,
+    }
+    print(f"submission (median): {result['submission_ms']} ms, {result['submission_with_sums_ms']} ms with the sums; "
+          f"panel read (median): {result['panel_read_ms']} ms")
+    print(f"{checks.count - len(checks.failures)}/{checks.count} checks passed")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if checks.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+"""Exam-start load test.
+
+Drives Student-Quiz.py headlessly with Streamlit's AppTest: N simulated
+students register (OTP read from a local SMTP sink), then all log in and open
+the quiz at once, then all answer and submit at once. Reports p50/p95/p99 per
+step, SQLite write/lock waits and file I/O counts, and compares p95s against a
+stored baseline.
+
+    python benchmarks/login_storm.py --students 100 --concurrency 8
+    python benchmarks/login_storm.py --update-baseline
+
+AppTest shares one runtime per process, so concurrency comes from worker
+processes: each stands in for a server process over the same database and
+runs its share of students, and all workers start each phase together.
+
+Needs aiosmtpd (pip install -r benchmarks/requirements.txt). The webcam widget
+has no browser to talk to under AppTest, so it is replaced with a no-op.
+"""
+import argparse
+import email
+import functools
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "Student-Quiz.py")
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "baseline.json")
+STEPS = ["register_send_otp", "otp_delivery", "register_verify", "login", "open_quiz", "answer", "submit"]
+# A write statement or commit slower than this is counted as having waited on a lock
+LOCK_WAIT_THRESHOLD_SECONDS = 0.01
+# How long workers wait, after the last phase, for queued mail to be sent
+DELIVERY_TIMEOUT_SECONDS = 120
+
+
+# ---------------- Local SMTP sink ----------------
+# Runs in the parent process; OTPs are handed to the workers through a shared dict
+class MailSink:
+    def __init__(self, otps):
+        self.otps = otps
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        message = email.message_from_bytes(envelope.content)
+        self.received += 1
+        match = re.search(r"\b(\d{6})\b", message.get_payload())
+        if "OTP" in message["Subject"] and match:
+            self.otps[message["To"]] = match.group(1)
+        return "250 OK"
+
+
+def wait_otp(otps, address, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        otp = otps.pop(address, None)
+        if otp is not None:
+            return otp
+        time.sleep(0.02)
+    return None
+
+
+# The outbox is sent by the workers' background threads, so a worker waits for
+# it to drain (whichever worker sends it) before it exits
+def wait_outbox_drained(timeout=DELIVERY_TIMEOUT_SECONDS):
+    from quiz_app.db import get_db_connection
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with get_db_connection() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM email_outbox WHERE status IN ('pending', 'sending')"
+                                  ).fetchone()[0]
+        if not queued:
+            return 0
+        time.sleep(0.1)
+    return queued
+
+
+# ---------------- Instrumentation ----------------
+class DbStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.lock_waits = 0
+        self.lock_wait_seconds = 0.0
+        self.pool_waits = 0
+        self.pool_wait_seconds = 0.0
+
+    def record_write(self, seconds):
+        with self.lock:
+            self.writes += 1
+            if seconds > LOCK_WAIT_THRESHOLD_SECONDS:
+                self.lock_waits += 1
+                self.lock_wait_seconds += seconds
+
+    def record_acquire(self, seconds):
+        if seconds > LOCK_WAIT_THRESHOLD_SECONDS:
+            with self.lock:
+                self.pool_waits += 1
+                self.pool_wait_seconds += seconds
+
+
+DB_STATS = DbStats()
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "BEGIN")
+
+
+# Writes (and commits) are where SQLite waits for the database lock; time them
+class TimedConnection(sqlite3.Connection):
+    def execute(self, sql, *args):
+        if not sql.lstrip().upper().startswith(_WRITE_PREFIXES):
+            return super().execute(sql, *args)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            DB_STATS.record_write(time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            DB_STATS.record_write(time.perf_counter() - started)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            DB_STATS.record_write(time.perf_counter() - started)
+
+
+def instrument_db():
+    sqlite3.connect = functools.partial(sqlite3.connect, factory=TimedConnection)
+    from quiz_app.db import ConnectionPool
+    acquire = ConnectionPool.acquire
+
+    def timed_acquire(self):
+        started = time.perf_counter()
+        try:
+            return acquire(self)
+        finally:
+            DB_STATS.record_acquire(time.perf_counter() - started)
+    ConnectionPool.acquire = timed_acquire
+
+
+FILE_EVENTS = Counter()
+_counting = threading.Event()
+
+
+def _audit(event, args):
+    if not _counting.is_set():
+        return
+    if event == "open":
+        path, mode = args[0], args[1]
+        if isinstance(path, int) or mode is None:
+            return
+        FILE_EVENTS["open_write" if any(c in mode for c in "wax+") else "open_read"] += 1
+    elif event in ("os.listdir", "os.scandir", "os.remove", "os.rename", "os.mkdir"):
+        FILE_EVENTS[event] += 1
+
+
+# ---------------- Simulated student ----------------
+class Student:
+    def __init__(self, i, otps, timings):
+        from streamlit.testing.v1 import AppTest
+        self.username = f"student{i:04d}"
+        self.email = f"{self.username}@bench.local"
+        self.password = f"pw-{i}"
+        self.usn = f"1BM{i:05d}"
+        self.section = "ABCD"[i % 4]
+        self.otps = otps
+        self.timings = timings
+        self.rng = random.Random(i)
+        self.errors = []
+        self.at = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.at.run()
+
+    def _timed(self, step, action):
+        started = time.perf_counter()
+        action()
+        self.timings[step].append(time.perf_counter() - started)
+        if self.at.exception:
+            self.errors.append(f"{step}: {self.at.exception[0].message}")
+        for error in self.at.error:
+            self.errors.append(f"{step}: {error.value}")
+
+    def page(self, name):
+        self.at.sidebar.selectbox[0].select(name).run()
+
+    def register(self):
+        self.page("Register")
+        self.at.text_input[0].input(self.username)
+        self.at.text_input[1].input(self.email)
+        self.at.text_input[2].input(self.password)
+        self._timed("register_send_otp", lambda: self.at.button[0].click().run())
+        started = time.perf_counter()
+        otp = wait_otp(self.otps, self.email)
+        self.timings["otp_delivery"].append(time.perf_counter() - started)
+        if otp is None:
+            self.errors.append("otp_delivery: no OTP mail received")
+            return
+        self.at.text_input[3].input(otp)
+        self._timed("register_verify", lambda: self.at.button[1].click().run())
+
+    def login_and_open_quiz(self):
+        self.page("Login")
+        self.at.text_input[0].input(self.username)
+        self.at.text_input[1].input(self.password)
+        self._timed("login", lambda: self.at.button[0].click().run())
+        self.page("Take Quiz")
+        self.at.text_input[0].input(self.usn)
+        self.at.text_input[1].input(self.section).run()
+        self._timed("open_quiz", lambda: self.at.button[0].click().run())
+
+    def answer_and_submit(self):
+        def answer():
+            for radio in self.at.radio:
+                radio.set_value(self.rng.choice(radio.options))
+            self.at.run()
+        self._timed("answer", answer)
+        self._timed("submit", lambda: self.at.button[0].click().run())
+
+
+# One worker process: builds its students, then runs each phase in step with
+# the other workers. Registration is spread out in practice; the storm is
+# login + quiz start, then submission near the time limit.
+def run_worker(student_ids, otps, barrier, results):
+    os.chdir(os.path.dirname(os.environ["QUIZ_DB_PATH"]))
+    sys.path.insert(0, REPO_ROOT)
+    import streamlit_webrtc
+    streamlit_webrtc.webrtc_streamer = lambda *a, **k: None
+    instrument_db()
+    sys.addaudithook(_audit)
+
+    timings = defaultdict(list)
+    students = []
+    errors = []
+    try:
+        students = [Student(i, otps, timings) for i in student_ids]
+        _counting.set()
+        for phase in (Student.register, Student.login_and_open_quiz, Student.answer_and_submit):
+            barrier.wait()
+            for student in students:
+                phase(student)
+    except Exception as e:
+        # Release the other workers rather than leaving them at the barrier
+        barrier.abort()
+        errors.append(f"worker failed: {e!r}")
+    _counting.clear()
+    if not errors:
+        queued = wait_outbox_drained()
+        if queued:
+            errors.append(f"outbox: {queued} mails still queued after {DELIVERY_TIMEOUT_SECONDS}s")
+    results.put({
+        "timings": dict(timings),
+        "errors": errors + [e for s in students for e in s.errors],
+        "db": {"writes": DB_STATS.writes, "lock_waits": DB_STATS.lock_waits,
+               "lock_wait_seconds": DB_STATS.lock_wait_seconds,
+               "pool_waits": DB_STATS.pool_waits, "pool_wait_seconds": DB_STATS.pool_wait_seconds},
+        "file_io": dict(FILE_EVENTS),
+    })
+
+
+# ---------------- Report ----------------
+def summarize(timings):
+    summary = {}
+    for step in STEPS:
+        values = np.array(timings.get(step, []))
+        if not len(values):
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary[step] = {"n": len(values), "p50": round(float(p50), 4), "p95": round(float(p95), 4),
+                         "p99": round(float(p99), 4), "max": round(float(values.max()), 4)}
+    return summary
+
+
+def compare(summary, baseline, tolerance):
+    regressions = []
+    for step, stats in summary.items():
+        base = baseline.get("steps", {}).get(step)
+        if not base:
+            continue
+        # Ignore tiny absolute changes on very fast steps
+        if stats["p95"] > base["p95"] * tolerance and stats["p95"] - base["p95"] > 0.05:
+            regressions.append(f"{step}: p95 {stats['p95']:.3f}s vs baseline {base['p95']:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="worker processes")
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed p95 ratio over the baseline")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        sys.exit("aiosmtpd is required: pip install -r benchmarks/requirements.txt")
+
+    workdir = tempfile.mkdtemp(prefix="quiz-bench-")
+    os.chdir(workdir)
+    os.environ.update(QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"),
+                      QUIZ_RECORDING_DIR=os.path.join(workdir, "recordings"),
+                      QUIZ_SMTP_HOST="127.0.0.1", QUIZ_SMTP_PORT=str(args.smtp_port), QUIZ_SMTP_STARTTLS="0")
+
+    ctx = multiprocessing.get_context("spawn")
+    manager = ctx.Manager()
+    otps = manager.dict()
+    barrier = ctx.Barrier(args.concurrency)
+    results = ctx.Queue()
+    mail = MailSink(otps)
+    smtp = Controller(mail, hostname="127.0.0.1", port=args.smtp_port)
+    smtp.start()
+
+    started = time.perf_counter()
+    workers = [ctx.Process(target=run_worker, args=(ids, otps, barrier, results))
+               for ids in (list(range(args.students))[w::args.concurrency] for w in range(args.concurrency))]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    smtp.stop()
+
+    timings = defaultdict(list)
+    db = Counter()
+    file_io = Counter()
+    errors = []
+    for outcome in outcomes:
+        for step, values in outcome["timings"].items():
+            timings[step].extend(values)
+        db.update(outcome["db"])
+        file_io.update(outcome["file_io"])
+        errors.extend(outcome["errors"])
+
+    with sqlite3.connect(os.environ["QUIZ_DB_PATH"]) as conn:
+        saved = conn.execute("SELECT COUNT(*) FROM quiz_results").fetchone()[0]
+    report = {
+        "students": args.students,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "results_saved": saved,
+        "mails_received": mail.received,
+        "errors": len(errors),
+        "steps": summarize(timings),
+        "db": {key: round(value, 3) for key, value in sorted(db.items())},
+        "file_io": dict(sorted(file_io.items())),
+    }
+
+    print(f"{args.students} students, concurrency {args.concurrency}, {elapsed:.1f}s, "
+          f"{saved} results saved, {mail.received} mails, {len(errors)} errors")
+    print(f"{'step':<20}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for step, s in report["steps"].items():
+        print(f"{step:<20}{s['n']:>6}{s['p50']:>10.3f}{s['p95']:>10.3f}{s['p99']:>10.3f}{s['max']:>10.3f}")
+    print("db:", report["db"])
+    print("file i/o:", report["file_io"])
+    for error in errors[:10]:
+        print("error:", error)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get("students"), baseline.get("concurrency")) != (args.students, args.concurrency):
+            print("note: baseline was recorded with a different student count or concurrency")
+        regressions = compare(report["steps"], baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
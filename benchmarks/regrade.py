@@ -0,0 +1,283 @@
+"""Grading schemes check and bulk re-grade benchmark.
+
+Stores a cohort of attempts for a quiz whose bank gives partial credit on
+some options, then re-grades them under each scheme with
+quiz_app.grading.regrade_all. Checks that:
+
+  - every stored score matches a question-by-question computation for the
+    standard, negative-marking and partial-credit schemes
+  - pass flags and the result partitions follow the new scores
+  - the item analysis sums match a rebuild from the stored responses
+  - the scheme picked for a re-grade is the one new submissions are graded with
+  - results saved while a re-grade runs end up graded with the new scheme
+
+Also checks, for a re-grade that changes every attempt, that loading and
+scoring the attempts and summing the item analysis takes under a second for
+100k attempts, and that no write transaction holds the lock for longer than
+that (the longest a submission can be held up by it). Writing the scores back
+is reported but has no target: it is bound by the score indexes.
+
+    python benchmarks/regrade.py
+    python benchmarks/regrade.py --attempts 20000
+    python benchmarks/regrade.py --db-url postgresql://quiz@db-host/quiz_check
+
+Without --db-url (or QUIZ_DB_URL) a temporary SQLite file is used. Quiz ids
+carry a per-run prefix, so a database that already holds data can be used.
+Attempts are inserted in bulk rather than through the submission path, to
+keep the setup short.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SECTIONS = ["A", "B", "C"]
+OPTIONS = 4
+BANK_SIZE = 40
+PAPER_SIZE = 10
+# Share of questions left unanswered, and of questions with a partly right option
+BLANK_RATE = 0.05
+CREDIT_RATE = 0.3
+GRADE_TARGET_SECONDS = 1.0
+LOCK_TARGET_SECONDS = 1.0
+
+
+def build_bank(quiz_id, rng):
+    from quiz_app.questions import QuestionBank
+    questions = []
+    for qid in range(1, BANK_SIZE + 1):
+        options = [f"q{qid}-{o}" for o in range(OPTIONS)]
+        q = {"id": qid, "question": f"Question {qid}?", "options": options, "answer": options[rng.randrange(OPTIONS)]}
+        if rng.random() < CREDIT_RATE:
+            q["credit"] = {next(o for o in options if o != q["answer"]): 0.5}
+        questions.append(q)
+    return QuestionBank(quiz_id, questions)
+
+
+def random_paper(rng):
+    qids = rng.sample(range(1, BANK_SIZE + 1), PAPER_SIZE)
+    return qids, [-1 if rng.random() < BLANK_RATE else rng.randrange(OPTIONS) for _ in qids]
+
+
+# The score of one paper, question by question
+def expected_score(bank, scheme, qids, picks, negative_mark):
+    score = 0.0
+    for qid, pick in zip(qids, picks):
+        q = bank.by_id[qid]
+        if pick == -1:
+            continue
+        option = q["options"][pick]
+        if option == q["answer"]:
+            score += 1
+        elif scheme == "negative":
+            score -= negative_mark
+        elif scheme == "partial":
+            score += q.get("credit", {}).get(option, 0)
+    return round(score, 2)
+
+
+def insert_attempts(bank, papers):
+    from quiz_app.db import backend, begin_write, get_db_connection
+    from quiz_app.item_analysis import rebuild_item_stats
+    from quiz_app.results import LEGACY_PASS_MARK, RESULTS_LOCK, rebuild_result_stats
+
+    ts = datetime.now().isoformat(sep=" ")
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        ids = []
+        for i, (section, qids, picks) in enumerate(papers):
+            # Stored with a score no scheme gives, so the first re-grade changes every attempt
+            ids.append(conn.execute(backend.RESULT_ADD_RETURNING_ID,
+                                    (f"{bank.quiz_id}-{i}", "h", f"USN{i:06d}", section, -99, 60.0, ts, 0, None,
+                                     bank.quiz_id)).fetchone()[0])
+        conn.executemany(backend.RESULT_ADD_RESPONSES,
+                         [(result_id, np.array(qids, dtype=np.int32).tobytes(), np.array(picks, dtype=np.int8).tobytes())
+                          for result_id, (_, qids, picks) in zip(ids, papers)])
+        rebuild_result_stats(LEGACY_PASS_MARK, conn, bank.quiz_id)
+        rebuild_item_stats(bank, conn)
+        conn.commit()
+    return ids
+
+
+# Submit the way quiz_app.attempts does: grade under the write lock with the
+# active scheme, then save the result and add it to the item sums
+def submit(bank, username, section, qids, picks):
+    from quiz_app.db import begin_write, get_db_connection
+    from quiz_app.grading import PASS_FRACTION, active_scheme, grade_attempt
+    from quiz_app.item_analysis import add_responses
+    from quiz_app.results import RESULTS_LOCK, save_quiz_result
+
+    responses = (np.array(qids, dtype=np.int32), np.array(picks, dtype=np.int8))
+    with get_db_connection() as conn:
+        begin_write(conn, f"user:{username}", shared=(RESULTS_LOCK,))
+        score = grade_attempt(bank, *responses, scheme=active_scheme(conn))
+        result_id, _ = save_quiz_result(username, "h", "USN", section, score, 60.0,
+                                     passed=score >= len(qids) * PASS_FRACTION, responses=responses, conn=conn,
+                                     quiz_id=bank.quiz_id)
+        add_responses(conn, bank, section, *responses)
+        conn.commit()
+    return result_id
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+        self.count = 0
+
+    def expect(self, name, ok, detail=""):
+        self.count += 1
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failures.append(name)
+
+
+def stored_scores(quiz_id):
+    from quiz_app.db import backend, get_db_connection
+    with get_db_connection() as conn:
+        return {row[0]: (row[1], row[2]) for row in conn.execute(
+            f"SELECT id, score, passed FROM quiz_results WHERE quiz_id = {backend.PARAM}", (quiz_id,))}
+
+
+def wrong_scores(bank, scheme, papers_by_id, negative_mark):
+    from quiz_app.grading import PASS_FRACTION
+    wrong = []
+    for result_id, (score, passed) in stored_scores(bank.quiz_id).items():
+        _, qids, picks = papers_by_id[result_id]
+        expected = expected_score(bank, scheme, qids, picks, negative_mark)
+        if abs(score - expected) > 1e-9 or bool(passed) != (expected >= len(qids) * PASS_FRACTION):
+            wrong.append(f"result {result_id}: {score} vs {expected}")
+    return wrong
+
+
+def partitions_match(quiz_id):
+    from quiz_app.db import backend, get_db_connection
+    with get_db_connection() as conn:
+        stored = sorted(conn.execute(f'''SELECT section, row_count, score_sum, pass_count, min_score, max_score
+                                         FROM result_partitions WHERE quiz_id = {backend.PARAM}''',
+                                     (quiz_id,)).fetchall())
+        scratch = sorted(conn.execute(f'''SELECT section, COUNT(*), SUM(score), SUM(passed), MIN(score), MAX(score)
+                                          FROM quiz_results WHERE quiz_id = {backend.PARAM} GROUP BY section''',
+                                      (quiz_id,)).fetchall())
+    return all(a[:2] == b[:2] and abs(a[2] - b[2]) < 1e-6 and a[3:] == b[3:] for a, b in zip(stored, scratch)) \
+        and len(stored) == len(scratch)
+
+
+def item_tables(quiz_id):
+    from quiz_app.db import backend, get_db_connection
+    with get_db_connection() as conn:
+        return {table: sorted(conn.execute(f"SELECT * FROM {table} WHERE quiz_id = {backend.PARAM}",
+                                           (quiz_id,)).fetchall())
+                for table in ("item_stats", "item_choices", "paper_stats")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--attempts", type=int, default=100_000)
+    parser.add_argument("--db-url", default=os.environ.get("QUIZ_DB_URL", ""),
+                        help="database to use (default: a temporary SQLite file)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="quiz-regrade-")
+    os.environ.update(QUIZ_DB_URL=args.db_url, QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"))
+    sys.path.insert(0, REPO_ROOT)
+    from quiz_app.db import begin_write, get_db_connection, init_db, is_postgres
+    from quiz_app.grading import NEGATIVE_MARK, active_scheme, grade_attempt, regrade_all
+    from quiz_app.item_analysis import rebuild_item_stats
+    from quiz_app.results import RESULTS_LOCK
+
+    init_db()
+    rng = random.Random(11)
+    bank = build_bank(f"{uuid.uuid4().hex[:6]}-regrade", rng)
+    papers = [(SECTIONS[i % len(SECTIONS)], *random_paper(rng)) for i in range(args.attempts)]
+    checks = Checks()
+    print(f"{args.attempts} attempts, {PAPER_SIZE} of {BANK_SIZE} questions each, "
+          f"{'PostgreSQL' if is_postgres() else 'SQLite'} backend")
+    papers_by_id = dict(zip(insert_attempts(bank, papers), papers))
+
+    reports = {}
+    for scheme in ("standard", "negative", "partial"):
+        reports[scheme] = regrade_all(bank, scheme)
+        wrong = wrong_scores(bank, scheme, papers_by_id, NEGATIVE_MARK)
+        checks.expect(f"{scheme}: every score and pass flag is right", not wrong,
+                      f"{len(wrong)} wrong, e.g. {wrong[:2]}")
+        print(f"  {scheme}: {reports[scheme]['changed']} changed, loading and scoring {reports[scheme]['grade_seconds']:.3f}s, "
+              f"write lock held at most {reports[scheme]['lock_seconds']:.3f}s, total {reports[scheme]['total_seconds']:.3f}s")
+    checks.expect("result partitions follow the new scores", partitions_match(bank.quiz_id))
+    sums = item_tables(bank.quiz_id)
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        rebuild_item_stats(bank, conn)
+        conn.commit()
+    checks.expect("item sums match a rebuild from the stored responses", item_tables(bank.quiz_id) == sums)
+    first = reports["standard"]
+    checks.expect(f"attempts loaded and scored in under {GRADE_TARGET_SECONDS:.0f} s when every attempt changes",
+                  first["changed"] == args.attempts and first["grade_seconds"] < GRADE_TARGET_SECONDS,
+                  f"{first['changed']} changed, {first['grade_seconds']:.3f}s")
+    checks.expect(f"write lock held under {LOCK_TARGET_SECONDS:.0f} s at a time when every attempt changes",
+                  first["changed"] == args.attempts and first["lock_seconds"] < LOCK_TARGET_SECONDS,
+                  f"{first['changed']} changed, {first['lock_seconds']:.3f}s")
+
+    # The last re-grade used partial credit; a new submission must too
+    section, qids, picks = papers[0]
+    partial = expected_score(bank, "partial", qids, picks, NEGATIVE_MARK)
+    responses = (np.array(qids, dtype=np.int32), np.array(picks, dtype=np.int8))
+    checks.expect("the re-grade scheme grades new submissions",
+                  active_scheme() == "partial" and grade_attempt(bank, *responses) == partial,
+                  f"{active_scheme()}: {grade_attempt(bank, *responses)} vs {partial}")
+
+    # Submissions keep arriving while a re-grade to negative marking runs
+    stop = threading.Event()
+    submitted = []
+
+    def keep_submitting():
+        while not stop.is_set():
+            paper = (SECTIONS[len(submitted) % len(SECTIONS)], *random_paper(rng))
+            submitted.append((submit(bank, f"{bank.quiz_id}-late-{len(submitted)}", *paper), paper))
+
+    thread = threading.Thread(target=keep_submitting)
+    thread.start()
+    time.sleep(0.05)
+    regrade_all(bank, "negative")
+    stop.set()
+    thread.join()
+    papers_by_id.update(submitted)
+    wrong = wrong_scores(bank, "negative", papers_by_id, NEGATIVE_MARK)
+    checks.expect("results saved during a re-grade are graded with the new scheme", not wrong,
+                  f"{len(wrong)} wrong of {len(submitted)} saved meanwhile, e.g. {wrong[:2]}")
+    sums = item_tables(bank.quiz_id)
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        rebuild_item_stats(bank, conn)
+        conn.commit()
+    checks.expect("item sums include the results saved during the re-grade", item_tables(bank.quiz_id) == sums)
+    checks.expect("result partitions include the results saved during the re-grade", partitions_match(bank.quiz_id))
+
+    result = {
+        "attempts": args.attempts,
+        "backend": "postgresql" if is_postgres() else "sqlite",
+        "regrade": {scheme: {key: round(value, 4) if isinstance(value, float) else value
+                             for key, value in report.items()} for scheme, report in reports.items()},
+        "saved_during_regrade": len(submitted),
+        "checks": checks.count,
+        "failures": checks.failures,
+    }
+    print(f"{len(submitted)} results saved during the last re-grade")
+    print(f"{checks.count - len(checks.failures)}/{checks.count} checks passed")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if checks.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+"""Multi-replica consistency check.
+
+Starts N app replicas as separate processes over one shared backend and
+routes each student's steps to a different replica every time, the way a load
+balancer without sticky sessions would. Concurrent steps are sent to every
+replica at once. Checks that the shared state stays consistent:
+
+  - an OTP issued by one replica verifies on another
+  - an attempt claimed on every replica at once opens once; the attempt limit holds
+  - answers autosaved on two replicas are all seen by a third
+  - a submission raced on every replica is graded once, with one result email
+  - password changes raced on every replica stop at the limit
+  - presence written on one replica is seen by the others
+  - a recording continued on a second replica doesn't overwrite the first
+    replica's segments, and a third replica can play all of them
+  - the results catalog and counters agree with quiz_results
+
+    python benchmarks/replicas.py
+    python benchmarks/replicas.py --replicas 4 --students 40
+    python benchmarks/replicas.py --db-url postgresql://quiz@db-host/quiz_check
+
+Without --db-url (or QUIZ_DB_URL) the replicas share a temporary SQLite file.
+Each replica runs in its own working directory, so its recordings directory is
+its own, as on separate hosts, and recordings must go through the media store
+(database by default). Users are named with a per-run prefix, so a database that already
+holds data can be used; it gains this run's rows.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Calls handled at once per replica (Streamlit serves sessions on threads)
+REPLICA_THREADS = 8
+RECORDED_STUDENTS = 3
+
+
+# ---------------- Replica side ----------------
+def op_request_otp(email, username):
+    from quiz_app.otp import REGISTRATION, issue_otp
+    issue_otp(REGISTRATION, email, {"username": username})
+    return True
+
+
+def op_register(email, code, password):
+    from quiz_app.credentials import hash_password
+    from quiz_app.db import backend, get_db_connection
+    from quiz_app.otp import REGISTRATION, verify_otp
+    payload = verify_otp(REGISTRATION, email, code)
+    if payload is None:
+        return None
+    with get_db_connection() as conn:
+        conn.execute(backend.USER_ADD, (payload["username"], hash_password(password), "student", email))
+        conn.commit()
+    return payload["username"]
+
+
+def op_login(username, password):
+    from quiz_app.credentials import authenticate
+    return authenticate(username, password)
+
+
+def op_claim(username, usn, section, seed):
+    from quiz_app.attempts import AttemptLimitReached, claim_attempt
+    try:
+        return claim_attempt(username, usn, section, seed)["attempt_no"]
+    except AttemptLimitReached:
+        return "limit"
+
+
+def op_join(username, section):
+    from quiz_app.presence import add_active_student
+    add_active_student(username, section)
+    return True
+
+
+def op_active():
+    from quiz_app.presence import get_active_students
+    return sorted(get_active_students())
+
+
+def op_answer(username, attempt_no, answers):
+    from quiz_app.attempts import autosave_answer, get_autosave
+    for qid, answer in answers.items():
+        autosave_answer(username, attempt_no, int(qid), answer)
+    # As if the debounce interval had passed
+    return get_autosave().flush(username, attempt_no)
+
+
+def op_paper(username, attempt_no):
+    from quiz_app.attempts import attempt_paper, get_attempt
+    from quiz_app.questions import get_question_bank
+    attempt = get_attempt(username, attempt_no)
+    return [(q["id"], q["options"]) for q in attempt_paper(get_question_bank(), attempt)]
+
+
+def op_saved_answers(username, attempt_no):
+    from quiz_app.attempts import get_attempt
+    return {str(qid): answer for qid, answer in get_attempt(username, attempt_no)["answers"].items()}
+
+
+def op_submit(username, attempt_no):
+    from quiz_app.attempts import finalize_attempt
+    outcome = finalize_attempt(username, attempt_no)
+    return None if outcome is None else outcome["result_id"]
+
+
+def op_change_password(username, password):
+    from quiz_app.credentials import change_password
+    return change_password(username, password, limit=2)
+
+
+# Record synthetic webcam frames for a while, then wait until the catalog
+# worker has thumbnailed and published every segment
+def op_record(username, attempt_no, seconds):
+    import av
+    import numpy as np
+    from quiz_app.db import backend, get_db_connection
+    from quiz_app.recording import SegmentRecorder
+    from quiz_app.video_catalog import next_segment_no, segment_closed
+    recorder = SegmentRecorder(username, attempt_no, segment_closed, next_segment_no(username, attempt_no))
+    first = recorder.first_segment
+    image = np.zeros((240, 320, 3), dtype=np.uint8)
+    ends = time.monotonic() + seconds
+    while time.monotonic() < ends:
+        image[:] = int(time.monotonic() * 50) % 255
+        recorder.submit(av.VideoFrame.from_ndarray(image, format="rgb24"))
+        time.sleep(0.05)
+    recorder.stop()
+    # The recorder catalogs its last segment as it finishes
+    recorder._thread.join()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        with get_db_connection() as conn:
+            rows = [(segment_no, thumbnail)
+                    for segment_no, _, _, thumbnail in conn.execute(backend.SEGMENT_LIST, (username, attempt_no))
+                    if segment_no >= first]
+        if rows and all(thumbnail for _, thumbnail in rows):
+            return sorted(segment_no for segment_no, _ in rows)
+        time.sleep(0.2)
+    raise TimeoutError("segments were not cataloged in time")
+
+
+# Everything another replica needs to play the attempt
+def op_play(username, attempt_no):
+    from quiz_app import media
+    from quiz_app.video_catalog import contact_sheet_path, recording_segments
+    segments = recording_segments(username, attempt_no)
+    playable = [segment["segment_no"] for segment in segments
+                if (media.read(segment["path"]) or b"")[4:8] == b"ftyp"]
+    return {"segments": [segment["segment_no"] for segment in segments], "playable": playable,
+            "sheet": media.read(contact_sheet_path(username, attempt_no)) is not None}
+
+
+OPS = {name[3:]: fn for name, fn in globals().items() if name.startswith("op_")}
+
+
+# One replica: its own working directory and recordings, its own connection
+# pool and background workers, all pointed at the shared backend
+def run_replica(index, workdir, inbox, outbox):
+    home = os.path.join(workdir, f"replica{index}")
+    os.makedirs(home, exist_ok=True)
+    os.chdir(home)
+    sys.path.insert(0, REPO_ROOT)
+
+    def handle(call_id, op, args):
+        try:
+            outbox.put((call_id, True, OPS[op](*args)))
+        except Exception as e:
+            outbox.put((call_id, False, f"{type(e).__name__}: {e}"))
+
+    with ThreadPoolExecutor(REPLICA_THREADS) as pool:
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            pool.submit(handle, *message)
+
+
+# ---------------- Coordinator ----------------
+class Replicas:
+    def __init__(self, count, workdir):
+        ctx = multiprocessing.get_context("spawn")
+        self.outbox = ctx.Queue()
+        self.inboxes = [ctx.Queue() for _ in range(count)]
+        self.processes = [ctx.Process(target=run_replica, args=(i, workdir, inbox, self.outbox), daemon=True)
+                          for i, inbox in enumerate(self.inboxes)]
+        for process in self.processes:
+            process.start()
+        self.errors = []
+
+    def __len__(self):
+        return len(self.inboxes)
+
+    # Send every call, then wait for all replies; returns the values in order
+    # (failed calls are recorded and come back as None)
+    def run(self, calls, timeout=300):
+        ids = []
+        for replica, op, *args in calls:
+            call_id = uuid.uuid4().hex
+            ids.append(call_id)
+            self.inboxes[replica % len(self)].put((call_id, op, args))
+        replies = {}
+        while len(replies) < len(ids):
+            call_id, ok, value = self.outbox.get(timeout=timeout)
+            replies[call_id] = (ok, value)
+        values = []
+        for call_id, (replica, op, *args) in zip(ids, calls):
+            ok, value = replies[call_id]
+            if not ok:
+                self.errors.append(f"replica {replica % len(self)} {op}{tuple(args)}: {value}")
+                value = None
+            values.append(value)
+        return values
+
+    def close(self):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+        self.count = 0
+
+    def expect(self, name, ok, detail=""):
+        self.count += 1
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failures.append(name)
+
+
+def latest_otp(email):
+    from quiz_app.db import backend, get_db_connection
+    with get_db_connection() as conn:
+        row = conn.execute(f"SELECT body FROM email_outbox WHERE to_addr = {backend.PARAM} ORDER BY id DESC LIMIT 1",
+                           (email,)).fetchone()
+    return next((token for token in row[0].split() if token.isdigit()), None) if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--students", type=int, default=24)
+    parser.add_argument("--db-url", default=os.environ.get("QUIZ_DB_URL", ""),
+                        help="shared database (default: a temporary SQLite file)")
+    parser.add_argument("--media-store", default="database", choices=["local", "database"])
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="quiz-replicas-")
+    # Mail goes nowhere; OTPs are read from the outbox
+    os.environ.update(QUIZ_DB_URL=args.db_url, QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"),
+                      QUIZ_MEDIA_STORE=args.media_store, QUIZ_SMTP_HOST="127.0.0.1", QUIZ_SMTP_PORT="9",
+                      QUIZ_RECORD_SEGMENT_SECONDS="1", QUIZ_RECORDING_DIR="recordings")
+    sys.path.insert(0, REPO_ROOT)
+    from quiz_app.db import backend, get_db_connection, is_postgres
+
+    run = uuid.uuid4().hex[:6]
+    students = [{"username": f"r{run}-{i:03d}", "email": f"r{run}-{i:03d}@replicas.local", "password": f"pw-{i}",
+                 "usn": f"1RR{i:05d}", "section": "ABC"[i % 3]} for i in range(args.students)]
+    names = [s["username"] for s in students]
+    replicas = Replicas(args.replicas, workdir)
+    n = len(replicas)
+    checks = Checks()
+    phases = {}
+    started = time.perf_counter()
+
+    def phase(name, calls):
+        phase_started = time.perf_counter()
+        values = replicas.run(calls)
+        phases[name] = round(time.perf_counter() - phase_started, 3)
+        return values
+
+    # Every replica at once, for each student
+    def race(op, *per_student):
+        return phase(op + "_race", [(r, op, *args) for args in zip(*per_student) for r in range(n)])
+
+    def by_student(values):
+        return [values[i * n:(i + 1) * n] for i in range(len(students))]
+
+    print(f"{n} replicas, {len(students)} students, "
+          f"{'PostgreSQL' if is_postgres() else 'SQLite'} backend, {args.media_store} media store")
+    try:
+        phase("request_otp", [(i, "request_otp", s["email"], s["username"]) for i, s in enumerate(students)])
+        codes = [latest_otp(s["email"]) for s in students]
+        registered = phase("register", [(i + 1, "register", s["email"], code, s["password"])
+                                        for i, (s, code) in enumerate(zip(students, codes))])
+        checks.expect("OTP issued on one replica verifies on another", registered == names)
+
+        roles = phase("login", [(i + 2, "login", s["username"], s["password"]) for i, s in enumerate(students)])
+        checks.expect("login on a third replica", roles == ["student"] * len(students), str(roles[:3]))
+
+        claims = by_student(race("claim", names, [s["usn"] for s in students],
+                                 [s["section"] for s in students], range(len(students))))
+        checks.expect("concurrent claims open one attempt", all(c == [1] * n for c in claims), str(claims[:3]))
+
+        phase("join", [(i + 3, "join", s["username"], s["section"]) for i, s in enumerate(students)])
+        seen = phase("active", [(r, "active") for r in range(n)])
+        checks.expect("presence is seen by every replica", all(set(names) <= set(v or []) for v in seen))
+
+        papers = phase("paper", [(i, "paper", name, 1) for i, name in enumerate(names)])
+        answers = [{str(qid): options[(i + j) % len(options)] for j, (qid, options) in enumerate(paper)}
+                   for i, paper in enumerate(papers)]
+        halves = [(dict(list(a.items())[::2]), dict(list(a.items())[1::2])) for a in answers]
+        phase("answer", [(i + k, "answer", name, 1, half[k]) for i, (name, half) in enumerate(zip(names, halves))
+                         for k in (0, 1)])
+        saved = phase("saved_answers", [(i + 2, "saved_answers", name, 1) for i, name in enumerate(names)])
+        checks.expect("answers saved on two replicas are seen by a third", saved == answers)
+
+        for attempt_no in (1, 2):
+            if attempt_no == 2:
+                claims = by_student(race("claim", names, [s["usn"] for s in students],
+                                         [s["section"] for s in students], range(len(students))))
+                checks.expect("second attempt opens once", all(c == [2] * n for c in claims), str(claims[:3]))
+            submits = by_student(race("submit", names, [attempt_no] * len(students)))
+            checks.expect(f"attempt {attempt_no} is graded once",
+                          all(sum(v is not None for v in s) == 1 for s in submits), str(submits[:3]))
+
+        claims = by_student(race("claim", names, [s["usn"] for s in students],
+                                 [s["section"] for s in students], range(len(students))))
+        checks.expect("attempt limit holds across replicas", all(c == ["limit"] * n for c in claims), str(claims[:3]))
+
+        changes = by_student(race("change_password", names, [f"new-{run}"] * len(students)))
+        checks.expect("password change limit holds across replicas",
+                      all(sum(bool(v) for v in c) == min(2, n) for c in changes), str(changes[:3]))
+
+        recorded = students[:RECORDED_STUDENTS]
+        first = phase("record", [(i, "record", s["username"], 1, 1.5) for i, s in enumerate(recorded)])
+        second = phase("record_reconnect", [(i + 1, "record", s["username"], 1, 1.5) for i, s in enumerate(recorded)])
+        played = phase("play", [(i + 2, "play", s["username"], 1) for i, s in enumerate(recorded)])
+        ok = all(a and b and p and max(a) < min(b) and p["segments"] == a + b and p["playable"] == a + b and p["sheet"]
+                 for a, b, p in zip(first, second, played))
+        checks.expect("recordings from two replicas play on a third", ok, str(list(zip(first, second, played))[:2]))
+    finally:
+        replicas.close()
+    elapsed = time.perf_counter() - started
+
+    # ---------------- Shared state after the run ----------------
+    placeholders = ", ".join([backend.PARAM] * len(names))
+    with get_db_connection() as conn:
+        attempts = dict(conn.execute(f"SELECT username, attempt_count FROM quiz_attempts WHERE username IN ({placeholders})",
+                                     names).fetchall())
+        sessions = conn.execute(f'''SELECT username, attempt_no, status, result_id FROM quiz_sessions
+                                    WHERE username IN ({placeholders})''', names).fetchall()
+        results = conn.execute(f"SELECT id FROM quiz_results WHERE username IN ({placeholders})", names).fetchall()
+        result_mails = conn.execute(f'''SELECT COUNT(*), COUNT(DISTINCT dedup_key) FROM email_outbox
+                                        WHERE dedup_key LIKE {backend.PARAM}''', (f"quiz-result:r{run}-%",)).fetchone()
+        submissions = conn.execute(f'''SELECT COUNT(*) FROM events WHERE kind = 'submission'
+                                       AND username IN ({placeholders})''', names).fetchone()[0]
+        password_changes = dict(conn.execute(f'''SELECT username, change_count FROM password_changes
+                                                 WHERE username IN ({placeholders})''', names).fetchall())
+        partitions = {(q, s): (c, round(t, 6)) for q, s, c, t in conn.execute(
+            "SELECT quiz_id, section, row_count, score_sum FROM result_partitions").fetchall()}
+        grouped = {(q, s): (c, round(t, 6)) for q, s, c, t in conn.execute(
+            "SELECT quiz_id, section, COUNT(*), SUM(score) FROM quiz_results GROUP BY quiz_id, section").fetchall()}
+    checks.expect("two attempts counted per student", attempts == {name: 2 for name in names}, str(attempts)[:200])
+    checks.expect("every session finished with its own result",
+                  len(sessions) == 2 * len(names) and all(status == "submitted" for _, _, status, _ in sessions)
+                  and len({result_id for *_, result_id in sessions}) == len(sessions))
+    checks.expect("one result per attempt", len(results) == 2 * len(names), f"{len(results)} results")
+    checks.expect("one result email per attempt", tuple(result_mails) == (2 * len(names), 2 * len(names)),
+                  str(result_mails))
+    checks.expect("one submission event per result", submissions == len(results), str(submissions))
+    checks.expect("password changes counted once each", password_changes == {name: min(2, n) for name in names})
+    checks.expect("results catalog matches quiz_results", partitions == grouped,
+                  str(set(partitions.items()) ^ set(grouped.items()))[:200])
+    for error in replicas.errors[:10]:
+        print("error:", error)
+    checks.expect("no replica call failed", not replicas.errors, f"{len(replicas.errors)} errors")
+
+    report = {
+        "replicas": n,
+        "students": len(students),
+        "backend": "postgresql" if is_postgres() else "sqlite",
+        "media_store": args.media_store,
+        "elapsed_seconds": round(elapsed, 2),
+        "phase_seconds": phases,
+        "checks": checks.count,
+        "failures": checks.failures,
+    }
+    print(f"{checks.count - len(checks.failures)}/{checks.count} checks passed in {elapsed:.1f}s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if checks.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Bulk roster import benchmark.
+
+Builds a roster CSV of N students with some bad rows mixed in (invalid or
+missing emails, missing usernames, repeated usernames) and imports it the way
+the Professor Panel does (quiz_app.roster.import_roster on an uploaded file).
+Reports accounts per second overall and in database writes, and checks that:
+
+  - every good row gets an account and one credentials email, delivered to a
+    local SMTP sink
+  - every bad row is reported on its own line with the reason
+  - importing the same roster again creates nothing and reports every row
+  - a student can log in with the emailed password, which is then re-hashed
+    with the current scheme
+  - once delivered, no password is left in the email outbox
+
+    python benchmarks/roster_import.py
+    python benchmarks/roster_import.py --students 10000 --chunk-size 1000
+    python benchmarks/roster_import.py --db-url postgresql://quiz@db-host/quiz_check
+
+Without --db-url (or QUIZ_DB_URL) a temporary SQLite file is used. Usernames
+carry a per-run prefix, so a database that already holds data can be used.
+Needs aiosmtpd (pip install -r benchmarks/requirements.txt).
+"""
+import argparse
+import email
+import email.policy
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# One bad row of each kind every this many rows
+BAD_ROW_EVERY = 50
+DELIVERY_TIMEOUT_SECONDS = 300
+
+
+class MailSink:
+    def __init__(self):
+        self.bodies = {}
+
+    async def handle_DATA(self, server, session, envelope):
+        message = email.message_from_bytes(envelope.content, policy=email.policy.default)
+        self.bodies[message["To"]] = message.get_content()
+        return "250 OK"
+
+
+def build_roster(prefix, students):
+    lines = ["Username,Email,Name,Section"]
+    bad = {}
+    for i in range(students):
+        username = f"{prefix}-{i:05d}"
+        lines.append(f"{username},{username}@Roster.Example.com,Student {i},{'ABC'[i % 3]}")
+        if i % BAD_ROW_EVERY == 0:
+            for reason, row in (("invalid email", f"{prefix}-bad-{i:05d},not-an-email,,A"),
+                                ("missing username", f",{prefix}-{i:05d}-x@roster.example.com,,A"),
+                                ("duplicate", f"{username},{username}-again@roster.example.com,,A")):
+                lines.append(row)
+                bad[len(lines)] = reason
+    return ("\n".join(lines) + "\n").encode(), bad
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+        self.count = 0
+
+    def expect(self, name, ok, detail=""):
+        self.count += 1
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failures.append(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("--db-url", default=os.environ.get("QUIZ_DB_URL", ""),
+                        help="database to import into (default: a temporary SQLite file)")
+    parser.add_argument("--smtp-port", type=int, default=8025)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        sys.exit("aiosmtpd is required: pip install -r benchmarks/requirements.txt")
+
+    workdir = tempfile.mkdtemp(prefix="quiz-roster-")
+    os.environ.update(QUIZ_DB_URL=args.db_url, QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"),
+                      QUIZ_SMTP_HOST="127.0.0.1", QUIZ_SMTP_PORT=str(args.smtp_port), QUIZ_SMTP_STARTTLS="0")
+    sys.path.insert(0, REPO_ROOT)
+    from quiz_app.credentials import authenticate, needs_rehash
+    from quiz_app.db import backend, get_db_connection, init_db, is_postgres
+    from quiz_app.roster import ROSTER_CHUNK_SIZE, import_roster
+
+    init_db()
+    mail = MailSink()
+    smtp = Controller(mail, hostname="127.0.0.1", port=args.smtp_port)
+    smtp.start()
+    prefix = f"r{uuid.uuid4().hex[:6]}"
+    roster, bad = build_roster(prefix, args.students)
+    chunk_size = args.chunk_size or ROSTER_CHUNK_SIZE
+    checks = Checks()
+    print(f"{args.students} students, {len(bad)} bad rows, {'PostgreSQL' if is_postgres() else 'SQLite'} backend, "
+          f"chunks of {chunk_size}")
+
+    report = import_roster(io.BytesIO(roster), chunk_size=chunk_size)
+    names = [f"{prefix}-{i:05d}" for i in range(args.students)]
+    with get_db_connection() as conn:
+        users = dict(conn.execute(f"SELECT username, email FROM users WHERE username LIKE {backend.PARAM} "
+                                  "AND role = 'student'", (f"{prefix}-%",)).fetchall())
+    checks.expect("every good row gets an account", report["created"] == args.students and sorted(users) == names,
+                  f"{report['created']} created")
+    checks.expect("emails are stored normalized",
+                  all(email == f"{name}@roster.example.com" for name, email in users.items()))
+    reported = {error["Line"]: error["Error"] for error in report["errors"]}
+    checks.expect("every bad row is reported on its line", sorted(reported) == sorted(bad),
+                  f"{len(reported)} reported, {len(bad)} expected")
+    reasons = {("invalid email", "@"), ("missing username", "Missing username"), ("duplicate", "Duplicate of line")}
+    checks.expect("bad rows give their reason",
+                  all(any(kind == bad.get(line) and text in reported[line] for kind, text in reasons)
+                      for line in reported))
+
+    again = import_roster(io.BytesIO(roster), chunk_size=chunk_size)
+    existing = [error for error in again["errors"] if error["Error"] == "Username already exists"]
+    checks.expect("a second import creates nothing", again["created"] == 0 and len(existing) == args.students,
+                  f"{again['created']} created, {len(existing)} reported as existing")
+
+    # The outbox worker sends in the background; wait for it to drain
+    deadline = time.monotonic() + DELIVERY_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        with get_db_connection() as conn:
+            outbox = dict(conn.execute(f'''SELECT status, COUNT(*) FROM email_outbox WHERE to_addr LIKE {backend.PARAM}
+                                          GROUP BY status''', (f"{prefix}-%",)).fetchall())
+            kept = conn.execute(f"SELECT COUNT(*) FROM email_outbox WHERE to_addr LIKE {backend.PARAM} "
+                                "AND body IS NOT NULL", (f"{prefix}-%",)).fetchone()[0]
+        if not outbox.get("pending") and not outbox.get("sending"):
+            break
+        time.sleep(0.2)
+    smtp.stop()
+    mails = {to: body for to, body in mail.bodies.items() if to.startswith(prefix + "-")}
+    checks.expect("one credentials email per account", sorted(mails) == sorted(users.values()),
+                  f"{len(mails)} delivered, outbox {outbox}")
+    checks.expect("no password is left in the outbox once sent", kept == 0, f"{kept} bodies kept")
+
+    name = names[-1]
+    body = mails[users[name]]
+    password = re.search(r"^Password: (\S+)", body, re.MULTILINE).group(1)
+    role = authenticate(name, password)
+    with get_db_connection() as conn:
+        stored = conn.execute(backend.USER_LOGIN, (name,)).fetchone()[0]
+    checks.expect("the emailed password logs in", role == "student", str(role))
+    checks.expect("the password is re-hashed on first login", not needs_rehash(stored), stored.split("$")[0])
+
+    result = {
+        "students": args.students,
+        "bad_rows": len(bad),
+        "backend": "postgresql" if is_postgres() else "sqlite",
+        "chunk_size": chunk_size,
+        "total_seconds": round(report["total_seconds"], 3),
+        "db_seconds": round(report["db_seconds"], 3),
+        "accounts_per_second": round(report["created"] / report["total_seconds"]),
+        "db_accounts_per_second": round(report["created"] / report["db_seconds"]),
+        "checks": checks.count,
+        "failures": checks.failures,
+    }
+    print(f"imported in {result['total_seconds']}s: {result['accounts_per_second']} accounts/s overall, "
+          f"{result['db_accounts_per_second']} accounts/s in database writes")
+    print(f"{checks.count - len(checks.failures)}/{checks.count} checks passed")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if checks.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
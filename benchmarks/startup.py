@@ -0,0 +1,173 @@
+"""Cold-start and first-render benchmark, per menu page.
+
+For every page of Student-Quiz.py, in fresh interpreter processes:
+  - import cost of the page's module on top of what the entry script already
+    loaded, from `python -X importtime` (with the slowest modules it pulls in)
+  - time from process start to the page's first render, and the first render
+    itself, with the page opened directly through AppTest
+  - a second render of the same page in the same process (warm)
+
+Medians over --repeat runs are compared against a stored baseline.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --pages Register Login --repeat 5
+    python benchmarks/startup.py --update-baseline
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "Student-Quiz.py")
+BASELINE_FILE = os.path.join(REPO_ROOT, "benchmarks", "startup_baseline.json")
+# Imported by Student-Quiz.py before any page module
+ENTRY_IMPORTS = ["streamlit", "quiz_app.metrics", "quiz_app.startup"]
+MARKER = "--- page import ---"
+METRICS = ["page_import_ms", "process_to_render_ms", "first_render_ms", "warm_render_ms"]
+
+# Runs in the child process: open one page in a fresh AppTest and time it
+RENDER_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.session_state["menu"] = sys.argv[2]
+started = time.perf_counter()
+at.run()
+first = time.perf_counter() - started
+rendered_at = time.time()
+started = time.perf_counter()
+at.run()
+warm = time.perf_counter() - started
+print(json.dumps({"first": first, "warm": warm, "rendered_at": rendered_at,
+                  "errors": [str(e.value) for e in at.exception]}))
+"""
+
+
+# Menu entries and their modules, read from the PAGES dict in the app script
+def read_pages(app_path=APP_PATH):
+    with open(app_path) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "PAGES" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise SystemExit(f"no PAGES dict in {app_path}")
+
+
+# Sum of -X importtime self times after the marker, and the heaviest packages
+# pulled in (largest cumulative time per top-level package, quiz_app excluded)
+def measure_import(module, env):
+    code = "; ".join(f"import {m}" for m in ENTRY_IMPORTS)
+    code += f"; import sys; sys.stderr.write({MARKER!r} + '\\n'); import {module}"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, cwd=REPO_ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+    total = 0
+    packages = {}
+    for line in proc.stderr.split(MARKER + "\n", 1)[1].splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        total += int(self_us)
+        package = name.strip().split(".")[0]
+        if package != "quiz_app":
+            packages[package] = max(packages.get(package, 0), int(cumulative_us))
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return total / 1000, [f"{package} {us / 1000:.0f}ms" for package, us in top]
+
+
+def measure_render(page, env):
+    started = time.time()
+    proc = subprocess.run([sys.executable, "-c", RENDER_SCRIPT, APP_PATH, page], env=env, cwd=env["QUIZ_WORKDIR"],
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f"rendering {page} failed:\n{proc.stderr[-2000:]}")
+    outcome = json.loads(proc.stdout.strip().splitlines()[-1])
+    outcome["process_to_render"] = outcome["rendered_at"] - started
+    return outcome
+
+
+def compare(report, baseline, tolerance):
+    regressions = []
+    for page, stats in report["pages"].items():
+        base = baseline.get("pages", {}).get(page)
+        if not base:
+            continue
+        for metric in METRICS:
+            # Ignore tiny absolute changes
+            if stats[metric] > base[metric] * tolerance and stats[metric] - base[metric] > 50:
+                regressions.append(f"{page}: {metric} {stats[metric]:.0f} ms vs baseline {base[metric]:.0f} ms")
+    return regressions
+
+
+def main():
+    pages = read_pages()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", nargs="+", choices=list(pages), default=list(pages))
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page and measurement")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per page")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed ratio over the baseline")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="quiz-startup-")
+    env = dict(os.environ, QUIZ_WORKDIR=workdir, QUIZ_DB_PATH=os.path.join(workdir, "quiz_app.db"),
+               QUIZ_RECORDING_DIR=os.path.join(workdir, "recordings"),
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+
+    report = {"repeat": args.repeat, "python": sys.version.split()[0], "pages": {}}
+    errors = []
+    for page in args.pages:
+        imports, renders, top = [], [], []
+        for _ in range(args.repeat):
+            import_ms, top = measure_import(pages[page], env)
+            imports.append(import_ms)
+            renders.append(measure_render(page, env))
+            errors.extend(f"{page}: {e}" for e in renders[-1]["errors"])
+        report["pages"][page] = {
+            "page_import_ms": round(statistics.median(imports), 1),
+            "process_to_render_ms": round(statistics.median(r["process_to_render"] for r in renders) * 1000, 1),
+            "first_render_ms": round(statistics.median(r["first"] for r in renders) * 1000, 1),
+            "warm_render_ms": round(statistics.median(r["warm"] for r in renders) * 1000, 1),
+            "slowest_imports": top[:args.top],
+        }
+
+    print(f"{'page':<28}{'import ms':>11}{'start->render':>15}{'first render':>14}{'warm render':>13}")
+    for page, s in report["pages"].items():
+        print(f"{page:<28}{s['page_import_ms']:>11.0f}{s['process_to_render_ms']:>15.0f}"
+              f"{s['first_render_ms']:>14.0f}{s['warm_render_ms']:>13.0f}   {', '.join(s['slowest_imports'])}")
+    for error in errors[:10]:
+        print("error:", error)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            return 1
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
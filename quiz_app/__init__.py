@@ -0,0 +1 @@
+# Storage and service layers shared by the Streamlit app (Student-Quiz.py)
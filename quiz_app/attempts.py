@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+
+from quiz_app import metrics
+from quiz_app.credentials import legacy_hash
+from quiz_app.db import backend, begin_write, get_db_connection
+from quiz_app.grading import PASS_FRACTION, active_scheme, encode_responses, grade_attempt
+from quiz_app.item_analysis import add_responses
+from quiz_app.mailer import queue_email
+from quiz_app.presence import remove_active_student
+from quiz_app.questions import get_question_bank
+from quiz_app.results import RESULTS_LOCK, push_recent, save_quiz_result
+
+QUIZ_TIME_LIMIT_SECONDS = int(os.environ.get("QUIZ_TIME_LIMIT_SECONDS", str(25 * 60)))
+# Answer changes are collected for this long and written in one statement batch
+AUTOSAVE_DEBOUNCE_SECONDS = 1.0
+# How often the sweeper looks for attempts past their deadline
+SWEEP_SECONDS = 15
+# Time after the deadline before the sweeper steps in, so an on-time submit wins
+SWEEP_GRACE_SECONDS = 5
+# Attempts allowed per student
+ATTEMPT_LIMIT = 2
+
+
+# The attempt a query on quiz_sessions found, as a dict, or None
+def _session(cur):
+    row = cur.fetchone()
+    if row is None:
+        return None
+    session = dict(zip([c[0] for c in cur.description], row))
+    session["answers"] = {int(qid): ans for qid, ans in json.loads(session["answers"]).items()}
+    if session["question_ids"] is not None:
+        session["question_ids"] = json.loads(session["question_ids"])
+    return session
+
+
+# The attempt's questions, as drawn when it opened (attempts opened by older
+# versions rebuild them from the seed). Questions removed from the bank since
+# are left out.
+def attempt_paper(bank, attempt):
+    if attempt["question_ids"] is None:
+        return bank.paper(attempt["paper_seed"])
+    return [bank.by_id[qid] for qid in attempt["question_ids"] if qid in bank.by_id]
+
+
+def get_attempt(username, attempt_no):
+    with get_db_connection() as conn:
+        return _session(conn.execute(backend.ATTEMPT_GET, (username, attempt_no)))
+
+
+def get_active_attempt(username):
+    with get_db_connection() as conn:
+        return _session(conn.execute(backend.ATTEMPT_LATEST_ACTIVE, (username,)))
+
+
+# How many of the allowed attempts the student has claimed
+def attempts_used(username):
+    with get_db_connection() as conn:
+        row = conn.execute(backend.ATTEMPT_USED, (username,)).fetchone()
+    return row[0] if row else 0
+
+
+class AttemptLimitReached(Exception):
+    def __init__(self, limit):
+        super().__init__(f"All {limit} attempts have been used")
+        self.limit = limit
+
+
+# Resume the student's active attempt or claim the next attempt slot and open
+# it, in one short write transaction. The slot is taken by a conditional upsert
+# on quiz_attempts, so two tabs starting together cannot both get past the
+# limit; the quiz_sessions row is the attempt's start record and its deadline
+# is fixed here, on the server. Raises AttemptLimitReached when no slot is left.
+def claim_attempt(username, usn, section, paper_seed, limit=ATTEMPT_LIMIT, time_limit=QUIZ_TIME_LIMIT_SECONDS):
+    now = time.time()
+    question_ids = json.dumps(get_question_bank().paper_ids(paper_seed))
+    with metrics.timer("claim_attempt"), get_db_connection() as conn:
+        begin_write(conn, f"user:{username}")
+        active = _session(conn.execute(backend.ATTEMPT_LATEST_ACTIVE, (username,)))
+        if active is not None:
+            conn.rollback()
+            return active
+        claimed = conn.execute(backend.ATTEMPT_CLAIM_SLOT, (username, limit, limit)).fetchone()
+        if claimed is None:
+            conn.rollback()
+            metrics.inc("attempt_limit_reached")
+            raise AttemptLimitReached(limit)
+        conn.execute(backend.ATTEMPT_OPEN,
+                     (username, claimed[0], usn, section, paper_seed, now, now + time_limit, now, question_ids))
+        conn.commit()
+    return get_attempt(username, claimed[0])
+
+
+# Write-behind buffer for answer changes. Each radio change only updates a dict;
+# a background thread writes whatever accumulated every AUTOSAVE_DEBOUNCE_SECONDS,
+# so rapid changes to the same question cost one UPDATE.
+class AutosaveWriter(threading.Thread):
+    def __init__(self):
+        super().__init__(name="answer-autosave", daemon=True)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def put(self, username, attempt_no, qid, answer):
+        with self._lock:
+            self._pending[(username, attempt_no, qid)] = answer
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(AUTOSAVE_DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self._wakeup.set()
+
+    # Write pending answers, all of them or only those of one attempt
+    def flush(self, username=None, attempt_no=None):
+        with self._lock:
+            if username is None:
+                batch, self._pending = self._pending, {}
+            else:
+                batch = {k: v for k, v in self._pending.items() if k[:2] == (username, attempt_no)}
+                for key in batch:
+                    del self._pending[key]
+        if not batch:
+            return 0
+        now = time.time()
+        try:
+            with metrics.timer("autosave_flush"), get_db_connection() as conn:
+                conn.executemany(backend.ATTEMPT_SAVE_ANSWER, [(str(qid), answer, now, user, attempt)
+                                                               for (user, attempt, qid), answer in batch.items()])
+                conn.commit()
+        except Exception:
+            # Put them back (newer changes win) and let the next flush retry
+            with self._lock:
+                for key, answer in batch.items():
+                    self._pending.setdefault(key, answer)
+            raise
+        return len(batch)
+
+
+_autosave = None
+_autosave_lock = threading.Lock()
+
+
+def get_autosave():
+    global _autosave
+    if _autosave is None:
+        with _autosave_lock:
+            if _autosave is None:
+                _autosave = AutosaveWriter()
+                _autosave.start()
+    return _autosave
+
+
+def autosave_answer(username, attempt_no, qid, answer):
+    get_autosave().put(username, attempt_no, qid, answer)
+
+
+# Grade and record an attempt exactly once, whether the student submitted it or
+# the sweeper found it past its deadline. answers defaults to what was autosaved;
+# missing answers count as unanswered. Returns None if the attempt was already
+# finalized (by another tab, process or the sweeper).
+def finalize_attempt(username, attempt_no, answers=None, status="submitted"):
+    if _autosave is not None:
+        _autosave.flush(username, attempt_no)
+    bank = get_question_bank()
+    now = time.time()
+    with get_db_connection() as conn:
+        begin_write(conn, f"user:{username}", shared=(RESULTS_LOCK,))
+        session = _session(conn.execute(backend.ATTEMPT_GET_ACTIVE, (username, attempt_no)))
+        if session is None:
+            conn.rollback()
+            return None
+        paper = attempt_paper(bank, session)
+        saved = session["answers"] if answers is None else answers
+        responses = encode_responses(bank, {q["id"]: saved.get(q["id"]) if saved.get(q["id"]) in q["options"] else None
+                                            for q in paper})
+        # Read holding RESULTS_LOCK, so the last step of a re-grade that
+        # changes the scheme either sees this result or is seen by it
+        score = grade_attempt(bank, *responses, scheme=active_scheme(conn))
+        time_taken = round(min(now, session["deadline"]) - session["started_at"], 2)
+        result_id, recent = save_quiz_result(username, legacy_hash(username), session["usn"], session["section"], score,
+                                     time_taken, passed=score >= len(paper) * PASS_FRACTION,
+                                     paper_seed=session["paper_seed"], responses=responses, conn=conn,
+                                     quiz_id=bank.quiz_id)
+        add_responses(conn, bank, session["section"], *responses)
+        # The finish record; the attempt slot was already claimed when it started
+        conn.execute(backend.ATTEMPT_FINISH,
+                     (status, result_id, json.dumps({str(k): v for k, v in saved.items()}), now, now,
+                      username, attempt_no))
+        if not session["slot_claimed"]:
+            # Opened before slots were claimed at start, so count it now
+            conn.execute(backend.ATTEMPT_COUNT, (username,))
+        email_record = conn.execute(backend.USER_EMAIL, (username,)).fetchone()
+        conn.commit()
+    # Committed, so the submission can go on the front of the recent-results buffer
+    push_recent(recent)
+
+    remove_active_student(username)
+    # One result email per attempt (sent in the background)
+    if email_record and email_record[0]:
+        queue_email(email_record[0], "Your Secure Quiz Result",
+                    f"Dear {username},\n\nYou have successfully submitted your quiz.\nScore: {score}/{len(paper)}\nTime Taken: {time_taken} seconds\n\nThank you for participating.",
+                    dedup_key=f"quiz-result:{username}:{attempt_no}")
+    return {"result_id": result_id, "score": score, "total": len(paper), "time_taken": time_taken}
+
+
+def finalize_expired_attempts(grace=SWEEP_GRACE_SECONDS):
+    with get_db_connection() as conn:
+        due = conn.execute(backend.ATTEMPT_DUE, (time.time() - grace,)).fetchall()
+    finalized = 0
+    for username, attempt_no in due:
+        if finalize_attempt(username, attempt_no, status="expired") is not None:
+            finalized += 1
+    return finalized
+
+
+class AttemptSweeper(threading.Thread):
+    def __init__(self):
+        super().__init__(name="attempt-sweeper", daemon=True)
+
+    def run(self):
+        while True:
+            try:
+                with metrics.timer("attempt_sweep"):
+                    finalize_expired_attempts()
+            except Exception:
+                pass
+            time.sleep(SWEEP_SECONDS)
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+# One sweeper per process; finalize_attempt re-checks the status under a write
+# lock, so sweepers in different processes never grade the same attempt twice
+def start_attempt_sweeper():
+    global _sweeper
+    if _sweeper is None or not _sweeper.is_alive():
+        with _sweeper_lock:
+            if _sweeper is None or not _sweeper.is_alive():
+                _sweeper = AttemptSweeper()
+                _sweeper.start()
+    return _sweeper
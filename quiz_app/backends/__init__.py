@@ -0,0 +1,16 @@
+# Storage backends for quiz_app.db, which picks one from QUIZ_DB_URL:
+#   sqlite   - a local database file (the default)
+#   postgres - a PostgreSQL server shared by several app replicas
+# Each module provides the same names, and the stores reach the database only
+# through them:
+#   connect(location, timeout_ms)    - a new connection (a file path or a URL)
+#   init_schema(conn)                - create or upgrade the tables; safe to run
+#                                      from several processes at once
+#   begin_write(conn, keys, shared)  - see quiz_app.db.begin_write
+#   begin_snapshot(conn)             - make the transaction read from one snapshot
+#   stage_scores(conn, rows)         - bulk insert into a re-grade's staging table
+#   Error, IntegrityError, OperationalError - the driver's exception classes
+#   PARAM                            - the driver's placeholder
+# and one constant per statement the stores run, written in the backend's own
+# SQL dialect and grouped by store (USER_, ATTEMPT_, RESULT_, PRESENCE_,
+# MEDIA_, ...). A new statement goes in both modules.
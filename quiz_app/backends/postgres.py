@@ -0,0 +1,538 @@
+import hashlib
+
+import psycopg
+from psycopg import pq
+from psycopg.adapt import Loader
+
+# PostgreSQL backend, used when QUIZ_DB_URL is a postgresql:// URL so several
+# app replicas can share one database. Needs the psycopg driver
+# (requirements-postgres.txt).
+# Where a store reads, then writes on what it read, it starts with
+# quiz_app.db.begin_write and names what it reads (a user, an email); here that
+# takes transaction-scoped advisory locks on those keys, so only writers of the
+# same key wait for each other. Other writes are single statements or upserts
+# and rely on PostgreSQL's row locks. Reads never wait.
+# Every begin_write also holds WRITE_LOCK_KEY shared; setting up the schema
+# takes it exclusively and so waits for all of them.
+WRITE_LOCK_KEY = 0x5155495A
+
+Error = psycopg.Error
+IntegrityError = psycopg.IntegrityError
+# Includes lock_timeout expiring (LockNotAvailable) and lost connections
+OperationalError = psycopg.OperationalError
+
+# Placeholder for statements whose clauses are built at run time
+PARAM = "%s"
+
+# The tables of quiz_app.backends.sqlite, with PostgreSQL types: SQLite INTEGER
+# is 64-bit and REAL a double. Scores are a double here: they keep fractions
+# under negative and partial marking.
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users (
+           id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+           username TEXT UNIQUE,
+           password TEXT,
+           role TEXT DEFAULT 'student',
+           email TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS password_changes (
+           username TEXT PRIMARY KEY,
+           change_count BIGINT DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS quiz_attempts (
+           username TEXT PRIMARY KEY,
+           attempt_count BIGINT DEFAULT 0)''',
+
+    '''CREATE TABLE IF NOT EXISTS quiz_results (
+           id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+           username TEXT,
+           hashed_password TEXT,
+           usn TEXT,
+           section TEXT,
+           score DOUBLE PRECISION,
+           time_taken DOUBLE PRECISION,
+           timestamp TEXT,
+           passed BIGINT,
+           paper_seed BIGINT,
+           quiz_id TEXT DEFAULT 'legacy')''',
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_section ON quiz_results (section)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_timestamp ON quiz_results (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_section_score ON quiz_results (section, score)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_score ON quiz_results (score)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_time_taken ON quiz_results (time_taken)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_usn ON quiz_results (usn)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_partition ON quiz_results (quiz_id, section, score)",
+
+    '''CREATE TABLE IF NOT EXISTS email_outbox (
+           id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+           dedup_key TEXT UNIQUE,
+           to_addr TEXT,
+           subject TEXT,
+           body TEXT,
+           status TEXT DEFAULT 'pending',
+           attempts BIGINT DEFAULT 0,
+           next_attempt_at DOUBLE PRECISION,
+           last_error TEXT,
+           claim_token TEXT,
+           claimed_at DOUBLE PRECISION,
+           created_at DOUBLE PRECISION,
+           sent_at DOUBLE PRECISION,
+           expires_at DOUBLE PRECISION)''',
+    "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_email_outbox_claim ON email_outbox (claim_token)",
+
+    '''CREATE TABLE IF NOT EXISTS active_students (
+           username TEXT PRIMARY KEY,
+           section TEXT,
+           joined_at DOUBLE PRECISION,
+           last_seen DOUBLE PRECISION)''',
+    "CREATE INDEX IF NOT EXISTS idx_active_students_last_seen ON active_students (last_seen)",
+
+    '''CREATE TABLE IF NOT EXISTS quiz_responses (
+           result_id BIGINT PRIMARY KEY,
+           question_ids BYTEA,
+           choices BYTEA)''',
+
+    '''CREATE TABLE IF NOT EXISTS proctor_events (
+           id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+           username TEXT,
+           attempt_no BIGINT,
+           kind TEXT,
+           detail TEXT,
+           created_at DOUBLE PRECISION)''',
+    "CREATE INDEX IF NOT EXISTS idx_proctor_events_created ON proctor_events (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_proctor_events_user ON proctor_events (username, attempt_no)",
+
+    '''CREATE TABLE IF NOT EXISTS events (
+           id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+           kind TEXT,
+           username TEXT,
+           section TEXT,
+           payload TEXT,
+           created_at DOUBLE PRECISION)''',
+    "CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at)",
+
+    '''CREATE TABLE IF NOT EXISTS quiz_sessions (
+           username TEXT,
+           attempt_no BIGINT,
+           usn TEXT,
+           section TEXT,
+           paper_seed BIGINT,
+           started_at DOUBLE PRECISION,
+           deadline DOUBLE PRECISION,
+           answers TEXT DEFAULT '{}',
+           status TEXT DEFAULT 'active',
+           updated_at DOUBLE PRECISION,
+           result_id BIGINT,
+           finished_at DOUBLE PRECISION,
+           slot_claimed BIGINT DEFAULT 0,
+           question_ids TEXT,
+           PRIMARY KEY (username, attempt_no))''',
+    "CREATE INDEX IF NOT EXISTS idx_quiz_sessions_due ON quiz_sessions (status, deadline)",
+
+    '''CREATE TABLE IF NOT EXISTS result_partitions (
+           quiz_id TEXT,
+           section TEXT,
+           row_count BIGINT DEFAULT 0,
+           score_sum DOUBLE PRECISION DEFAULT 0,
+           pass_count BIGINT DEFAULT 0,
+           time_sum DOUBLE PRECISION DEFAULT 0,
+           min_score DOUBLE PRECISION,
+           max_score DOUBLE PRECISION,
+           min_timestamp TEXT,
+           max_timestamp TEXT,
+           PRIMARY KEY (quiz_id, section))''',
+
+    '''CREATE TABLE IF NOT EXISTS item_stats (
+           quiz_id TEXT,
+           section TEXT,
+           question_id BIGINT,
+           responses BIGINT DEFAULT 0,
+           correct BIGINT DEFAULT 0,
+           total_sum BIGINT DEFAULT 0,
+           total_sq_sum BIGINT DEFAULT 0,
+           correct_total_sum BIGINT DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, question_id))''',
+    '''CREATE TABLE IF NOT EXISTS item_choices (
+           quiz_id TEXT,
+           section TEXT,
+           question_id BIGINT,
+           choice BIGINT,
+           picks BIGINT DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, question_id, choice))''',
+    '''CREATE TABLE IF NOT EXISTS paper_stats (
+           quiz_id TEXT,
+           section TEXT,
+           paper_length BIGINT,
+           papers BIGINT DEFAULT 0,
+           total_sum BIGINT DEFAULT 0,
+           total_sq_sum BIGINT DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, paper_length))''',
+
+    '''CREATE TABLE IF NOT EXISTS otp_codes (
+           purpose TEXT,
+           email TEXT,
+           code_hash TEXT,
+           payload TEXT,
+           expires_at DOUBLE PRECISION,
+           attempts BIGINT DEFAULT 0,
+           sends BIGINT DEFAULT 0,
+           window_start DOUBLE PRECISION,
+           last_sent_at DOUBLE PRECISION,
+           PRIMARY KEY (purpose, email))''',
+    "CREATE INDEX IF NOT EXISTS idx_otp_codes_last_sent ON otp_codes (last_sent_at)",
+
+    '''CREATE TABLE IF NOT EXISTS recording_segments (
+           path TEXT PRIMARY KEY,
+           username TEXT,
+           attempt_no BIGINT,
+           segment_no BIGINT,
+           duration DOUBLE PRECISION,
+           size_bytes BIGINT,
+           thumbnail TEXT,
+           created_at DOUBLE PRECISION)''',
+    "CREATE INDEX IF NOT EXISTS idx_recording_segments_attempt ON recording_segments (username, attempt_no, segment_no)",
+
+    '''CREATE TABLE IF NOT EXISTS media_objects (
+           path TEXT PRIMARY KEY,
+           data BYTEA,
+           size_bytes BIGINT,
+           created_at DOUBLE PRECISION)''',
+
+    '''CREATE TABLE IF NOT EXISTS app_meta (
+           key TEXT PRIMARY KEY,
+           value TEXT)''',
+    # Columns added later go here as ALTER TABLE ... ADD COLUMN IF NOT EXISTS
+]
+
+
+# numeric results (SUM over BIGINT, AVG) come back as int or float, as they
+# do from SQLite, not Decimal
+class _NumericLoader(Loader):
+    def load(self, data):
+        text = bytes(data).decode()
+        try:
+            return int(text)
+        except ValueError:
+            return float(text)
+
+
+# A psycopg connection with what quiz_app.db's pool and the stores use on
+# sqlite3 connections: in_transaction and executemany. Not in autocommit mode:
+# the first statement opens a transaction, which lasts until commit or
+# rollback (the pool rolls back whatever a borrower left open).
+class Connection(psycopg.Connection):
+    @property
+    def in_transaction(self):
+        return self.info.transaction_status != pq.TransactionStatus.IDLE
+
+    def executemany(self, sql, params_seq):
+        cursor = self.cursor()
+        cursor.executemany(sql, params_seq)
+        return cursor
+
+
+# timeout_ms plays the part of SQLite's busy_timeout: how long a statement
+# waits for a lock
+def connect(url, timeout_ms):
+    conn = Connection.connect(url, options=f"-c lock_timeout={timeout_ms}")
+    conn.adapters.register_loader("numeric", _NumericLoader)
+    return conn
+
+
+# Replicas starting together would race on CREATE TABLE IF NOT EXISTS, so
+# this runs with every writer held off
+def init_schema(conn):
+    conn.execute("SELECT pg_advisory_xact_lock(%s)", (WRITE_LOCK_KEY,))
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+# Advisory lock id for a begin_write key
+def lock_id(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+# Take advisory locks for the current transaction: exclusive on keys, shared on
+# shared (held by any number of transactions at once). One statement takes
+# them all in lock id order, so writers naming several keys never wait on
+# each other in a cycle.
+def begin_write(conn, keys=(), shared=()):
+    modes = {lock_id(key): False for key in shared}
+    modes.update((lock_id(key), True) for key in keys)
+    ids = sorted(modes)
+    conn.execute("SELECT CASE WHEN l.exclusive THEN pg_advisory_xact_lock(l.id) "
+                 "ELSE pg_advisory_xact_lock_shared(l.id) END "
+                 "FROM unnest(%s::bigint[], %s::boolean[]) WITH ORDINALITY AS l(id, exclusive, n) "
+                 "ORDER BY l.n",
+                 ([WRITE_LOCK_KEY] + ids, [False] + [modes[i] for i in ids]))
+
+
+# Must come first in its transaction (SET TRANSACTION does)
+def begin_snapshot(conn):
+    conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+
+# Fill the connection's regrade_scores table with (score, passed, id) rows:
+# one statement taking them as arrays, not a round trip per row. The planner
+# needs the table's statistics to join on it by id.
+def stage_scores(conn, rows):
+    if not rows:
+        return
+    conn.execute('''INSERT INTO regrade_scores (score, passed, id)
+                    SELECT * FROM unnest(%s::float8[], %s::bigint[], %s::bigint[])''',
+                 [list(column) for column in zip(*rows)])
+    conn.execute("ANALYZE regrade_scores")
+
+
+# Statements run by the stores, grouped by store, as in
+# quiz_app.backends.sqlite. Aliases that name DataFrame columns are quoted:
+# unquoted ones are folded to lower case.
+
+# Users and credentials
+USER_LOGIN = "SELECT password, role FROM users WHERE username = %s"
+USER_EMAIL = "SELECT email FROM users WHERE username = %s"
+USER_BY_EMAIL = "SELECT username FROM users WHERE email = %s"
+USER_ADD = "INSERT INTO users (username, password, role, email) VALUES (%s, %s, %s, %s)"
+USER_ADD_NEW = USER_ADD + " ON CONFLICT (username) DO NOTHING"
+USER_TAKEN = "SELECT username FROM users WHERE username IN ({placeholders})"
+USER_REHASH = "UPDATE users SET password = %s WHERE username = %s AND password = %s"
+USER_SET_PASSWORD = "UPDATE users SET password = %s WHERE username = %s"
+USER_COUNT_PASSWORD_CHANGE = '''INSERT INTO password_changes (username, change_count) VALUES (%s, 1)
+                                ON CONFLICT (username) DO UPDATE SET change_count = password_changes.change_count + 1'''
+USER_COUNT_PASSWORD_CHANGE_UNDER = (USER_COUNT_PASSWORD_CHANGE
+                                    + " WHERE password_changes.change_count < %s RETURNING change_count")
+
+# Attempts
+_ATTEMPT = '''SELECT username, attempt_no, usn, section, paper_seed, started_at, deadline, answers, status, result_id,
+                     finished_at, slot_claimed, question_ids
+              FROM quiz_sessions'''
+ATTEMPT_GET = _ATTEMPT + " WHERE username = %s AND attempt_no = %s"
+ATTEMPT_GET_ACTIVE = _ATTEMPT + " WHERE username = %s AND attempt_no = %s AND status = 'active'"
+ATTEMPT_LATEST_ACTIVE = _ATTEMPT + " WHERE username = %s AND status = 'active' ORDER BY attempt_no DESC LIMIT 1"
+ATTEMPT_USED = "SELECT attempt_count FROM quiz_attempts WHERE username = %s"
+ATTEMPT_CLAIM_SLOT = '''INSERT INTO quiz_attempts (username, attempt_count) SELECT %s, 1 WHERE %s > 0
+                        ON CONFLICT (username) DO UPDATE SET attempt_count = quiz_attempts.attempt_count + 1
+                        WHERE quiz_attempts.attempt_count < %s
+                        RETURNING attempt_count'''
+ATTEMPT_COUNT = '''INSERT INTO quiz_attempts (username, attempt_count) VALUES (%s, 1)
+                   ON CONFLICT (username) DO UPDATE SET attempt_count = quiz_attempts.attempt_count + 1'''
+ATTEMPT_OPEN = '''INSERT INTO quiz_sessions (username, attempt_no, usn, section, paper_seed, started_at, deadline,
+                                             updated_at, slot_claimed, question_ids)
+                  VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 1, %s)
+                  ON CONFLICT (username, attempt_no) DO NOTHING'''
+# jsonb_set drops the whole document when given SQL NULL, hence the JSON null
+ATTEMPT_SAVE_ANSWER = '''UPDATE quiz_sessions
+                         SET answers = jsonb_set(COALESCE(answers, '{}')::jsonb, ARRAY[%s::text],
+                                                 COALESCE(to_jsonb(%s::text), 'null'::jsonb))::text,
+                             updated_at = %s
+                         WHERE username = %s AND attempt_no = %s AND status = 'active' '''
+ATTEMPT_FINISH = '''UPDATE quiz_sessions SET status = %s, result_id = %s, answers = %s, updated_at = %s, finished_at = %s
+                    WHERE username = %s AND attempt_no = %s'''
+ATTEMPT_DUE = "SELECT username, attempt_no FROM quiz_sessions WHERE status = 'active' AND deadline < %s"
+
+# Results, their partition catalog and counters
+META_GET = "SELECT value FROM app_meta WHERE key = %s"
+META_ADD = "INSERT INTO app_meta (key, value) VALUES (%s, %s)"
+META_SET = '''INSERT INTO app_meta (key, value) VALUES (%s, %s)
+              ON CONFLICT (key) DO UPDATE SET value = excluded.value'''
+META_BUMP = '''INSERT INTO app_meta (key, value) VALUES (%s, '1')
+               ON CONFLICT (key) DO UPDATE SET value = (CAST(app_meta.value AS BIGINT) + 1)::text
+               RETURNING value'''
+
+RESULT_ADD = '''INSERT INTO quiz_results
+                    (username, hashed_password, usn, section, score, time_taken, timestamp, passed, paper_seed,
+                     quiz_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
+RESULT_ADD_RETURNING_ID = RESULT_ADD + " RETURNING id"
+RESULT_ADD_RESPONSES = "INSERT INTO quiz_responses (result_id, question_ids, choices) VALUES (%s, %s, %s)"
+# LEAST and GREATEST skip NULLs, like the aggregates a rebuild takes
+RESULT_ADD_TO_PARTITION = '''INSERT INTO result_partitions (quiz_id, section, row_count, score_sum, pass_count,
+                                                            time_sum, min_score, max_score, min_timestamp,
+                                                            max_timestamp)
+                             VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s, %s)
+                             ON CONFLICT (quiz_id, section) DO UPDATE SET
+                                 row_count = result_partitions.row_count + 1,
+                                 score_sum = result_partitions.score_sum + excluded.score_sum,
+                                 pass_count = result_partitions.pass_count + excluded.pass_count,
+                                 time_sum = result_partitions.time_sum + excluded.time_sum,
+                                 min_score = LEAST(result_partitions.min_score, excluded.min_score),
+                                 max_score = GREATEST(result_partitions.max_score, excluded.max_score),
+                                 min_timestamp = LEAST(result_partitions.min_timestamp, excluded.min_timestamp),
+                                 max_timestamp = GREATEST(result_partitions.max_timestamp, excluded.max_timestamp)'''
+RESULT_FILL_PASSED = "UPDATE quiz_results SET passed = CASE WHEN score >= %s THEN 1 ELSE 0 END WHERE passed IS NULL"
+RESULT_STATS = '''SELECT COALESCE(SUM(row_count), 0), COALESCE(SUM(score_sum), 0), COALESCE(SUM(pass_count), 0),
+                         COALESCE(SUM(time_sum), 0), MIN(min_score), MAX(max_score)
+                  FROM result_partitions{where}'''
+RESULT_DELETE_PARTITIONS = "DELETE FROM result_partitions{where}"
+RESULT_BUILD_PARTITIONS = '''INSERT INTO result_partitions (quiz_id, section, row_count, score_sum, pass_count,
+                                                            time_sum, min_score, max_score, min_timestamp,
+                                                            max_timestamp)
+                             SELECT quiz_id, section, COUNT(*), SUM(score), SUM(passed), SUM(time_taken),
+                                    MIN(score), MAX(score), MIN(timestamp), MAX(timestamp)
+                             FROM quiz_results{where}
+                             GROUP BY quiz_id, section'''
+RESULT_QUIZZES = "SELECT DISTINCT quiz_id FROM result_partitions ORDER BY quiz_id"
+RESULT_SECTIONS = "SELECT DISTINCT section FROM result_partitions{where} ORDER BY section"
+RESULT_PARTITIONS = '''SELECT quiz_id AS "Quiz", section AS "Section", row_count AS "Rows",
+                              min_score AS "Min_Score", max_score AS "Max_Score", min_timestamp AS "First_Result",
+                              max_timestamp AS "Last_Result"
+                       FROM result_partitions{where}
+                       ORDER BY quiz_id, section'''
+RESULT_ANY_PARTITION = "SELECT 1 FROM result_partitions{where} LIMIT 1"
+_RESULTS = '''SELECT username AS "Username", hashed_password AS "Hashed_Password", usn AS "USN",
+                     section AS "Section", score AS "Score", time_taken AS "Time_Taken", timestamp AS "Timestamp"
+              FROM quiz_results'''
+RESULT_ALL = _RESULTS + " ORDER BY id"
+RESULT_SECTION = _RESULTS + " WHERE section = %s ORDER BY id"
+RESULT_LATEST = _RESULTS + " ORDER BY timestamp DESC LIMIT %s"
+RESULT_SINCE = _RESULTS + " WHERE timestamp > %s ORDER BY timestamp"
+RESULT_SINCE_LIMIT = RESULT_SINCE + " LIMIT %s"
+RESULT_FILTERED = _RESULTS + "{where}{order}"
+RESULT_PAGE = RESULT_FILTERED + " LIMIT %s OFFSET %s"
+RESULT_COUNT = "SELECT COUNT(*) FROM quiz_results{where}"
+RESULT_ROWS_AFTER = '''SELECT id, quiz_id, section, score, time_taken, timestamp, passed
+                       FROM quiz_results WHERE id > %s ORDER BY id'''
+RESULT_LAST_ID = "SELECT COALESCE(MAX(id), 0) FROM quiz_results"
+RESULT_RESPONSES = '''SELECT r.result_id, r.question_ids, r.choices, q.score, q.passed, q.section
+                      FROM quiz_responses r JOIN quiz_results q ON q.id = r.result_id
+                      WHERE r.result_id > %s AND r.result_id <= %s AND q.quiz_id = %s
+                      ORDER BY r.result_id'''
+RESULT_SET_SCORE = "UPDATE quiz_results SET score = %s, passed = %s WHERE id = %s"
+# Private to the session, so filling it takes no lock
+REGRADE_CREATE_STAGE = '''CREATE TEMP TABLE IF NOT EXISTS regrade_scores
+                              (id BIGINT PRIMARY KEY, score DOUBLE PRECISION, passed BIGINT)'''
+REGRADE_CLEAR_STAGE = "DELETE FROM regrade_scores"
+REGRADE_APPLY_STAGE = '''UPDATE quiz_results SET score = s.score, passed = s.passed FROM regrade_scores s
+                         WHERE quiz_results.id = s.id AND s.id BETWEEN %s AND %s
+                           AND quiz_results.id BETWEEN %s AND %s'''
+
+# Item analysis sums
+ITEM_ADD = '''INSERT INTO item_stats (quiz_id, section, question_id, responses, correct, total_sum, total_sq_sum,
+                                      correct_total_sum)
+              VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+              ON CONFLICT (quiz_id, section, question_id) DO UPDATE SET
+                  responses = item_stats.responses + excluded.responses,
+                  correct = item_stats.correct + excluded.correct,
+                  total_sum = item_stats.total_sum + excluded.total_sum,
+                  total_sq_sum = item_stats.total_sq_sum + excluded.total_sq_sum,
+                  correct_total_sum = item_stats.correct_total_sum + excluded.correct_total_sum'''
+ITEM_ADD_CHOICE = '''INSERT INTO item_choices (quiz_id, section, question_id, choice, picks)
+                     VALUES (%s, %s, %s, %s, %s)
+                     ON CONFLICT (quiz_id, section, question_id, choice) DO UPDATE SET
+                         picks = item_choices.picks + excluded.picks'''
+ITEM_ADD_PAPER = '''INSERT INTO paper_stats (quiz_id, section, paper_length, papers, total_sum, total_sq_sum)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (quiz_id, section, paper_length) DO UPDATE SET
+                        papers = paper_stats.papers + excluded.papers,
+                        total_sum = paper_stats.total_sum + excluded.total_sum,
+                        total_sq_sum = paper_stats.total_sq_sum + excluded.total_sq_sum'''
+ITEM_DELETE = [
+    "DELETE FROM item_stats WHERE quiz_id = %s",
+    "DELETE FROM item_choices WHERE quiz_id = %s",
+    "DELETE FROM paper_stats WHERE quiz_id = %s",
+]
+ITEM_RESPONSES = '''SELECT q.section, r.question_ids, r.choices
+                    FROM quiz_responses r JOIN quiz_results q ON q.id = r.result_id
+                    WHERE q.quiz_id = %s'''
+ITEM_SUMS = '''SELECT question_id, SUM(responses) AS responses, SUM(correct) AS correct, SUM(total_sum) AS total_sum,
+                      SUM(total_sq_sum) AS total_sq_sum, SUM(correct_total_sum) AS correct_total_sum
+               FROM item_stats{where}
+               GROUP BY question_id ORDER BY question_id'''
+ITEM_PICKS = '''SELECT question_id, choice, SUM(picks) AS picks FROM item_choices{where}
+                GROUP BY question_id, choice ORDER BY question_id, choice'''
+ITEM_PAPERS = '''SELECT paper_length, SUM(papers), SUM(total_sum), SUM(total_sq_sum) FROM paper_stats{where}
+                 GROUP BY paper_length ORDER BY SUM(papers) DESC, paper_length LIMIT 1'''
+
+# Presence, monitoring feed and proctoring flags
+PRESENCE_JOIN = '''INSERT INTO active_students (username, section, joined_at, last_seen)
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (username) DO UPDATE SET section = excluded.section, last_seen = excluded.last_seen'''
+PRESENCE_HEARTBEAT = "UPDATE active_students SET last_seen = %s WHERE username = %s"
+PRESENCE_LEAVE = "DELETE FROM active_students WHERE username = %s"
+PRESENCE_STALE = "SELECT username FROM active_students WHERE last_seen < %s"
+PRESENCE_EXPIRE = "DELETE FROM active_students WHERE last_seen < %s"
+PRESENCE_LIVE = "SELECT username, section FROM active_students ORDER BY joined_at"
+PRESENCE_SECTION_COUNTS = "SELECT section, COUNT(*) FROM active_students GROUP BY section ORDER BY section"
+
+EVENT_ADD = '''INSERT INTO events (kind, username, section, payload, created_at) VALUES (%s, %s, %s, %s, %s)
+               RETURNING id'''
+EVENT_PRUNE = "DELETE FROM events WHERE created_at < %s"
+EVENT_LATEST_ID = "SELECT MAX(id) FROM events"
+EVENT_SINCE = '''SELECT id, kind, username, section, payload, created_at FROM events
+                 WHERE id > %s ORDER BY id LIMIT %s'''
+
+FLAG_ADD = "INSERT INTO proctor_events (username, attempt_no, kind, detail, created_at) VALUES (%s, %s, %s, %s, %s)"
+FLAG_RECENT = '''SELECT username, attempt_no, kind, detail, created_at FROM proctor_events
+                 ORDER BY id DESC LIMIT %s'''
+FLAG_COUNTS = '''SELECT username, COUNT(*) FROM proctor_events WHERE created_at >= %s
+                 GROUP BY username ORDER BY COUNT(*) DESC'''
+
+# Media and the recordings catalog
+MEDIA_PUT = '''INSERT INTO media_objects (path, data, size_bytes, created_at) VALUES (%s, %s, %s, %s)
+               ON CONFLICT (path) DO UPDATE SET data = excluded.data, size_bytes = excluded.size_bytes,
+                                                created_at = excluded.created_at'''
+MEDIA_GET = "SELECT data FROM media_objects WHERE path = %s"
+MEDIA_PATHS = "SELECT path FROM media_objects"
+
+SEGMENT_ADD = '''INSERT INTO recording_segments (path, username, attempt_no, segment_no, duration, size_bytes,
+                                                 created_at)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s)
+                 ON CONFLICT (path) DO UPDATE SET duration = excluded.duration, size_bytes = excluded.size_bytes,
+                                                  thumbnail = NULL'''
+SEGMENT_SET_THUMBNAIL = "UPDATE recording_segments SET thumbnail = %s WHERE path = %s"
+SEGMENT_DELETE = "DELETE FROM recording_segments WHERE path = %s"
+SEGMENT_THUMBNAILS = '''SELECT path, thumbnail FROM recording_segments'''
+SEGMENT_NO_THUMBNAIL = '''SELECT path, username, attempt_no, duration FROM recording_segments
+                          WHERE thumbnail IS NULL'''
+SEGMENT_LIST = '''SELECT segment_no, path, duration, thumbnail FROM recording_segments
+                  WHERE username = %s AND attempt_no = %s ORDER BY segment_no'''
+SEGMENT_LAST_NO = "SELECT MAX(segment_no) FROM recording_segments WHERE username = %s AND attempt_no = %s"
+SEGMENT_RECORDINGS = '''SELECT s.username AS "Student", s.attempt_no AS "Attempt", COUNT(*) AS "Segments",
+                               SUM(s.duration) AS "Duration_Seconds", SUM(s.size_bytes) AS "Size_MB",
+                               (SELECT COUNT(*) FROM proctor_events e
+                                WHERE e.username = s.username AND e.attempt_no = s.attempt_no) AS "Flags",
+                               MAX(s.created_at) AS "Recorded"
+                        FROM recording_segments s
+                        GROUP BY s.username, s.attempt_no
+                        ORDER BY MAX(s.created_at) DESC'''
+
+# Email outbox
+MAIL_QUEUE = '''INSERT INTO email_outbox (dedup_key, to_addr, subject, body, next_attempt_at, created_at, expires_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (dedup_key) DO NOTHING'''
+MAIL_RECLAIM = '''UPDATE email_outbox SET status = 'pending', claim_token = NULL
+                  WHERE status = 'sending' AND claimed_at < %s'''
+MAIL_EXPIRE = '''UPDATE email_outbox SET status = 'failed', body = NULL, last_error = 'expired'
+                 WHERE status = 'pending' AND expires_at < %s'''
+MAIL_CLAIM = '''UPDATE email_outbox SET status = 'sending', claim_token = %s, claimed_at = %s
+                WHERE id IN (SELECT id FROM email_outbox
+                             WHERE status = 'pending' AND next_attempt_at <= %s
+                             ORDER BY id LIMIT %s)'''
+MAIL_CLAIMED = "SELECT id, to_addr, subject, body, attempts FROM email_outbox WHERE claim_token = %s ORDER BY id"
+MAIL_SENT = '''UPDATE email_outbox SET status = 'sent', sent_at = %s, claim_token = NULL, body = NULL
+               WHERE id = %s'''
+MAIL_RELEASE = '''UPDATE email_outbox SET status = 'pending', claim_token = NULL
+                  WHERE id = %s AND status = 'sending' '''
+MAIL_RETRY = '''UPDATE email_outbox
+                SET status = %s, attempts = %s, next_attempt_at = %s, last_error = %s, claim_token = NULL
+                WHERE id = %s'''
+MAIL_BLANK = "UPDATE email_outbox SET body = NULL WHERE id = %s"
+MAIL_BLANK_FINISHED = "UPDATE email_outbox SET body = NULL WHERE status IN ('sent', 'failed') AND body IS NOT NULL"
+MAIL_PURGE = '''DELETE FROM email_outbox
+                WHERE (status = 'sent' AND sent_at < %s) OR (status = 'failed' AND next_attempt_at < %s)'''
+
+# One-time codes
+OTP_PRUNE = "DELETE FROM otp_codes WHERE last_sent_at < %s"
+OTP_SENDS = "SELECT sends, window_start, last_sent_at FROM otp_codes WHERE purpose = %s AND email = %s"
+OTP_PUT = '''INSERT INTO otp_codes (purpose, email, code_hash, payload, expires_at, attempts, sends, window_start,
+                                   last_sent_at)
+             VALUES (%s, %s, %s, %s, %s, 0, %s, %s, %s)
+             ON CONFLICT (purpose, email) DO UPDATE SET
+                 code_hash = excluded.code_hash, payload = excluded.payload, expires_at = excluded.expires_at,
+                 attempts = 0, sends = excluded.sends, window_start = excluded.window_start,
+                 last_sent_at = excluded.last_sent_at'''
+OTP_PENDING = '''SELECT 1 FROM otp_codes
+                 WHERE purpose = %s AND email = %s AND code_hash IS NOT NULL AND expires_at > %s AND attempts < %s'''
+OTP_GET = "SELECT code_hash, payload, expires_at, attempts FROM otp_codes WHERE purpose = %s AND email = %s"
+OTP_USE = "UPDATE otp_codes SET code_hash = NULL, payload = NULL WHERE purpose = %s AND email = %s"
+OTP_MISS = "UPDATE otp_codes SET attempts = attempts + 1 WHERE purpose = %s AND email = %s"
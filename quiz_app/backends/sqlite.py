@@ -0,0 +1,554 @@
+import sqlite3
+
+# SQLite backend (the default): one database file shared by the app's
+# processes. Writers take the file's write lock one at a time; under WAL,
+# readers run alongside them.
+
+Error = sqlite3.Error
+IntegrityError = sqlite3.IntegrityError
+OperationalError = sqlite3.OperationalError
+
+# Placeholder for statements whose clauses are built at run time
+PARAM = "?"
+
+# Per-connection tuning (busy_timeout is set in connect): WAL lets readers run
+# alongside the single writer, synchronous=NORMAL is durable enough under WAL
+# and avoids an fsync per commit.
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+]
+
+SCHEMA = [
+    # Create 'users' table if it doesn't exist
+    '''CREATE TABLE IF NOT EXISTS users (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           username TEXT UNIQUE,
+           password TEXT,
+           role TEXT DEFAULT 'student',
+           email TEXT)''',
+
+    # Create other tables
+    '''CREATE TABLE IF NOT EXISTS password_changes (
+           username TEXT PRIMARY KEY,
+           change_count INTEGER DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS quiz_attempts (
+           username TEXT PRIMARY KEY,
+           attempt_count INTEGER DEFAULT 0)''',
+
+    # Quiz results (one row per submission, append-only)
+    '''CREATE TABLE IF NOT EXISTS quiz_results (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           username TEXT,
+           hashed_password TEXT,
+           usn TEXT,
+           section TEXT,
+           score INTEGER,
+           time_taken REAL,
+           timestamp TEXT)''',
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_section ON quiz_results (section)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_timestamp ON quiz_results (timestamp)",
+    # Server-side sorting and filtering in the Professor Panel results browser
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_section_score ON quiz_results (section, score)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_score ON quiz_results (score)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_time_taken ON quiz_results (time_taken)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_usn ON quiz_results (usn)",
+
+    # Outgoing email queue, drained by the background sender in quiz_app.mailer
+    '''CREATE TABLE IF NOT EXISTS email_outbox (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           dedup_key TEXT UNIQUE,
+           to_addr TEXT,
+           subject TEXT,
+           body TEXT,
+           status TEXT DEFAULT 'pending',
+           attempts INTEGER DEFAULT 0,
+           next_attempt_at REAL,
+           last_error TEXT,
+           claim_token TEXT,
+           claimed_at REAL,
+           created_at REAL,
+           sent_at REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_email_outbox_claim ON email_outbox (claim_token)",
+
+    # Students currently taking the quiz (kept alive by page heartbeats)
+    '''CREATE TABLE IF NOT EXISTS active_students (
+           username TEXT PRIMARY KEY,
+           section TEXT,
+           joined_at REAL,
+           last_seen REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_active_students_last_seen ON active_students (last_seen)",
+
+    # Raw answers per result as packed arrays: int32 question ids, int8 option indexes
+    '''CREATE TABLE IF NOT EXISTS quiz_responses (
+           result_id INTEGER PRIMARY KEY,
+           question_ids BLOB,
+           choices BLOB)''',
+
+    # Flags raised by the webcam analysis in quiz_app.proctoring
+    '''CREATE TABLE IF NOT EXISTS proctor_events (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           username TEXT,
+           attempt_no INTEGER,
+           kind TEXT,
+           detail TEXT,
+           created_at REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_proctor_events_created ON proctor_events (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_proctor_events_user ON proctor_events (username, attempt_no)",
+
+    # Monitoring feed (joins, leaves, submissions, flags); dashboards read it by id cursor
+    '''CREATE TABLE IF NOT EXISTS events (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           kind TEXT,
+           username TEXT,
+           section TEXT,
+           payload TEXT,
+           created_at REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_events_created ON events (created_at)",
+
+    # Attempts in progress: the deadline and answers live here, not in the
+    # browser session, so a reconnect resumes the same attempt (quiz_app.attempts)
+    '''CREATE TABLE IF NOT EXISTS quiz_sessions (
+           username TEXT,
+           attempt_no INTEGER,
+           usn TEXT,
+           section TEXT,
+           paper_seed INTEGER,
+           started_at REAL,
+           deadline REAL,
+           answers TEXT DEFAULT '{}',
+           status TEXT DEFAULT 'active',
+           updated_at REAL,
+           result_id INTEGER,
+           PRIMARY KEY (username, attempt_no))''',
+    "CREATE INDEX IF NOT EXISTS idx_quiz_sessions_due ON quiz_sessions (status, deadline)",
+
+    # Catalog of result partitions (one per quiz and section): row counts, running
+    # aggregates and score/timestamp ranges, updated in the same transaction as
+    # each result. Listing reads it instead of quiz_results, and queries use the
+    # ranges to skip partitions that cannot match.
+    '''CREATE TABLE IF NOT EXISTS result_partitions (
+           quiz_id TEXT,
+           section TEXT,
+           row_count INTEGER DEFAULT 0,
+           score_sum REAL DEFAULT 0,
+           pass_count INTEGER DEFAULT 0,
+           time_sum REAL DEFAULT 0,
+           min_score REAL,
+           max_score REAL,
+           min_timestamp TEXT,
+           max_timestamp TEXT,
+           PRIMARY KEY (quiz_id, section))''',
+    # Per-section aggregates, superseded by result_partitions
+    "DROP TABLE IF EXISTS result_stats",
+
+    # Item analysis (quiz_app.item_analysis): running sums per question, option
+    # and paper length, added to in the same transaction as each result
+    '''CREATE TABLE IF NOT EXISTS item_stats (
+           quiz_id TEXT,
+           section TEXT,
+           question_id INTEGER,
+           responses INTEGER DEFAULT 0,
+           correct INTEGER DEFAULT 0,
+           total_sum INTEGER DEFAULT 0,
+           total_sq_sum INTEGER DEFAULT 0,
+           correct_total_sum INTEGER DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, question_id))''',
+    '''CREATE TABLE IF NOT EXISTS item_choices (
+           quiz_id TEXT,
+           section TEXT,
+           question_id INTEGER,
+           choice INTEGER,
+           picks INTEGER DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, question_id, choice))''',
+    '''CREATE TABLE IF NOT EXISTS paper_stats (
+           quiz_id TEXT,
+           section TEXT,
+           paper_length INTEGER,
+           papers INTEGER DEFAULT 0,
+           total_sum INTEGER DEFAULT 0,
+           total_sq_sum INTEGER DEFAULT 0,
+           PRIMARY KEY (quiz_id, section, paper_length))''',
+
+    # One-time email codes (quiz_app.otp); only a hash of the code is stored
+    '''CREATE TABLE IF NOT EXISTS otp_codes (
+           purpose TEXT,
+           email TEXT,
+           code_hash TEXT,
+           payload TEXT,
+           expires_at REAL,
+           attempts INTEGER DEFAULT 0,
+           sends INTEGER DEFAULT 0,
+           window_start REAL,
+           last_sent_at REAL,
+           PRIMARY KEY (purpose, email))''',
+    "CREATE INDEX IF NOT EXISTS idx_otp_codes_last_sent ON otp_codes (last_sent_at)",
+
+    # Recorded webcam segments (quiz_app.video_catalog), one row per MP4 file
+    '''CREATE TABLE IF NOT EXISTS recording_segments (
+           path TEXT PRIMARY KEY,
+           username TEXT,
+           attempt_no INTEGER,
+           segment_no INTEGER,
+           duration REAL,
+           size_bytes INTEGER,
+           thumbnail TEXT,
+           created_at REAL)''',
+    "CREATE INDEX IF NOT EXISTS idx_recording_segments_attempt ON recording_segments (username, attempt_no, segment_no)",
+
+    # Recordings and thumbnails copied into the database, so every replica can
+    # serve them (quiz_app.media, with QUIZ_MEDIA_STORE=database)
+    '''CREATE TABLE IF NOT EXISTS media_objects (
+           path TEXT PRIMARY KEY,
+           data BLOB,
+           size_bytes INTEGER,
+           created_at REAL)''',
+
+    # Key/value flags for one-off data migrations
+    '''CREATE TABLE IF NOT EXISTS app_meta (
+           key TEXT PRIMARY KEY,
+           value TEXT)''',
+]
+
+# Columns added after a table was first released: (table, column, definition).
+# CREATE TABLE IF NOT EXISTS leaves existing tables alone, so init_db adds these.
+ADDED_COLUMNS = [
+    ("quiz_results", "passed", "INTEGER"),
+    # Seed of the randomized paper (quiz_app.questions), so it can be rebuilt
+    ("quiz_results", "paper_seed", "INTEGER"),
+    # Quiz (question bank quiz_id) the result belongs to; older rows are 'legacy'
+    ("quiz_results", "quiz_id", "TEXT DEFAULT 'legacy'"),
+    # When the attempt was graded, and whether its slot in quiz_attempts was
+    # claimed at start (attempts opened by older versions are counted when they finish)
+    ("quiz_sessions", "finished_at", "REAL"),
+    ("quiz_sessions", "slot_claimed", "INTEGER DEFAULT 0"),
+    # Messages not sent by then are dropped (one-time codes that have expired)
+    ("email_outbox", "expires_at", "REAL"),
+    # The attempt's paper (JSON list of question ids), drawn when it opened: the
+    # bank can gain or lose questions while attempts are open
+    ("quiz_sessions", "question_ids", "TEXT"),
+]
+
+# Indexes over added columns, created once the columns exist
+ADDED_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_quiz_results_partition ON quiz_results (quiz_id, section, score)",
+]
+
+
+def connect(path, timeout_ms):
+    conn = sqlite3.connect(path, timeout=timeout_ms / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {timeout_ms}")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_schema(conn):
+    # journal_mode is stored in the database file, so setting it once is enough
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Under the write lock, so processes starting together don't both add a column
+    conn.execute("BEGIN IMMEDIATE")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    for table, column, definition in ADDED_COLUMNS:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    for statement in ADDED_INDEXES:
+        conn.execute(statement)
+    conn.commit()
+
+
+# One writer at a time, whatever keys it names
+def begin_write(conn, keys=(), shared=()):
+    conn.execute("BEGIN IMMEDIATE")
+
+
+# A deferred transaction reads from one snapshot from its first read on
+def begin_snapshot(conn):
+    conn.execute("BEGIN")
+
+
+# Fill the connection's regrade_scores table with (score, passed, id) rows
+def stage_scores(conn, rows):
+    conn.executemany("INSERT INTO regrade_scores (score, passed, id) VALUES (?, ?, ?)", rows)
+
+
+# Statements run by the stores, grouped by store. Those with {where} are
+# completed with a WHERE clause the caller builds from PARAM placeholders.
+
+# Users and credentials (quiz_app.credentials, quiz_app.roster, the login and
+# registration pages)
+USER_LOGIN = "SELECT password, role FROM users WHERE username = ?"
+USER_EMAIL = "SELECT email FROM users WHERE username = ?"
+USER_BY_EMAIL = "SELECT username FROM users WHERE email = ?"
+USER_ADD = "INSERT INTO users (username, password, role, email) VALUES (?, ?, ?, ?)"
+USER_ADD_NEW = USER_ADD + " ON CONFLICT(username) DO NOTHING"
+# {placeholders}: one PARAM per username
+USER_TAKEN = "SELECT username FROM users WHERE username IN ({placeholders})"
+# Conditional on the old hash so a concurrent password change wins
+USER_REHASH = "UPDATE users SET password = ? WHERE username = ? AND password = ?"
+USER_SET_PASSWORD = "UPDATE users SET password = ? WHERE username = ?"
+USER_COUNT_PASSWORD_CHANGE = '''INSERT INTO password_changes (username, change_count) VALUES (?, 1)
+                                ON CONFLICT(username) DO UPDATE SET change_count = password_changes.change_count + 1'''
+# Returns no row, counting nothing, once the user has made the given number of changes
+USER_COUNT_PASSWORD_CHANGE_UNDER = (USER_COUNT_PASSWORD_CHANGE
+                                    + " WHERE password_changes.change_count < ? RETURNING change_count")
+
+# Attempts (quiz_app.attempts)
+_ATTEMPT = '''SELECT username, attempt_no, usn, section, paper_seed, started_at, deadline, answers, status, result_id,
+                     finished_at, slot_claimed, question_ids
+              FROM quiz_sessions'''
+ATTEMPT_GET = _ATTEMPT + " WHERE username = ? AND attempt_no = ?"
+ATTEMPT_GET_ACTIVE = _ATTEMPT + " WHERE username = ? AND attempt_no = ? AND status = 'active'"
+ATTEMPT_LATEST_ACTIVE = _ATTEMPT + " WHERE username = ? AND status = 'active' ORDER BY attempt_no DESC LIMIT 1"
+ATTEMPT_USED = "SELECT attempt_count FROM quiz_attempts WHERE username = ?"
+# (username, limit, limit): the new attempt count, or no row at the limit
+ATTEMPT_CLAIM_SLOT = '''INSERT INTO quiz_attempts (username, attempt_count) SELECT ?, 1 WHERE ? > 0
+                        ON CONFLICT(username) DO UPDATE SET attempt_count = quiz_attempts.attempt_count + 1
+                        WHERE quiz_attempts.attempt_count < ?
+                        RETURNING attempt_count'''
+ATTEMPT_COUNT = '''INSERT INTO quiz_attempts (username, attempt_count) VALUES (?, 1)
+                   ON CONFLICT(username) DO UPDATE SET attempt_count = quiz_attempts.attempt_count + 1'''
+ATTEMPT_OPEN = '''INSERT INTO quiz_sessions (username, attempt_no, usn, section, paper_seed, started_at, deadline,
+                                             updated_at, slot_claimed, question_ids)
+                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                  ON CONFLICT(username, attempt_no) DO NOTHING'''
+# (question id as text, answer, updated_at, username, attempt_no)
+ATTEMPT_SAVE_ANSWER = '''UPDATE quiz_sessions SET answers = json_set(answers, '$."' || ? || '"', ?), updated_at = ?
+                         WHERE username = ? AND attempt_no = ? AND status = 'active' '''
+ATTEMPT_FINISH = '''UPDATE quiz_sessions SET status = ?, result_id = ?, answers = ?, updated_at = ?, finished_at = ?
+                    WHERE username = ? AND attempt_no = ?'''
+ATTEMPT_DUE = "SELECT username, attempt_no FROM quiz_sessions WHERE status = 'active' AND deadline < ?"
+
+# Results, their partition catalog and counters (quiz_app.results,
+# quiz_app.grading, quiz_app.snapshots)
+META_GET = "SELECT value FROM app_meta WHERE key = ?"
+META_ADD = "INSERT INTO app_meta (key, value) VALUES (?, ?)"
+META_SET = '''INSERT INTO app_meta (key, value) VALUES (?, ?)
+              ON CONFLICT(key) DO UPDATE SET value = excluded.value'''
+# Returns the counter's new value
+META_BUMP = '''INSERT INTO app_meta (key, value) VALUES (?, '1')
+               ON CONFLICT(key) DO UPDATE SET value = CAST(app_meta.value AS INTEGER) + 1
+               RETURNING value'''
+
+RESULT_ADD = '''INSERT INTO quiz_results
+                    (username, hashed_password, usn, section, score, time_taken, timestamp, passed, paper_seed,
+                     quiz_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+RESULT_ADD_RETURNING_ID = RESULT_ADD + " RETURNING id"
+RESULT_ADD_RESPONSES = "INSERT INTO quiz_responses (result_id, question_ids, choices) VALUES (?, ?, ?)"
+# (quiz_id, section, score, passed, time_taken, score, score, timestamp, timestamp).
+# Like the aggregates a rebuild takes, the ranges skip NULLs.
+RESULT_ADD_TO_PARTITION = '''INSERT INTO result_partitions (quiz_id, section, row_count, score_sum, pass_count,
+                                                            time_sum, min_score, max_score, min_timestamp,
+                                                            max_timestamp)
+                             VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)
+                             ON CONFLICT(quiz_id, section) DO UPDATE SET
+                                 row_count = result_partitions.row_count + 1,
+                                 score_sum = result_partitions.score_sum + excluded.score_sum,
+                                 pass_count = result_partitions.pass_count + excluded.pass_count,
+                                 time_sum = result_partitions.time_sum + excluded.time_sum,
+                                 min_score = MIN(COALESCE(result_partitions.min_score, excluded.min_score),
+                                                 COALESCE(excluded.min_score, result_partitions.min_score)),
+                                 max_score = MAX(COALESCE(result_partitions.max_score, excluded.max_score),
+                                                 COALESCE(excluded.max_score, result_partitions.max_score)),
+                                 min_timestamp = MIN(COALESCE(result_partitions.min_timestamp,
+                                                              excluded.min_timestamp),
+                                                     COALESCE(excluded.min_timestamp,
+                                                              result_partitions.min_timestamp)),
+                                 max_timestamp = MAX(COALESCE(result_partitions.max_timestamp,
+                                                              excluded.max_timestamp),
+                                                     COALESCE(excluded.max_timestamp,
+                                                              result_partitions.max_timestamp))'''
+RESULT_FILL_PASSED = "UPDATE quiz_results SET passed = CASE WHEN score >= ? THEN 1 ELSE 0 END WHERE passed IS NULL"
+RESULT_STATS = '''SELECT COALESCE(SUM(row_count), 0), COALESCE(SUM(score_sum), 0), COALESCE(SUM(pass_count), 0),
+                         COALESCE(SUM(time_sum), 0), MIN(min_score), MAX(max_score)
+                  FROM result_partitions{where}'''
+RESULT_DELETE_PARTITIONS = "DELETE FROM result_partitions{where}"
+RESULT_BUILD_PARTITIONS = '''INSERT INTO result_partitions (quiz_id, section, row_count, score_sum, pass_count,
+                                                            time_sum, min_score, max_score, min_timestamp,
+                                                            max_timestamp)
+                             SELECT quiz_id, section, COUNT(*), SUM(score), SUM(passed), SUM(time_taken),
+                                    MIN(score), MAX(score), MIN(timestamp), MAX(timestamp)
+                             FROM quiz_results{where}
+                             GROUP BY quiz_id, section'''
+RESULT_QUIZZES = "SELECT DISTINCT quiz_id FROM result_partitions ORDER BY quiz_id"
+RESULT_SECTIONS = "SELECT DISTINCT section FROM result_partitions{where} ORDER BY section"
+RESULT_PARTITIONS = '''SELECT quiz_id AS Quiz, section AS Section, row_count AS Rows, min_score AS Min_Score,
+                              max_score AS Max_Score, min_timestamp AS First_Result, max_timestamp AS Last_Result
+                       FROM result_partitions{where}
+                       ORDER BY quiz_id, section'''
+RESULT_ANY_PARTITION = "SELECT 1 FROM result_partitions{where} LIMIT 1"
+# Results with the CSV column names (quiz_app.results.RESULT_COLUMNS)
+_RESULTS = '''SELECT username AS Username, hashed_password AS Hashed_Password, usn AS USN, section AS Section,
+                     score AS Score, time_taken AS Time_Taken, timestamp AS Timestamp
+              FROM quiz_results'''
+RESULT_ALL = _RESULTS + " ORDER BY id"
+RESULT_SECTION = _RESULTS + " WHERE section = ? ORDER BY id"
+RESULT_LATEST = _RESULTS + " ORDER BY timestamp DESC LIMIT ?"
+RESULT_SINCE = _RESULTS + " WHERE timestamp > ? ORDER BY timestamp"
+RESULT_SINCE_LIMIT = RESULT_SINCE + " LIMIT ?"
+# {order}: an ORDER BY clause; the page takes (limit, offset) after the filter's parameters
+RESULT_FILTERED = _RESULTS + "{where}{order}"
+RESULT_PAGE = RESULT_FILTERED + " LIMIT ? OFFSET ?"
+RESULT_COUNT = "SELECT COUNT(*) FROM quiz_results{where}"
+# Rows for the columnar snapshot, after the given id
+RESULT_ROWS_AFTER = '''SELECT id, quiz_id, section, score, time_taken, timestamp, passed
+                       FROM quiz_results WHERE id > ? ORDER BY id'''
+RESULT_LAST_ID = "SELECT COALESCE(MAX(id), 0) FROM quiz_results"
+# Stored responses of a quiz with result ids in (after, upto]. The CROSS JOIN
+# keeps SQLite reading quiz_responses in id order (a short range when after is
+# given) rather than going through the quiz_id index.
+RESULT_RESPONSES = '''SELECT r.result_id, r.question_ids, r.choices, q.score, q.passed, q.section
+                      FROM quiz_responses r CROSS JOIN quiz_results q
+                      WHERE q.id = r.result_id AND r.result_id > ? AND r.result_id <= ? AND q.quiz_id = ?
+                      ORDER BY r.result_id'''
+RESULT_SET_SCORE = "UPDATE quiz_results SET score = ?, passed = ? WHERE id = ?"
+# Re-grades stage changed scores in a temporary table, outside the database
+# file, so filling it takes no write lock (see stage_scores)
+REGRADE_CREATE_STAGE = '''CREATE TEMP TABLE IF NOT EXISTS regrade_scores
+                              (id INTEGER PRIMARY KEY, score REAL, passed INTEGER)'''
+REGRADE_CLEAR_STAGE = "DELETE FROM regrade_scores"
+# (first id, last id) * 2: the range on both tables lets either side be read by id
+REGRADE_APPLY_STAGE = '''UPDATE quiz_results SET score = s.score, passed = s.passed FROM regrade_scores s
+                         WHERE quiz_results.id = s.id AND s.id BETWEEN ? AND ?
+                           AND quiz_results.id BETWEEN ? AND ?'''
+
+# Item analysis sums (quiz_app.item_analysis)
+ITEM_ADD = '''INSERT INTO item_stats (quiz_id, section, question_id, responses, correct, total_sum, total_sq_sum,
+                                      correct_total_sum)
+              VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+              ON CONFLICT(quiz_id, section, question_id) DO UPDATE SET
+                  responses = item_stats.responses + excluded.responses,
+                  correct = item_stats.correct + excluded.correct,
+                  total_sum = item_stats.total_sum + excluded.total_sum,
+                  total_sq_sum = item_stats.total_sq_sum + excluded.total_sq_sum,
+                  correct_total_sum = item_stats.correct_total_sum + excluded.correct_total_sum'''
+ITEM_ADD_CHOICE = '''INSERT INTO item_choices (quiz_id, section, question_id, choice, picks) VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT(quiz_id, section, question_id, choice) DO UPDATE SET
+                         picks = item_choices.picks + excluded.picks'''
+ITEM_ADD_PAPER = '''INSERT INTO paper_stats (quiz_id, section, paper_length, papers, total_sum, total_sq_sum)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(quiz_id, section, paper_length) DO UPDATE SET
+                        papers = paper_stats.papers + excluded.papers,
+                        total_sum = paper_stats.total_sum + excluded.total_sum,
+                        total_sq_sum = paper_stats.total_sq_sum + excluded.total_sq_sum'''
+ITEM_DELETE = [
+    "DELETE FROM item_stats WHERE quiz_id = ?",
+    "DELETE FROM item_choices WHERE quiz_id = ?",
+    "DELETE FROM paper_stats WHERE quiz_id = ?",
+]
+ITEM_RESPONSES = '''SELECT q.section, r.question_ids, r.choices
+                    FROM quiz_responses r JOIN quiz_results q ON q.id = r.result_id
+                    WHERE q.quiz_id = ?'''
+ITEM_SUMS = '''SELECT question_id, SUM(responses) AS responses, SUM(correct) AS correct, SUM(total_sum) AS total_sum,
+                      SUM(total_sq_sum) AS total_sq_sum, SUM(correct_total_sum) AS correct_total_sum
+               FROM item_stats{where}
+               GROUP BY question_id ORDER BY question_id'''
+ITEM_PICKS = '''SELECT question_id, choice, SUM(picks) AS picks FROM item_choices{where}
+                GROUP BY question_id, choice ORDER BY question_id, choice'''
+# The most common paper length
+ITEM_PAPERS = '''SELECT paper_length, SUM(papers), SUM(total_sum), SUM(total_sq_sum) FROM paper_stats{where}
+                 GROUP BY paper_length ORDER BY SUM(papers) DESC, paper_length LIMIT 1'''
+
+# Presence, monitoring feed and proctoring flags (quiz_app.presence,
+# quiz_app.events, quiz_app.proctoring)
+PRESENCE_JOIN = '''INSERT INTO active_students (username, section, joined_at, last_seen)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(username) DO UPDATE SET section = excluded.section, last_seen = excluded.last_seen'''
+PRESENCE_HEARTBEAT = "UPDATE active_students SET last_seen = ? WHERE username = ?"
+PRESENCE_LEAVE = "DELETE FROM active_students WHERE username = ?"
+PRESENCE_STALE = "SELECT username FROM active_students WHERE last_seen < ?"
+PRESENCE_EXPIRE = "DELETE FROM active_students WHERE last_seen < ?"
+PRESENCE_LIVE = "SELECT username, section FROM active_students ORDER BY joined_at"
+PRESENCE_SECTION_COUNTS = "SELECT section, COUNT(*) FROM active_students GROUP BY section ORDER BY section"
+
+# Returns the event's id
+EVENT_ADD = '''INSERT INTO events (kind, username, section, payload, created_at) VALUES (?, ?, ?, ?, ?)
+               RETURNING id'''
+EVENT_PRUNE = "DELETE FROM events WHERE created_at < ?"
+EVENT_LATEST_ID = "SELECT MAX(id) FROM events"
+EVENT_SINCE = '''SELECT id, kind, username, section, payload, created_at FROM events
+                 WHERE id > ? ORDER BY id LIMIT ?'''
+
+FLAG_ADD = "INSERT INTO proctor_events (username, attempt_no, kind, detail, created_at) VALUES (?, ?, ?, ?, ?)"
+FLAG_RECENT = '''SELECT username, attempt_no, kind, detail, created_at FROM proctor_events
+                 ORDER BY id DESC LIMIT ?'''
+FLAG_COUNTS = '''SELECT username, COUNT(*) FROM proctor_events WHERE created_at >= ?
+                 GROUP BY username ORDER BY COUNT(*) DESC'''
+
+# Media and the recordings catalog (quiz_app.media, quiz_app.video_catalog)
+MEDIA_PUT = '''INSERT INTO media_objects (path, data, size_bytes, created_at) VALUES (?, ?, ?, ?)
+               ON CONFLICT(path) DO UPDATE SET data = excluded.data, size_bytes = excluded.size_bytes,
+                                               created_at = excluded.created_at'''
+MEDIA_GET = "SELECT data FROM media_objects WHERE path = ?"
+MEDIA_PATHS = "SELECT path FROM media_objects"
+
+SEGMENT_ADD = '''INSERT INTO recording_segments (path, username, attempt_no, segment_no, duration, size_bytes,
+                                                 created_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                 ON CONFLICT(path) DO UPDATE SET duration = excluded.duration, size_bytes = excluded.size_bytes,
+                                                 thumbnail = NULL'''
+SEGMENT_SET_THUMBNAIL = "UPDATE recording_segments SET thumbnail = ? WHERE path = ?"
+SEGMENT_DELETE = "DELETE FROM recording_segments WHERE path = ?"
+SEGMENT_THUMBNAILS = '''SELECT path, thumbnail FROM recording_segments'''
+SEGMENT_NO_THUMBNAIL = '''SELECT path, username, attempt_no, duration FROM recording_segments
+                          WHERE thumbnail IS NULL'''
+SEGMENT_LIST = '''SELECT segment_no, path, duration, thumbnail FROM recording_segments
+                  WHERE username = ? AND attempt_no = ? ORDER BY segment_no'''
+SEGMENT_LAST_NO = "SELECT MAX(segment_no) FROM recording_segments WHERE username = ? AND attempt_no = ?"
+# One row per recorded attempt, for the recordings page
+SEGMENT_RECORDINGS = '''SELECT s.username AS Student, s.attempt_no AS Attempt, COUNT(*) AS Segments,
+                               SUM(s.duration) AS Duration_Seconds, SUM(s.size_bytes) AS Size_MB,
+                               (SELECT COUNT(*) FROM proctor_events e
+                                WHERE e.username = s.username AND e.attempt_no = s.attempt_no) AS Flags,
+                               MAX(s.created_at) AS Recorded
+                        FROM recording_segments s
+                        GROUP BY s.username, s.attempt_no
+                        ORDER BY MAX(s.created_at) DESC'''
+
+# Email outbox (quiz_app.mailer)
+MAIL_QUEUE = '''INSERT INTO email_outbox (dedup_key, to_addr, subject, body, next_attempt_at, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(dedup_key) DO NOTHING'''
+MAIL_RECLAIM = '''UPDATE email_outbox SET status = 'pending', claim_token = NULL
+                  WHERE status = 'sending' AND claimed_at < ?'''
+MAIL_EXPIRE = '''UPDATE email_outbox SET status = 'failed', body = NULL, last_error = 'expired'
+                 WHERE status = 'pending' AND expires_at < ?'''
+# (token, now, now, batch size)
+MAIL_CLAIM = '''UPDATE email_outbox SET status = 'sending', claim_token = ?, claimed_at = ?
+                WHERE id IN (SELECT id FROM email_outbox
+                             WHERE status = 'pending' AND next_attempt_at <= ?
+                             ORDER BY id LIMIT ?)'''
+MAIL_CLAIMED = "SELECT id, to_addr, subject, body, attempts FROM email_outbox WHERE claim_token = ? ORDER BY id"
+MAIL_SENT = '''UPDATE email_outbox SET status = 'sent', sent_at = ?, claim_token = NULL, body = NULL
+               WHERE id = ?'''
+MAIL_RELEASE = '''UPDATE email_outbox SET status = 'pending', claim_token = NULL
+                  WHERE id = ? AND status = 'sending' '''
+MAIL_RETRY = '''UPDATE email_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, claim_token = NULL
+                WHERE id = ?'''
+MAIL_BLANK = "UPDATE email_outbox SET body = NULL WHERE id = ?"
+MAIL_BLANK_FINISHED = "UPDATE email_outbox SET body = NULL WHERE status IN ('sent', 'failed') AND body IS NOT NULL"
+MAIL_PURGE = '''DELETE FROM email_outbox
+                WHERE (status = 'sent' AND sent_at < ?) OR (status = 'failed' AND next_attempt_at < ?)'''
+
+# One-time codes (quiz_app.otp)
+OTP_PRUNE = "DELETE FROM otp_codes WHERE last_sent_at < ?"
+OTP_SENDS = "SELECT sends, window_start, last_sent_at FROM otp_codes WHERE purpose = ? AND email = ?"
+OTP_PUT = '''INSERT INTO otp_codes (purpose, email, code_hash, payload, expires_at, attempts, sends, window_start,
+                                   last_sent_at)
+             VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)
+             ON CONFLICT(purpose, email) DO UPDATE SET
+                 code_hash = excluded.code_hash, payload = excluded.payload, expires_at = excluded.expires_at,
+                 attempts = 0, sends = excluded.sends, window_start = excluded.window_start,
+                 last_sent_at = excluded.last_sent_at'''
+OTP_PENDING = '''SELECT 1 FROM otp_codes
+                 WHERE purpose = ? AND email = ? AND code_hash IS NOT NULL AND expires_at > ? AND attempts < ?'''
+OTP_GET = "SELECT code_hash, payload, expires_at, attempts FROM otp_codes WHERE purpose = ? AND email = ?"
+OTP_USE = "UPDATE otp_codes SET code_hash = NULL, payload = NULL WHERE purpose = ? AND email = ?"
+OTP_MISS = "UPDATE otp_codes SET attempts = attempts + 1 WHERE purpose = ? AND email = ?"
@@ -0,0 +1,270 @@
+import hashlib
+import hmac
+import ipaddress
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+
+from quiz_app import metrics
+from quiz_app.db import backend, begin_write, get_db_connection
+
+# Stored format: "scrypt$n$r$p$salt$hash" or "pbkdf2_sha256$iterations$salt$hash"
+# (salt and hash hex encoded). Bare 64-character hex strings are the unsalted
+# SHA-256 hashes written by older versions; they are upgraded on the next login.
+PASSWORD_SCHEME = os.environ.get("QUIZ_PASSWORD_SCHEME", "scrypt")
+SCRYPT_N = int(os.environ.get("QUIZ_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("QUIZ_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("QUIZ_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.environ.get("QUIZ_PBKDF2_ITERATIONS", "600000"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# At most this many hashes are computed at once; logins beyond that wait up to
+# HASH_WAIT_SECONDS for a slot and are then turned away
+HASH_CONCURRENCY = int(os.environ.get("QUIZ_HASH_CONCURRENCY", str(os.cpu_count() or 1)))
+HASH_WAIT_SECONDS = 10
+# Login attempts allowed per window, per username and per client address. The
+# per-address limit is off (0) unless set: a class behind one NAT, or every
+# student when the app sits behind a proxy that isn't listed in
+# TRUSTED_PROXIES, logs in from a single address.
+LOGIN_WINDOW_SECONDS = 60
+LOGIN_ATTEMPTS_PER_USER = int(os.environ.get("QUIZ_LOGIN_ATTEMPTS_PER_USER", "10"))
+LOGIN_ATTEMPTS_PER_IP = int(os.environ.get("QUIZ_LOGIN_ATTEMPTS_PER_IP", "0"))
+# Load balancers and reverse proxies (comma-separated addresses or networks)
+# whose X-Forwarded-For header is believed
+TRUSTED_PROXIES = [ipaddress.ip_network(net.strip(), strict=False)
+                   for net in os.environ.get("QUIZ_TRUSTED_PROXIES", "").split(",") if net.strip()]
+# Successful verifications are remembered so a repeated login skips the hash
+VERIFY_CACHE_SIZE = 4096
+VERIFY_CACHE_TTL_SECONDS = 600
+
+# Password changes allowed per user from the Change Password page
+PASSWORD_CHANGE_LIMIT = 2
+
+# Passwords generated for new accounts (bulk roster import, professor
+# registration). They are random, so a slow hash adds little: they are stored
+# with a cheap PBKDF2 cost and replaced with the current scheme on first login.
+GENERATED_PASSWORD_BYTES = 9
+GENERATED_PASSWORD_ITERATIONS = 1000
+
+SCHEMES = ["scrypt", "pbkdf2_sha256"]
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many login attempts, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+# Unsalted SHA-256, kept for the Hashed_Password column of quiz results, which
+# is not a credential
+def legacy_hash(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * (n + p + 2),
+                          dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=HASH_BYTES)
+
+
+def hash_password(password, scheme=PASSWORD_SCHEME):
+    salt = secrets.token_bytes(SALT_BYTES)
+    if scheme == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    if scheme == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+    raise ValueError(f"Unknown password scheme: {scheme}")
+
+
+def generate_password():
+    return secrets.token_urlsafe(GENERATED_PASSWORD_BYTES)
+
+
+def hash_generated_password(password):
+    salt = secrets.token_bytes(SALT_BYTES)
+    digest = _pbkdf2(password, salt, GENERATED_PASSWORD_ITERATIONS)
+    return f"pbkdf2_sha256${GENERATED_PASSWORD_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+
+# True when the stored hash is legacy or was made with other cost settings
+def needs_rehash(stored, scheme=PASSWORD_SCHEME):
+    if scheme == "scrypt":
+        return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+def verify_password(password, stored):
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        digest = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+    elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        digest = _pbkdf2(password, bytes.fromhex(parts[2]), int(parts[1]))
+    elif len(parts) == 1:
+        return hmac.compare_digest(stored, legacy_hash(password))
+    else:
+        return False
+    return hmac.compare_digest(digest.hex(), parts[-1])
+
+
+# Sliding-window counter kept in process memory
+class RateLimiter:
+    def __init__(self, limit, window=LOGIN_WINDOW_SECONDS):
+        self.limit = limit
+        self.window = window
+        self._hits = {}
+        self._lock = threading.Lock()
+
+    # Records an attempt; returns 0 if allowed, else seconds until the next one is
+    def hit(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return int(hits[0] + self.window - now) + 1
+            hits.append(now)
+            if len(self._hits) > 10000:
+                self._hits = {k: v for k, v in self._hits.items() if v and v[-1] > now - self.window}
+            return 0
+
+
+# Remembers (stored hash, password) pairs that verified. Keys are HMACs under a
+# per-process secret, so plaintext passwords are never held; a password change
+# alters the stored hash and so misses the cache.
+class VerifyCache:
+    def __init__(self, size=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL_SECONDS):
+        self.size = size
+        self.ttl = ttl
+        self._secret = secrets.token_bytes(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, stored, password):
+        return hmac.new(self._secret, f"{stored}\0{password}".encode(), hashlib.sha256).digest()
+
+    def hit(self, stored, password):
+        key = self._key(stored, password)
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def add(self, stored, password):
+        key = self._key(stored, password)
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+_user_limiter = RateLimiter(LOGIN_ATTEMPTS_PER_USER)
+_ip_limiter = RateLimiter(LOGIN_ATTEMPTS_PER_IP) if LOGIN_ATTEMPTS_PER_IP else None
+_verify_cache = VerifyCache()
+_hash_slots = threading.BoundedSemaphore(HASH_CONCURRENCY)
+
+
+def _check_password(password, stored):
+    if _verify_cache.hit(stored, password):
+        metrics.inc("verify_cache_hits")
+        return True
+    started = time.perf_counter()
+    if not _hash_slots.acquire(timeout=HASH_WAIT_SECONDS):
+        metrics.inc("login_throttled")
+        raise LoginThrottled(HASH_WAIT_SECONDS)
+    metrics.observe("hash_slot_wait", time.perf_counter() - started)
+    try:
+        with metrics.timer("password_verify"):
+            ok = verify_password(password, stored)
+    finally:
+        _hash_slots.release()
+    if ok:
+        _verify_cache.add(stored, password)
+    return ok
+
+
+def _trusted(address):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in net for net in TRUSTED_PROXIES)
+
+
+# The address a request came from: the connecting peer, or, when the peer is a
+# trusted proxy, the last address in X-Forwarded-For not added by one (the
+# entries before it are whatever the client chose to send)
+def client_address(peer, forwarded_for=None):
+    if not peer or not forwarded_for or not _trusted(peer):
+        return peer
+    for address in reversed(forwarded_for.split(",")):
+        if not _trusted(address):
+            return address.strip()
+    return peer
+
+
+# Check a login and return the user's role, or None if the credentials are
+# wrong. Raises LoginThrottled when the username or address is over its limit
+# or the server is saturated with hashing. Legacy or outdated hashes are
+# replaced with the current scheme on a successful login.
+@metrics.timed("authenticate")
+def authenticate(username, password, ip=None):
+    retry_after = _user_limiter.hit(username)
+    if not retry_after and ip and _ip_limiter is not None:
+        retry_after = _ip_limiter.hit(ip)
+    if retry_after:
+        metrics.inc("login_throttled")
+        raise LoginThrottled(retry_after)
+
+    with get_db_connection() as conn:
+        row = conn.execute(backend.USER_LOGIN, (username,)).fetchone()
+    if not row or not _check_password(password, row[0]):
+        return None
+    stored, role = row
+
+    if needs_rehash(stored):
+        with _hash_slots:
+            new_hash = hash_password(password)
+        with get_db_connection() as conn:
+            # Conditional on the old hash so a concurrent password change wins
+            conn.execute(backend.USER_REHASH, (new_hash, username, stored))
+            conn.commit()
+        _verify_cache.add(new_hash, password)
+    return role or "student"
+
+
+# Set a new password and count the change in one short write transaction (the
+# hash is computed before it starts). With a limit, the change is counted by a
+# conditional upsert, so concurrent requests cannot both get under it. Returns
+# False, changing nothing, when the limit is used up or the user is unknown.
+@metrics.timed("change_password")
+def change_password(username, new_password, limit=None):
+    with _hash_slots:
+        new_hash = hash_password(new_password)
+    with get_db_connection() as conn:
+        begin_write(conn, f"user:{username}")
+        if limit is None:
+            conn.execute(backend.USER_COUNT_PASSWORD_CHANGE, (username,))
+        elif conn.execute(backend.USER_COUNT_PASSWORD_CHANGE_UNDER, (username, limit)).fetchone() is None:
+            conn.rollback()
+            return False
+        if not conn.execute(backend.USER_SET_PASSWORD, (new_hash, username)).rowcount:
+            conn.rollback()
+            return False
+        conn.commit()
+    return True
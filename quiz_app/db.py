@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from quiz_app import metrics
+
+DB_PATH = os.environ.get("QUIZ_DB_PATH", "quiz_app.db")
+# Set to a postgresql:// URL to keep shared state in PostgreSQL instead, so
+# several app replicas can serve the same exam (see quiz_app.backends.postgres;
+# install requirements-postgres.txt for its driver)
+DB_URL = os.environ.get("QUIZ_DB_URL", "")
+DB_POOL_SIZE = int(os.environ.get("QUIZ_DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("QUIZ_DB_BUSY_TIMEOUT_MS", "5000"))
+
+
+def is_postgres():
+    return DB_URL.startswith(("postgres://", "postgresql://"))
+
+
+# The configured backend (see quiz_app.backends): the stores run its
+# statements and catch its exceptions. Only that backend's driver is imported.
+if is_postgres():
+    from quiz_app.backends import postgres as backend
+else:
+    from quiz_app.backends import sqlite as backend
+
+
+def _connect():
+    return backend.connect(DB_URL if is_postgres() else DB_PATH, DB_BUSY_TIMEOUT_MS)
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+# Run the schema setup once per process; later calls are a no-op
+def init_db():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        conn = _connect()
+        try:
+            backend.init_schema(conn)
+        finally:
+            conn.close()
+        _schema_ready = True
+
+
+# Start a write transaction whose writes depend on what it reads first. On
+# SQLite this is BEGIN IMMEDIATE: one writer at a time. On PostgreSQL it only
+# waits for transactions naming one of the same keys (e.g. "user:<username>"),
+# except that a key in shared excludes only those naming it in keys (e.g.
+# submissions, which can run together, against a rebuild of their aggregates).
+def begin_write(conn, *keys, shared=()):
+    backend.begin_write(conn, keys, shared)
+
+
+class ConnectionPool:
+    def __init__(self, max_size=DB_POOL_SIZE):
+        self.max_size = max_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                return _connect()
+        # Pool exhausted: wait for a connection to come back
+        try:
+            return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise backend.OperationalError("timed out waiting for a database connection")
+
+    # suspect: the connection raised OperationalError while it was out. That
+    # is usually a lock or busy timeout on a healthy connection, so it is only
+    # dropped when it is closed or fails a probe.
+    def release(self, conn, suspect=False):
+        try:
+            if getattr(conn, "closed", False):
+                raise backend.OperationalError("connection is closed")
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            if suspect:
+                conn.execute("SELECT 1").fetchone()
+                conn.rollback()
+        except backend.Error:
+            self._drop(conn)
+            return
+        self._idle.put(conn)
+
+    # The next acquire opens a new connection in its place
+    def _drop(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+        metrics.inc("db_connections_dropped")
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                init_db()
+                _pool = ConnectionPool()
+    return _pool
+
+
+# Borrow a pooled connection for the duration of a with-block:
+#     with get_db_connection() as conn:
+#         conn.execute(...)
+#         conn.commit()
+# Anything not committed when the block exits is rolled back.
+@contextmanager
+def get_db_connection():
+    pool = get_pool()
+    started = time.perf_counter()
+    conn = pool.acquire()
+    acquired = time.perf_counter()
+    metrics.observe("db_pool_wait", acquired - started)
+    suspect = False
+    try:
+        yield conn
+    except backend.OperationalError:
+        suspect = True
+        raise
+    finally:
+        pool.release(conn, suspect)
+        metrics.observe("db_connection", time.perf_counter() - acquired)
+
+
+# Run a query into a DataFrame, on either backend (pandas.read_sql_query only
+# accepts sqlite3 connections without SQLAlchemy). pandas is imported here so
+# modules that never build a frame don't pay for it.
+def read_frame(conn, sql, params=()):
+    import pandas as pd
+    cur = conn.execute(sql, params)
+    return pd.DataFrame.from_records(cur.fetchall(), columns=[c[0] for c in cur.description], coerce_float=True)
@@ -0,0 +1,106 @@
+import json
+import time
+from collections import Counter, deque
+
+from quiz_app.db import backend, get_db_connection
+
+# Event kinds published to the monitoring feed
+JOIN = "join"
+LEAVE = "leave"
+SUBMISSION = "submission"
+FLAG = "flag"
+
+EVENT_RETENTION_SECONDS = 6 * 60 * 60
+EVENTS_PER_POLL = 1000
+_PRUNE_EVERY = 500
+
+
+# Append an event using the caller's connection, so it commits (or rolls back)
+# together with the change it describes
+def add_event(conn, kind, username, section="", **payload):
+    event_id = conn.execute(backend.EVENT_ADD, (kind, username, section or "", json.dumps(payload),
+                                                time.time())).fetchone()[0]
+    if event_id % _PRUNE_EVERY == 0:
+        conn.execute(backend.EVENT_PRUNE, (time.time() - EVENT_RETENTION_SECONDS,))
+    return event_id
+
+
+def publish(kind, username, section="", **payload):
+    with get_db_connection() as conn:
+        event_id = add_event(conn, kind, username, section, **payload)
+        conn.commit()
+    return event_id
+
+
+def latest_event_id():
+    with get_db_connection() as conn:
+        row = conn.execute(backend.EVENT_LATEST_ID).fetchone()
+    return row[0] or 0
+
+
+# Events after the given cursor, oldest first (primary-key range scan)
+def events_since(cursor, limit=EVENTS_PER_POLL):
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.EVENT_SINCE, (cursor, limit)).fetchall()
+    return [(event_id, kind, username, section, json.loads(payload), ts)
+            for event_id, kind, username, section, payload, ts in rows]
+
+
+# A professor's live view of the feed. It is seeded once from the current
+# tables and then only applies the events published after its cursor, so a
+# refresh costs the same however much history has built up. The cursor is read
+# before the seed queries, so nothing published while they run is missed;
+# events up to the one that was latest once they finished may already be in
+# the seed, and submissions and flags found there are not added again.
+class MonitorView:
+    def __init__(self, cursor, active_students, recent_submissions, recent_flags, flag_counts, recent_limit=5,
+                 flag_limit=20):
+        self.cursor = cursor
+        self.active = dict(active_students)
+        self.submissions = deque(recent_submissions, maxlen=recent_limit)
+        self.flags = deque(recent_flags, maxlen=flag_limit)
+        self.flag_counts = dict(flag_counts)
+        self._seeded_until = latest_event_id()
+        self._seeded_submissions = {(s.get("Username"), s.get("Timestamp")) for s in self.submissions}
+        self._seeded_flags = Counter(flag[:4] for flag in self.flags)
+
+    def refresh(self):
+        applied = 0
+        while True:
+            batch = events_since(self.cursor)
+            for event_id, kind, username, section, payload, ts in batch:
+                if event_id > self._seeded_until or not self._in_seed(kind, username, payload):
+                    self.apply(kind, username, section, payload, ts)
+                self.cursor = event_id
+            applied += len(batch)
+            if len(batch) < EVENTS_PER_POLL:
+                return applied
+
+    # Joins and leaves are applied again either way: replayed in order they
+    # end in the same state
+    def _in_seed(self, kind, username, payload):
+        if kind == SUBMISSION:
+            return (username, payload.get("Timestamp")) in self._seeded_submissions
+        if kind == FLAG:
+            key = (username, payload.get("attempt_no"), payload.get("flag"), payload.get("detail", ""))
+            if self._seeded_flags[key]:
+                self._seeded_flags[key] -= 1
+                return True
+        return False
+
+    def apply(self, kind, username, section, payload, ts):
+        if kind == JOIN:
+            self.active[username] = section
+        elif kind == LEAVE:
+            self.active.pop(username, None)
+        elif kind == SUBMISSION:
+            self.submissions.appendleft(dict(payload, Username=username, Section=section))
+        elif kind == FLAG:
+            self.flags.appendleft((username, payload.get("attempt_no"), payload.get("flag"), payload.get("detail", ""), ts))
+            self.flag_counts[username] = self.flag_counts.get(username, 0) + 1
+
+    def section_counts(self):
+        counts = {}
+        for section in self.active.values():
+            counts[section] = counts.get(section, 0) + 1
+        return dict(sorted(counts.items()))
@@ -0,0 +1,189 @@
+import functools
+import os
+import time
+
+import numpy as np
+
+from quiz_app import metrics
+from quiz_app.db import backend, begin_write, get_db_connection
+from quiz_app.item_analysis import item_sums, replace_item_stats
+from quiz_app.results import LEGACY_PASS_MARK, RESULTS_LOCK, rebuild_result_stats
+
+# Scoring schemes:
+#   standard - 1 mark for the right option, 0 otherwise
+#   negative - 1 mark for the right option, -NEGATIVE_MARK for a wrong one, 0 if unanswered
+#   partial  - like standard, plus any per-option "credit" fractions given in the question bank
+GRADING_SCHEMES = ["standard", "negative", "partial"]
+# Default until a re-grade picks a scheme; the choice is kept in app_meta
+GRADING_SCHEME = os.environ.get("QUIZ_GRADING_SCHEME", "standard")
+GRADING_SCHEME_KEY = "grading_scheme"
+NEGATIVE_MARK = float(os.environ.get("QUIZ_NEGATIVE_MARK", "0.25"))
+PASS_FRACTION = 0.5
+# Re-grades write changed scores back this many rows per write transaction
+REGRADE_CHUNK_SIZE = 10000
+
+UNANSWERED = -1
+_MAX_ID = 2 ** 63 - 1
+
+
+# Responses are stored as two parallel arrays: question ids (int32) and the
+# index of the chosen option (int8, UNANSWERED for a blank answer)
+def encode_responses(bank, answers):
+    qids = np.fromiter(answers.keys(), dtype=np.int32, count=len(answers))
+    choices = np.fromiter(
+        (bank.by_id[qid]["options"].index(ans) if ans is not None else UNANSWERED for qid, ans in answers.items()),
+        dtype=np.int8, count=len(answers))
+    return qids, choices
+
+
+# Credit table for the whole bank: row = question, column = option index.
+# The last column is the credit for UNANSWERED (index -1), and the last row is
+# an all-zero row used for question ids no longer in the bank.
+@functools.lru_cache(maxsize=8)
+def credit_table(bank, scheme=GRADING_SCHEME):
+    if scheme not in GRADING_SCHEMES:
+        raise ValueError(f"Unknown grading scheme: {scheme}")
+    questions = list(bank.by_id.values())
+    max_options = max(len(q["options"]) for q in questions)
+    table = np.zeros((len(questions) + 1, max_options + 1), dtype=np.float32)
+    row_of = np.full(max(bank.by_id) + 1, len(questions), dtype=np.int64)
+    for row, q in enumerate(questions):
+        row_of[q["id"]] = row
+        n_options = len(q["options"])
+        if scheme == "negative":
+            table[row, :n_options] = -NEGATIVE_MARK
+        elif scheme == "partial":
+            for option, credit in q.get("credit", {}).items():
+                table[row, q["options"].index(option)] = credit
+        table[row, q["options"].index(q["answer"])] = 1.0
+    return row_of, table
+
+
+# Score many attempts at once. attempt_idx, qids and choices are flat arrays
+# with one entry per answered question; returns one score per attempt.
+def score_responses(attempt_idx, qids, choices, n_attempts, row_of, table):
+    known = qids < len(row_of)
+    rows = np.where(known, row_of[np.where(known, qids, 0)], table.shape[0] - 1)
+    credit = table[rows, choices.astype(np.int64)]
+    return np.bincount(attempt_idx, weights=credit, minlength=n_attempts)
+
+
+# The scheme new submissions are graded with: the one the last re-grade used
+def active_scheme(conn=None):
+    if conn is None:
+        with get_db_connection() as conn:
+            return active_scheme(conn)
+    row = conn.execute(backend.META_GET, (GRADING_SCHEME_KEY,)).fetchone()
+    return row[0] if row else GRADING_SCHEME
+
+
+def grade_attempt(bank, qids, choices, scheme=None):
+    if scheme is None:
+        scheme = active_scheme()
+    row_of, table = credit_table(bank, scheme)
+    attempt_idx = np.zeros(len(qids), dtype=np.int64)
+    score = float(score_responses(attempt_idx, qids, choices, 1, row_of, table)[0])
+    return int(score) if score.is_integer() else round(score, 2)
+
+
+# Stored responses of a quiz's results with ids in (after, upto]
+def load_all_responses(conn, quiz_id, after=0, upto=None):
+    rows = conn.execute(backend.RESULT_RESPONSES, (after, _MAX_ID if upto is None else upto, quiz_id)).fetchall()
+    result_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lengths = np.fromiter((len(r[2]) for r in rows), dtype=np.int64, count=len(rows))
+    qids = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.int32)
+    choices = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.int8)
+    attempt_idx = np.repeat(np.arange(len(rows)), lengths)
+    old_scores = np.fromiter((r[3] for r in rows), dtype=np.float64, count=len(rows))
+    old_passed = np.fromiter((bool(r[4]) for r in rows), dtype=bool, count=len(rows))
+    sections = [r[5] for r in rows]
+    return result_ids, lengths, attempt_idx, qids, choices, old_scores, old_passed, sections
+
+
+# (score, passed, id) for each loaded result whose outcome moved
+def _changed_rows(responses, row_of, table, pass_fraction):
+    result_ids, lengths, attempt_idx, qids, choices, old_scores, old_passed, _ = responses
+    scores = np.round(score_responses(attempt_idx, qids, choices, len(result_ids), row_of, table), 2)
+    passed = scores >= lengths * pass_fraction
+    changed = (scores != old_scores) | (passed != old_passed)
+    return list(zip(scores[changed].tolist(), passed[changed].astype(int).tolist(), result_ids[changed].tolist()))
+
+
+# Re-score every stored attempt of the bank's quiz against the current answer
+# key (e.g. after a correction to question_bank.json) and rebuild its dashboard
+# aggregates and item analysis. The scheme becomes the one new submissions are
+# graded with.
+# Responses are loaded and scored, and the item sums computed, without holding
+# off submissions: the snapshot is the results saved before a moment when none
+# was in progress, which on PostgreSQL (where submissions commit out of id
+# order) are all those up to the largest id then. Changed scores are staged in
+# a temporary table and applied from it REGRADE_CHUNK_SIZE rows per write
+# transaction, so submissions are never held up for long; the first one also
+# switches the scheme. The last one scores the results saved since the
+# snapshot and rebuilds the aggregates. If a re-grade fails part way, running
+# it again finishes the job.
+# Results imported from the old CSV files have no stored responses and are left as is.
+@metrics.timed("regrade_all")
+def regrade_all(bank, scheme=None, pass_fraction=PASS_FRACTION):
+    started = time.perf_counter()
+    if scheme is None:
+        scheme = active_scheme()
+    row_of, table = credit_table(bank, scheme)
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        last_id = conn.execute(backend.RESULT_LAST_ID).fetchone()[0]
+        conn.commit()
+        snapshot = load_all_responses(conn, bank.quiz_id, upto=last_id)
+    changes = _changed_rows(snapshot, row_of, table, pass_fraction)
+    sums = item_sums(bank, snapshot[7], snapshot[1], snapshot[3], snapshot[4])
+    graded = time.perf_counter()
+    longest_lock = 0.0
+    with get_db_connection() as conn:
+        _stage_changes(conn, changes)
+        for start in range(0, len(changes), REGRADE_CHUNK_SIZE):
+            chunk = changes[start:start + REGRADE_CHUNK_SIZE]
+            begin_write(conn)
+            locked = time.perf_counter()
+            if start == 0:
+                _set_active_scheme(conn, scheme)
+            conn.execute(backend.REGRADE_APPLY_STAGE, (chunk[0][2], chunk[-1][2]) * 2)
+            conn.commit()
+            longest_lock = max(longest_lock, time.perf_counter() - locked)
+        begin_write(conn, RESULTS_LOCK)
+        locked = time.perf_counter()
+        _set_active_scheme(conn, scheme)
+        # Saved after the snapshot: possibly graded with the previous scheme,
+        # and already added to the item sums
+        late = load_all_responses(conn, bank.quiz_id, after=last_id)
+        late_changes = _changed_rows(late, row_of, table, pass_fraction)
+        conn.executemany(backend.RESULT_SET_SCORE, late_changes)
+        if changes or late_changes:
+            rebuild_result_stats(LEGACY_PASS_MARK, conn, bank.quiz_id)
+            if len(late[0]):
+                replace_item_stats(conn, bank, sums, item_sums(bank, late[7], late[1], late[3], late[4]))
+            else:
+                replace_item_stats(conn, bank, sums)
+        conn.execute(backend.REGRADE_CLEAR_STAGE)
+        conn.commit()
+    finished = time.perf_counter()
+    return {
+        "attempts": len(snapshot[0]) + len(late[0]),
+        "changed": len(changes) + len(late_changes),
+        "grade_seconds": graded - started,
+        # Longest time submissions had to wait on the re-grade
+        "lock_seconds": max(longest_lock, finished - locked),
+        "total_seconds": finished - started,
+    }
+
+
+# Copy (score, passed, id) rows into the connection's temporary regrade_scores
+# table. Filling it takes no write lock on either backend.
+def _stage_changes(conn, changes):
+    conn.execute(backend.REGRADE_CREATE_STAGE)
+    conn.execute(backend.REGRADE_CLEAR_STAGE)
+    backend.stage_scores(conn, changes)
+    conn.commit()
+
+
+def _set_active_scheme(conn, scheme):
+    conn.execute(backend.META_SET, (GRADING_SCHEME_KEY, scheme))
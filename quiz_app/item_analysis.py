@@ -0,0 +1,214 @@
+import functools
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from quiz_app.db import backend, begin_write, get_db_connection, read_frame
+from quiz_app.results import RESULTS_LOCK
+
+# Classical item analysis for a question bank, kept as running sums that each
+# result adds to in its own transaction, so reading it costs a few rows per
+# question however many results there are. A paper's total is the number of
+# its questions answered correctly, whatever the grading scheme.
+#   item_stats   - per question and section: papers it was on, correct answers,
+#                  and sums of the paper total, its square, and the total times
+#                  the item's score (0/1)
+#   item_choices - per question, section and option index (-1 for unanswered,
+#                  as in quiz_app.grading): times picked
+#   paper_stats  - per section and paper length: papers, and sums of the total
+#                  and its square
+# Re-grading and the first start on a database with results rebuild these
+# from quiz_responses.
+ITEM_STATS_BUILT_KEY = "item_stats_built"
+_built = set()
+
+ITEM_COLUMNS = ["Question", "Topic", "Text", "Responses", "Difficulty", "Discrimination"]
+CHOICE_COLUMNS = ["Question", "Option", "Picks", "Share", "Correct"]
+
+
+# question id -> index of the right option
+@functools.lru_cache(maxsize=8)
+def answer_keys(bank):
+    return {qid: q["options"].index(q["answer"]) for qid, q in bank.by_id.items()}
+
+
+# Add one graded paper using the caller's connection, so it commits (or rolls
+# back) together with the result. question_ids and choices are the encoded
+# responses from quiz_app.grading.
+def add_responses(conn, bank, section, question_ids, choices):
+    keys = answer_keys(bank)
+    qids, picks = question_ids.tolist(), choices.tolist()
+    correct = [int(keys.get(qid) == pick) for qid, pick in zip(qids, picks)]
+    total = sum(correct)
+    section = section or ""
+    conn.executemany(backend.ITEM_ADD, [(bank.quiz_id, section, qid, 1, x, total, total * total, x * total)
+                                    for qid, x in zip(qids, correct)])
+    conn.executemany(backend.ITEM_ADD_CHOICE, [(bank.quiz_id, section, qid, pick, 1) for qid, pick in zip(qids, picks)])
+    conn.execute(backend.ITEM_ADD_PAPER, (bank.quiz_id, section, len(qids), 1, total, total * total))
+
+
+# Sums over a set of stored papers, as rows for item_stats, item_choices and
+# paper_stats. sections has one entry per paper; lengths, question_ids and
+# choices are the papers' encoded responses (quiz_app.grading) laid end to end.
+# Marked against the bank's current answer key; questions no longer in the
+# bank count as wrong and are left out.
+def item_sums(bank, sections, lengths, question_ids, choices):
+    # Sections and question ids are numbered, so each grouping is a bincount
+    section_of, names = pd.factorize(np.array([section or "" for section in sections], dtype=object))
+    lengths = np.asarray(lengths, dtype=np.int64)
+    qids = question_ids.astype(np.int64)
+    picks = choices.astype(np.int64)
+    keys = answer_keys(bank)
+    # Right option per question id; -2 matches no pick
+    key = np.full(max(max(keys), int(qids.max(initial=0))) + 1, -2, dtype=np.int64)
+    key[list(keys)] = list(keys.values())
+    correct = (picks == key[qids]).astype(np.int64)
+    paper = np.repeat(np.arange(len(lengths)), lengths)
+    totals = np.bincount(paper, weights=correct, minlength=len(lengths)).astype(np.int64)
+
+    in_bank = key[qids] != -2
+    qids, picks, correct, paper = qids[in_bank], picks[in_bank], correct[in_bank], paper[in_bank]
+    total = totals[paper]
+    n_qids = len(key)
+    item = section_of[paper] * n_qids + qids
+    groups, responses, (right, total_sum, total_sq_sum, correct_total_sum) = _grouped(
+        item, len(names) * n_qids, correct, total, total * total, correct * total)
+    items = pd.DataFrame({"section": names[groups // n_qids], "question_id": groups % n_qids,
+                          "responses": responses, "correct": right, "total_sum": total_sum,
+                          "total_sq_sum": total_sq_sum, "correct_total_sum": correct_total_sum})
+    # Option indexes, shifted up one for unanswered (-1)
+    n_picks = int(picks.max(initial=-1)) + 2
+    groups, picked, _ = _grouped(item * n_picks + picks + 1, len(names) * n_qids * n_picks)
+    choices = pd.DataFrame({"section": names[groups // n_picks // n_qids], "question_id": groups // n_picks % n_qids,
+                            "choice": groups % n_picks - 1, "picks": picked})
+    n_lengths = int(lengths.max(initial=0)) + 1
+    groups, counts, (total_sum, total_sq_sum) = _grouped(
+        section_of * n_lengths + lengths, len(names) * n_lengths, totals, totals * totals)
+    papers = pd.DataFrame({"section": names[groups // n_lengths], "paper_length": groups % n_lengths,
+                           "papers": counts, "total_sum": total_sum, "total_sq_sum": total_sq_sum})
+    return items, choices, papers
+
+
+# The groups (numbered below size) that occur, how many entries each has, and
+# the sums of each of weights over them
+def _grouped(groups, size, *weights):
+    counts = np.bincount(groups, minlength=size)
+    present = np.flatnonzero(counts)
+    sums = [np.bincount(groups, weights=w, minlength=size)[present].astype(np.int64) for w in weights]
+    return present, counts[present], sums
+
+
+# Replace the bank's quiz sums with the given item_sums results added together.
+# The caller commits.
+def replace_item_stats(conn, bank, *sums):
+    for statement in backend.ITEM_DELETE:
+        conn.execute(statement, (bank.quiz_id,))
+    for items, choices, papers in sums:
+        conn.executemany(backend.ITEM_ADD, [(bank.quiz_id, *row) for row in items.itertuples(index=False)])
+        conn.executemany(backend.ITEM_ADD_CHOICE, [(bank.quiz_id, *row) for row in choices.itertuples(index=False)])
+        conn.executemany(backend.ITEM_ADD_PAPER, [(bank.quiz_id, *row) for row in papers.itertuples(index=False)])
+
+
+# Recompute the sums for the bank's quiz from the stored responses, against the
+# bank's current answer key. The caller commits.
+def rebuild_item_stats(bank, conn):
+    rows = conn.execute(backend.ITEM_RESPONSES, (bank.quiz_id,)).fetchall()
+    if not rows:
+        replace_item_stats(conn, bank)
+        return
+    lengths = np.fromiter((len(r[2]) for r in rows), dtype=np.int64, count=len(rows))
+    qids = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.int32)
+    picks = np.frombuffer(b"".join(r[2] for r in rows), dtype=np.int8)
+    replace_item_stats(conn, bank, item_sums(bank, [r[0] for r in rows], lengths, qids, picks))
+
+
+# Build the sums once per quiz for databases that already hold its results
+def ensure_item_stats(bank):
+    if bank.quiz_id in _built:
+        return
+    key = f"{ITEM_STATS_BUILT_KEY}:{bank.quiz_id}"
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        if not conn.execute(backend.META_GET, (key,)).fetchone():
+            rebuild_item_stats(bank, conn)
+            conn.execute(backend.META_ADD, (key, datetime.now().isoformat(sep=" ")))
+        conn.commit()
+    _built.add(bank.quiz_id)
+
+
+# Item statistics for the bank's quiz, optionally for one section. Returns
+#   items   - ITEM_COLUMNS per question answered at least once. Difficulty is
+#             the share answered correctly (p-value); Discrimination is the
+#             point-biserial correlation of the item with the rest of the
+#             paper (total minus the item), NaN when either never varies.
+#   choices - CHOICE_COLUMNS per question and option picked, with each
+#             option's share of the question's responses
+#   summary - papers, paper_length and mean_total for the most common paper
+#             length, and alpha: Cronbach's alpha (KR-20, as items score 0/1),
+#             or None with fewer than two questions or no spread in totals.
+#             When papers are drawn from a larger bank the sum of item
+#             variances is estimated from the mean variance over the bank.
+def get_item_stats(bank, section=None):
+    where, params = f" WHERE quiz_id = {backend.PARAM}", [bank.quiz_id]
+    if section:
+        where += f" AND section = {backend.PARAM}"
+        params.append(section)
+    with get_db_connection() as conn:
+        sums = read_frame(conn, backend.ITEM_SUMS.format(where=where), params)
+        picks = read_frame(conn, backend.ITEM_PICKS.format(where=where), params)
+        paper = conn.execute(backend.ITEM_PAPERS.format(where=where), params).fetchone()
+
+    n = sums["responses"].to_numpy(dtype=float)
+    c = sums["correct"].to_numpy(dtype=float)
+    total_sum = sums["total_sum"].to_numpy(dtype=float)
+    total_sq_sum = sums["total_sq_sum"].to_numpy(dtype=float)
+    correct_total_sum = sums["correct_total_sum"].to_numpy(dtype=float)
+    difficulty = c / n
+    # y = total - x, where x is the item's 0/1 score (so x * x = x)
+    rest_sum = total_sum - c
+    rest_sq_sum = total_sq_sum - 2 * correct_total_sum + c
+    cross_sum = correct_total_sum - c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        discrimination = (n * cross_sum - c * rest_sum) / np.sqrt((n * c - c * c) * (n * rest_sq_sum - rest_sum ** 2))
+    discrimination[~np.isfinite(discrimination)] = np.nan
+
+    questions = [bank.by_id.get(qid, {}) for qid in sums["question_id"]]
+    items = pd.DataFrame({
+        "Question": sums["question_id"].astype(int),
+        "Topic": [q.get("topic", "") for q in questions],
+        "Text": [q.get("question", "") for q in questions],
+        "Responses": n.astype(int),
+        "Difficulty": difficulty.round(3),
+        "Discrimination": discrimination.round(3),
+    }, columns=ITEM_COLUMNS)
+
+    keys = answer_keys(bank)
+    responses = dict(zip(items["Question"], items["Responses"]))
+    options = [_option_label(bank, qid, choice) for qid, choice in zip(picks["question_id"], picks["choice"])]
+    choices = pd.DataFrame({
+        "Question": picks["question_id"].astype(int),
+        "Option": options,
+        "Picks": picks["picks"].astype(int),
+        "Share": [round(count / responses[qid], 3) if responses.get(qid) else 0.0
+                  for qid, count in zip(picks["question_id"], picks["picks"])],
+        "Correct": [keys.get(qid) == choice for qid, choice in zip(picks["question_id"], picks["choice"])],
+    }, columns=CHOICE_COLUMNS)
+
+    summary = {"papers": 0, "paper_length": None, "mean_total": None, "alpha": None}
+    if paper:
+        length, papers, paper_total_sum, paper_total_sq_sum = paper
+        mean_total = paper_total_sum / papers
+        total_variance = paper_total_sq_sum / papers - mean_total ** 2
+        summary.update(papers=papers, paper_length=length, mean_total=mean_total)
+        if length > 1 and total_variance > 0 and n.sum():
+            item_variance = float((n * difficulty * (1 - difficulty)).sum() / n.sum())
+            summary["alpha"] = length / (length - 1) * (1 - length * item_variance / total_variance)
+    return items, choices, summary
+
+
+def _option_label(bank, qid, choice):
+    options = bank.by_id.get(qid, {}).get("options", [])
+    if 0 <= choice < len(options):
+        return options[choice]
+    return "(unanswered)" if choice < 0 else f"(option {choice + 1})"
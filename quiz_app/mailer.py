@@ -0,0 +1,225 @@
+import os
+import smtplib
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+from quiz_app import metrics
+from quiz_app.db import backend, get_db_connection
+
+# Email configuration (point QUIZ_SMTP_HOST/PORT at a local debugging server
+# such as `python -m aiosmtpd -n -l localhost:8025` with QUIZ_SMTP_STARTTLS=0)
+SMTP_SERVER = os.environ.get("QUIZ_SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("QUIZ_SMTP_PORT", "587"))
+SMTP_STARTTLS = os.environ.get("QUIZ_SMTP_STARTTLS", "1") == "1"
+EMAIL_SENDER = os.environ.get("QUIZ_EMAIL_SENDER", "")
+EMAIL_PASSWORD = os.environ.get("QUIZ_EMAIL_PASSWORD", "")  # App Password
+# smtplib needs a parseable envelope sender even when no account is configured
+EMAIL_FROM = EMAIL_SENDER or "no-reply@localhost"
+
+# Outbox worker tuning
+EMAIL_BATCH_SIZE = 20
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BASE_SECONDS = 5
+EMAIL_RETRY_MAX_SECONDS = 600
+SMTP_IDLE_SECONDS = 60
+WORKER_POLL_SECONDS = 5
+# A message left in 'sending' this long (worker died mid-send) is retried
+STALE_CLAIM_SECONDS = 300
+# Bodies can hold one-time codes and passwords: they are blanked once a message
+# is sent or given up on, and the rows deleted after EMAIL_RETENTION_SECONDS
+EMAIL_RETENTION_SECONDS = int(os.environ.get("QUIZ_EMAIL_RETENTION_SECONDS", "86400"))
+PURGE_INTERVAL_SECONDS = 300
+
+
+# Queue a message in the durable outbox. Messages sharing a dedup_key are only
+# sent once; a message with expires_at is dropped if it could not be sent by
+# then. Returns False when the message was a duplicate.
+def queue_email(to_addr, subject, body, dedup_key=None, expires_at=None):
+    now = time.time()
+    with get_db_connection() as conn:
+        cur = conn.execute(backend.MAIL_QUEUE, (dedup_key, to_addr, subject, body, now, now, expires_at))
+        conn.commit()
+    queued = cur.rowcount == 1
+    if queued:
+        metrics.inc("emails_queued")
+        start_email_worker().wake()
+    return queued
+
+
+# Queue (to_addr, subject, body) messages using the caller's connection, so
+# they commit together with the change that caused them; wake the worker
+# (start_email_worker().wake()) after committing
+def add_emails(conn, messages):
+    now = time.time()
+    conn.executemany(backend.MAIL_QUEUE, [(None, to_addr, subject, body, now, now, None) for to_addr, subject, body in messages])
+    metrics.inc("emails_queued", len(messages))
+
+
+def _retry_delay(attempts):
+    return min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS)
+
+
+# The SMTP server could not be reached or refused the login: nothing in the
+# batch can be sent, and no message is to blame
+class _SmtpUnavailable(Exception):
+    pass
+
+
+class EmailWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(name="email-outbox", daemon=True)
+        self._wakeup = threading.Event()
+        self._smtp = None
+        self._smtp_last_used = 0.0
+        self._last_purge = 0.0
+        # Consecutive failures to reach the server; no batch is claimed before
+        # paused_until
+        self._outages = 0
+        self._paused_until = 0.0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            try:
+                sent_any = time.time() >= self._paused_until and self.process_batch()
+            except Exception:
+                metrics.inc("email_worker_errors")
+                sent_any = False
+            if time.time() - self._last_purge > PURGE_INTERVAL_SECONDS:
+                try:
+                    purge_outbox()
+                    self._last_purge = time.time()
+                except Exception:
+                    metrics.inc("email_worker_errors")
+            if not sent_any:
+                if self._smtp is not None and time.time() - self._smtp_last_used > SMTP_IDLE_SECONDS:
+                    self._close_smtp()
+                self._wakeup.wait(WORKER_POLL_SECONDS)
+                self._wakeup.clear()
+
+    # Claim due messages so a second worker process can't send them too
+    def _claim_batch(self):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with get_db_connection() as conn:
+            conn.execute(backend.MAIL_RECLAIM, (now - STALE_CLAIM_SECONDS,))
+            conn.execute(backend.MAIL_EXPIRE, (now,))
+            conn.execute(backend.MAIL_CLAIM, (token, now, now, EMAIL_BATCH_SIZE))
+            conn.commit()
+            return conn.execute(backend.MAIL_CLAIMED, (token,)).fetchall()
+
+    def process_batch(self):
+        batch = self._claim_batch()
+        for i, (msg_id, to_addr, subject, body, attempts) in enumerate(batch):
+            msg = EmailMessage()
+            msg.set_content(body)
+            msg['Subject'] = subject
+            msg['From'] = EMAIL_FROM
+            msg['To'] = to_addr
+            try:
+                with metrics.timer("smtp_send"):
+                    self._send(msg)
+            except _SmtpUnavailable:
+                # Hand the rest back untouched and back off the whole worker
+                self._release([row[0] for row in batch[i:]])
+                self._outages += 1
+                self._paused_until = time.time() + _retry_delay(self._outages)
+                metrics.inc("smtp_unavailable")
+                return False
+            except Exception as e:
+                self._mark_failed(msg_id, attempts + 1, e)
+            else:
+                metrics.inc("emails_sent")
+                self._mark_sent(msg_id)
+            self._outages = 0
+        return bool(batch)
+
+    # Reuse one authenticated connection for the whole batch and beyond
+    def _send(self, msg):
+        if self._smtp is not None:
+            try:
+                self._smtp.send_message(msg)
+                self._smtp_last_used = time.time()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused):
+                raise
+            except Exception:
+                self._close_smtp()
+        try:
+            self._smtp = self._connect()
+        except OSError as e:
+            raise _SmtpUnavailable(e) from e
+        self._smtp.send_message(msg)
+        self._smtp_last_used = time.time()
+
+    def _connect(self):
+        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+        try:
+            if SMTP_STARTTLS:
+                server.starttls()
+            if EMAIL_SENDER and EMAIL_PASSWORD:
+                server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _close_smtp(self):
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _mark_sent(self, msg_id):
+        with get_db_connection() as conn:
+            conn.execute(backend.MAIL_SENT, (time.time(), msg_id))
+            conn.commit()
+
+    # Back to pending, due now, without counting an attempt
+    def _release(self, msg_ids):
+        with get_db_connection() as conn:
+            conn.executemany(backend.MAIL_RELEASE, [(msg_id,) for msg_id in msg_ids])
+            conn.commit()
+
+    def _mark_failed(self, msg_id, attempts, error):
+        status = 'failed' if attempts >= EMAIL_MAX_ATTEMPTS else 'pending'
+        with get_db_connection() as conn:
+            conn.execute(backend.MAIL_RETRY,
+                         (status, attempts, time.time() + _retry_delay(attempts), str(error), msg_id))
+            if status == 'failed':
+                conn.execute(backend.MAIL_BLANK, (msg_id,))
+            conn.commit()
+
+
+# Blank the bodies of finished messages (including rows finished before bodies
+# were blanked on send) and delete those older than the retention window
+def purge_outbox(retention=EMAIL_RETENTION_SECONDS):
+    cutoff = time.time() - retention
+    with get_db_connection() as conn:
+        conn.execute(backend.MAIL_BLANK_FINISHED)
+        cur = conn.execute(backend.MAIL_PURGE, (cutoff, cutoff))
+        conn.commit()
+    if cur.rowcount:
+        metrics.inc("emails_purged", cur.rowcount)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# One background sender per process
+def start_email_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = EmailWorker()
+                _worker.start()
+    return _worker
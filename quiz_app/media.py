@@ -0,0 +1,51 @@
+import os
+import time
+
+from quiz_app.db import backend, get_db_connection
+
+# Where recorded segments, their thumbnails and contact sheets are served from:
+#   local    - the files on this server's disk; several replicas need RECORDING_DIR
+#              on a shared volume
+#   database - each finished file is also copied into media_objects, so any
+#              replica serves it from the shared database
+# Files are always written locally first and keep their local path as their
+# key, so replicas should share the same QUIZ_RECORDING_DIR setting (the
+# default, a relative "recordings", is the same everywhere).
+MEDIA_STORES = ["local", "database"]
+MEDIA_STORE = os.environ.get("QUIZ_MEDIA_STORE", "local")
+
+
+def _in_database():
+    if MEDIA_STORE not in MEDIA_STORES:
+        raise ValueError(f"Unknown media store: {MEDIA_STORE}")
+    return MEDIA_STORE == "database"
+
+
+# Make a finished file available to every replica
+def publish(path):
+    if not _in_database():
+        return
+    with open(path, "rb") as f:
+        data = f.read()
+    with get_db_connection() as conn:
+        conn.execute(backend.MEDIA_PUT, (path, data, len(data), time.time()))
+        conn.commit()
+
+
+# Contents of a file, or None when it is not available
+def read(path):
+    if _in_database():
+        with get_db_connection() as conn:
+            row = conn.execute(backend.MEDIA_GET, (path,)).fetchone()
+        return bytes(row[0]) if row else None
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def published_paths():
+    if not _in_database():
+        return set()
+    with get_db_connection() as conn:
+        return {row[0] for row in conn.execute(backend.MEDIA_PATHS)}
@@ -0,0 +1,170 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Timers and counters for the hot paths, labelled by operation and by the menu
+# page of the rerun that caused them. Everything lives in process memory;
+# render_prometheus() gives the text exposition format, and if QUIZ_METRICS_FILE
+# is set a background thread writes it there ("{pid}" in the path is replaced
+# by the process id, for deployments running several server processes).
+METRICS_FILE = os.environ.get("QUIZ_METRICS_FILE", "")
+METRICS_WRITE_SECONDS = 15
+
+# Upper bounds in seconds (Prometheus histogram "le" buckets)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# Work done outside a script rerun (email worker, proctoring, sweepers)
+BACKGROUND = "background"
+_page = contextvars.ContextVar("quiz_page", default=BACKGROUND)
+
+
+def set_page(page):
+    _page.set(page)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+    # Estimated quantile, interpolated inside the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if BUCKETS[i] != float("inf") else lower
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-2]
+
+    def copy(self):
+        h = Histogram()
+        h.counts, h.sum, h.count = list(self.counts), self.sum, self.count
+        return h
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, op, seconds, page=None):
+        key = (op, page or _page.get())
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+            h.observe(seconds)
+
+    def inc(self, name, amount=1, page=None):
+        key = (name, page or _page.get())
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return ({key: h.copy() for key, h in self.histograms.items()}, dict(self.counters))
+
+
+registry = Registry()
+observe = registry.observe
+inc = registry.inc
+
+
+@contextmanager
+def timer(op):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.inc(f"{op}_errors")
+        raise
+    finally:
+        registry.observe(op, time.perf_counter() - started)
+
+
+def timed(op):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _labels(op_key, op, page):
+    return '{%s="%s",page="%s"}' % (op_key, op.replace('"', "'"), page.replace('"', "'"))
+
+
+def render_prometheus():
+    histograms, counters = registry.snapshot()
+    lines = ["# HELP quiz_operation_seconds Time spent per operation and page",
+             "# TYPE quiz_operation_seconds histogram"]
+    for (op, page), h in sorted(histograms.items()):
+        labels = _labels("op", op, page)[:-1]
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'quiz_operation_seconds_bucket{labels},le="{le}"}} {cumulative}')
+        lines.append(f"quiz_operation_seconds_sum{labels}}} {h.sum:.6f}")
+        lines.append(f"quiz_operation_seconds_count{labels}}} {h.count}")
+    lines += ["# HELP quiz_events_total Counted events per page", "# TYPE quiz_events_total counter"]
+    for (name, page), value in sorted(counters.items()):
+        lines.append(f"quiz_events_total{_labels('name', name, page)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    path = path.replace("{pid}", str(os.getpid()))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _write_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_metrics_file(path)
+        except OSError:
+            pass
+
+
+# One writer thread per process, only when a metrics file is configured
+def start_metrics_writer(path=METRICS_FILE, interval=METRICS_WRITE_SECONDS):
+    global _writer
+    if not path:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, args=(path, interval), name="metrics-writer",
+                                           daemon=True)
+                _writer.start()
+    return _writer
@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from quiz_app import metrics
+from quiz_app.db import backend, begin_write, get_db_connection
+from quiz_app.mailer import queue_email
+
+# One-time codes for email verification, kept in the database (otp_codes)
+# rather than in the browser session, so every server process sees them and a
+# code still works after a reconnect. Only a hash of each code is stored; the
+# code itself is in the email outbox only until the message is sent, or
+# dropped unsent when the code expires. A code is good for OTP_TTL_SECONDS
+# and OTP_MAX_ATTEMPTS guesses, and is used up on success.
+OTP_DIGITS = 6
+OTP_TTL_SECONDS = int(os.environ.get("QUIZ_OTP_TTL_SECONDS", "600"))
+OTP_MAX_ATTEMPTS = 5
+# Per email and purpose: minimum gap between sends, and sends per window
+OTP_RESEND_SECONDS = int(os.environ.get("QUIZ_OTP_RESEND_SECONDS", "60"))
+OTP_SEND_WINDOW_SECONDS = 3600
+OTP_MAX_SENDS_PER_WINDOW = 5
+
+REGISTRATION = "registration"
+PASSWORD_RESET = "password_reset"
+
+_SUBJECTS = {
+    REGISTRATION: "Email Verification OTP - Secure Quiz App",
+    PASSWORD_RESET: "Password Reset OTP - Secure Quiz App",
+}
+
+
+class OtpThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many codes requested, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+# No live code: none was sent, it expired, or it ran out of attempts
+class OtpExpired(Exception):
+    pass
+
+
+def _code_hash(purpose, email, code):
+    return hashlib.sha256(f"{purpose}\0{email}\0{code}".encode()).hexdigest()
+
+
+def _normalize(email):
+    return email.strip().lower()
+
+
+# Create a code for (purpose, email), remember payload with it (returned by
+# verify_otp) and queue the email; the outbox worker sends it in the background.
+# Raises OtpThrottled when the email asked for a code too recently or too often.
+@metrics.timed("issue_otp")
+def issue_otp(purpose, email, payload=None):
+    email = _normalize(email)
+    code = f"{secrets.randbelow(10 ** OTP_DIGITS):0{OTP_DIGITS}d}"
+    now = time.time()
+    with get_db_connection() as conn:
+        begin_write(conn, f"otp:{purpose}:{email}")
+        # Rows are kept past expiry for the length of the send window, so the
+        # throttle still sees them
+        conn.execute(backend.OTP_PRUNE, (now - OTP_SEND_WINDOW_SECONDS,))
+        row = conn.execute(backend.OTP_SENDS, (purpose, email)).fetchone()
+        sends, window_start = 0, now
+        if row is not None:
+            sends, window_start, last_sent_at = row
+            if now - window_start >= OTP_SEND_WINDOW_SECONDS:
+                sends, window_start = 0, now
+            retry_after = 0
+            if now - last_sent_at < OTP_RESEND_SECONDS:
+                retry_after = last_sent_at + OTP_RESEND_SECONDS - now
+            elif sends >= OTP_MAX_SENDS_PER_WINDOW:
+                retry_after = window_start + OTP_SEND_WINDOW_SECONDS - now
+            if retry_after:
+                conn.rollback()
+                metrics.inc("otp_throttled")
+                raise OtpThrottled(int(retry_after) + 1)
+        conn.execute(backend.OTP_PUT,
+                     (purpose, email, _code_hash(purpose, email, code), json.dumps(payload),
+                      now + OTP_TTL_SECONDS, sends + 1, window_start, now))
+        conn.commit()
+    queue_email(email, _SUBJECTS.get(purpose, _SUBJECTS[REGISTRATION]),
+                f"Your OTP for Secure Quiz App is: {code}\n\nIt expires in {OTP_TTL_SECONDS // 60} minutes.",
+                expires_at=now + OTP_TTL_SECONDS)
+    metrics.inc("otp_issued")
+    return now + OTP_TTL_SECONDS
+
+
+# True while (purpose, email) has a code that can still be used
+def otp_pending(purpose, email):
+    with get_db_connection() as conn:
+        row = conn.execute(backend.OTP_PENDING,
+                           (purpose, _normalize(email), time.time(), OTP_MAX_ATTEMPTS)).fetchone()
+    return row is not None
+
+
+# Check a code. Returns the payload given to issue_otp ({} if there was none)
+# and uses the code up; returns None for a wrong code, which costs one attempt.
+# Raises OtpExpired when there is no live code to check against.
+@metrics.timed("verify_otp")
+def verify_otp(purpose, email, code):
+    email = _normalize(email)
+    with get_db_connection() as conn:
+        begin_write(conn, f"otp:{purpose}:{email}")
+        row = conn.execute(backend.OTP_GET, (purpose, email)).fetchone()
+        if row is None or row[0] is None or row[2] <= time.time() or row[3] >= OTP_MAX_ATTEMPTS:
+            conn.rollback()
+            raise OtpExpired()
+        code_hash, payload, _, attempts = row
+        if hmac.compare_digest(code_hash, _code_hash(purpose, email, code.strip())):
+            # Used up; the row stays (without the code) for the resend throttle
+            conn.execute(backend.OTP_USE, (purpose, email))
+            conn.commit()
+            metrics.inc("otp_verified")
+            return json.loads(payload) or {}
+        conn.execute(backend.OTP_MISS, (purpose, email))
+        conn.commit()
+    metrics.inc("otp_rejected")
+    return None
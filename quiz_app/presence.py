@@ -0,0 +1,68 @@
+import time
+
+from quiz_app import metrics
+from quiz_app.db import backend, get_db_connection
+from quiz_app.events import JOIN, LEAVE, add_event
+
+# A student counts as live while their quiz page keeps sending heartbeats
+HEARTBEAT_SECONDS = 15
+PRESENCE_TTL_SECONDS = 60
+
+
+# Active student tracking (one row per student, keyed by username)
+def add_active_student(username, section=""):
+    now = time.time()
+    with get_db_connection() as conn:
+        conn.execute(backend.PRESENCE_JOIN, (username, section, now, now))
+        add_event(conn, JOIN, username, section)
+        conn.commit()
+
+
+# Refresh the student's row. Returns False when there is none (expired, or
+# removed when the attempt was finalized); joining again is up to the caller.
+@metrics.timed("presence_heartbeat")
+def heartbeat(username):
+    with get_db_connection() as conn:
+        cur = conn.execute(backend.PRESENCE_HEARTBEAT, (time.time(), username))
+        conn.commit()
+    return cur.rowcount > 0
+
+
+def remove_active_student(username):
+    with get_db_connection() as conn:
+        cur = conn.execute(backend.PRESENCE_LEAVE, (username,))
+        if cur.rowcount:
+            add_event(conn, LEAVE, username)
+        conn.commit()
+
+
+# Drop students whose tab stopped sending heartbeats
+def expire_stale_students(ttl=PRESENCE_TTL_SECONDS):
+    cutoff = time.time() - ttl
+    with get_db_connection() as conn:
+        stale = [r[0] for r in conn.execute(backend.PRESENCE_STALE, (cutoff,))]
+        if stale:
+            conn.execute(backend.PRESENCE_EXPIRE, (cutoff,))
+            for username in stale:
+                add_event(conn, LEAVE, username, reason="timeout")
+            conn.commit()
+    return len(stale)
+
+
+def get_live_students():
+    expire_stale_students()
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.PRESENCE_LIVE).fetchall()
+    return [r[0] for r in rows]
+
+
+def get_active_students():
+    expire_stale_students()
+    with get_db_connection() as conn:
+        return dict(conn.execute(backend.PRESENCE_LIVE).fetchall())
+
+
+def get_section_counts():
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.PRESENCE_SECTION_COUNTS).fetchall()
+    return {section: count for section, count in rows}
@@ -0,0 +1,235 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from quiz_app import metrics
+from quiz_app.db import backend, get_db_connection
+from quiz_app.events import FLAG, add_event
+
+log = logging.getLogger(__name__)
+
+# Frames analysed per student per second; the rest of the stream is never looked at
+ANALYSIS_FPS = float(os.environ.get("QUIZ_ANALYSIS_FPS", "1"))
+ANALYSIS_WORKERS = int(os.environ.get("QUIZ_ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+ANALYSIS_BATCH_SIZE = 16
+# Frames waiting for analysis, split evenly between the workers
+ANALYSIS_QUEUE_SIZE = 256
+ANALYSIS_WIDTH = 320
+ANALYSIS_HEIGHT = 240
+# Mean absolute grey-level change between two samples that counts as large motion
+MOTION_THRESHOLD = 30.0
+# Nose offset from the eye midpoint, relative to eye distance, that counts as looking away
+YAW_THRESHOLD = 0.35
+# The same flag is recorded at most once per cooldown per student
+FLAG_COOLDOWN_SECONDS = 30
+# Flags that could not be written are retried this often, with the worker's
+# next batch if one comes sooner; past MAX_UNSAVED_FLAGS the oldest are dropped
+FLAG_RETRY_SECONDS = 5
+MAX_UNSAVED_FLAGS = 1000
+# OpenCV 5 no longer ships the Haar cascades; point this at a YuNet ONNX model
+# (face_detection_yunet_*.onnx from opencv_zoo) to keep face checks on there
+FACE_MODEL_PATH = os.environ.get("QUIZ_FACE_MODEL", "")
+
+FLAG_KINDS = {
+    "no_face": "No face in view",
+    "multiple_faces": "More than one face in view",
+    "looking_away": "Looking away from the screen",
+    "large_motion": "Large movement",
+}
+
+
+# Face detection backends. detect() returns (face_count, looking_away).
+class HaarFaceDetector:
+    def __init__(self):
+        self.frontal = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.profile = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_profileface.xml")
+
+    def detect(self, bgr, gray):
+        faces = self.frontal.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(30, 30))
+        if len(faces):
+            return len(faces), False
+        # A profile face but no frontal one: the student has turned their head
+        profiles = self.profile.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5, minSize=(30, 30))
+        if len(profiles) == 0:
+            profiles = self.profile.detectMultiScale(cv2.flip(gray, 1), scaleFactor=1.2, minNeighbors=5,
+                                                     minSize=(30, 30))
+        return len(profiles), len(profiles) > 0
+
+
+class YuNetFaceDetector:
+    def __init__(self, model_path):
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (ANALYSIS_WIDTH, ANALYSIS_HEIGHT))
+
+    def detect(self, bgr, gray):
+        _, faces = self.detector.detect(bgr)
+        if faces is None:
+            return 0, False
+        # Landmarks: right eye (4,5), left eye (6,7), nose tip (8,9)
+        face = faces[0]
+        eye_mid_x = (face[4] + face[6]) / 2
+        eye_dist = abs(face[6] - face[4]) or 1.0
+        return len(faces), abs(face[8] - eye_mid_x) / eye_dist > YAW_THRESHOLD
+
+
+def make_face_detector():
+    if FACE_MODEL_PATH and os.path.exists(FACE_MODEL_PATH):
+        return YuNetFaceDetector(FACE_MODEL_PATH)
+    if hasattr(cv2, "CascadeClassifier") and os.path.exists(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"):
+        return HaarFaceDetector()
+    # No detector available: only the motion check runs
+    return None
+
+
+def record_flags(events):
+    if not events:
+        return
+    with get_db_connection() as conn:
+        conn.executemany(backend.FLAG_ADD, events)
+        for username, attempt_no, kind, detail, ts in events:
+            add_event(conn, FLAG, username, attempt_no=attempt_no, flag=kind, detail=detail)
+        conn.commit()
+    metrics.inc("proctor_flags", len(events))
+
+
+def recent_flags(limit=50):
+    with get_db_connection() as conn:
+        return conn.execute(backend.FLAG_RECENT, (limit,)).fetchall()
+
+
+def flag_counts(since=0):
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.FLAG_COUNTS, (since,)).fetchall()
+    return dict(rows)
+
+
+# One shared pool for every webcam session in the process. Each worker has its
+# own queue, and a student's frames always go to the same one (by a hash of
+# username and attempt), so they are analysed one at a time and in the order
+# they were taken: the motion check compares each sample with the one before.
+# A worker takes frames off in batches and writes the resulting flags in one
+# transaction per batch.
+class FrameAnalyzer:
+    def __init__(self, workers=ANALYSIS_WORKERS):
+        self.queues = [queue.Queue(maxsize=max(1, ANALYSIS_QUEUE_SIZE // workers)) for _ in range(workers)]
+        self.dropped = 0
+        self._state = {}
+        self._state_lock = threading.Lock()
+        self._local = threading.local()
+        for i, frames in enumerate(self.queues):
+            threading.Thread(target=self._run, args=(frames,), name=f"proctor-{i}", daemon=True).start()
+
+    def submit(self, username, attempt_no, frame):
+        frames = self.queues[hash((username, attempt_no)) % len(self.queues)]
+        try:
+            frames.put_nowait((username, attempt_no, frame, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("proctor_frames_dropped")
+
+    def _run(self, frames):
+        # cv2 detectors are not shared between threads
+        self._local.detector = make_face_detector()
+        # Flags found but not yet written
+        unsaved = []
+        while True:
+            batch = []
+            try:
+                batch.append(frames.get(timeout=FLAG_RETRY_SECONDS if unsaved else None))
+                while len(batch) < ANALYSIS_BATCH_SIZE:
+                    batch.append(frames.get_nowait())
+            except queue.Empty:
+                pass
+            started = time.perf_counter()
+            for username, attempt_no, frame, ts in batch:
+                try:
+                    unsaved.extend(self._analyze(username, attempt_no, frame, ts))
+                except Exception:
+                    metrics.inc("proctor_errors")
+                    log.exception("Analysing a frame of %s (attempt %s) failed", username, attempt_no)
+            if batch:
+                metrics.observe("proctor_batch", time.perf_counter() - started)
+            if not unsaved:
+                continue
+            try:
+                record_flags(unsaved)
+                unsaved = []
+            except Exception:
+                metrics.inc("proctor_errors")
+                log.exception("Writing %d proctoring flags failed; will retry", len(unsaved))
+                if len(unsaved) > MAX_UNSAVED_FLAGS:
+                    metrics.inc("proctor_flags_dropped", len(unsaved) - MAX_UNSAVED_FLAGS)
+                    unsaved = unsaved[-MAX_UNSAVED_FLAGS:]
+
+    def _analyze(self, username, attempt_no, frame, ts):
+        bgr = frame.reformat(width=ANALYSIS_WIDTH, height=ANALYSIS_HEIGHT).to_ndarray(format="bgr24")
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        key = (username, attempt_no)
+        with self._state_lock:
+            state = self._state.setdefault(key, {"prev": None, "last_flag": {}})
+            prev, state["prev"] = state["prev"], gray
+
+        found = []
+        detector = self._local.detector
+        if detector is not None:
+            faces, looking_away = detector.detect(bgr, gray)
+            if faces == 0:
+                found.append(("no_face", ""))
+            elif faces > 1:
+                found.append(("multiple_faces", f"{faces} faces"))
+            elif looking_away:
+                found.append(("looking_away", ""))
+        if prev is not None:
+            motion = float(np.mean(cv2.absdiff(gray, prev)))
+            if motion > MOTION_THRESHOLD:
+                found.append(("large_motion", f"mean change {motion:.0f}"))
+
+        events = []
+        with self._state_lock:
+            for kind, detail in found:
+                if ts - state["last_flag"].get(kind, 0) >= FLAG_COOLDOWN_SECONDS:
+                    state["last_flag"][kind] = ts
+                    events.append((username, attempt_no, kind, detail, ts))
+        return events
+
+    def end_session(self, username, attempt_no):
+        with self._state_lock:
+            self._state.pop((username, attempt_no), None)
+
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_frame_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = FrameAnalyzer()
+    return _analyzer
+
+
+# Per-session sampler used from the webrtc callback: passes on at most
+# ANALYSIS_FPS frames per second and never blocks.
+class ProctorFeed:
+    def __init__(self, username, attempt_no):
+        self.username = username
+        self.attempt_no = attempt_no
+        self.analyzer = get_frame_analyzer()
+        self._next_sample_at = 0.0
+
+    def submit(self, frame):
+        now = time.monotonic()
+        if now < self._next_sample_at:
+            return
+        self._next_sample_at = now + 1.0 / ANALYSIS_FPS
+        self.analyzer.submit(self.username, self.attempt_no, frame)
+
+    def close(self):
+        self.analyzer.end_session(self.username, self.attempt_no)
@@ -0,0 +1,79 @@
+import functools
+import json
+import os
+import random
+import secrets
+import threading
+
+# Each question: {"id", "topic", "difficulty", "question", "options", "answer"}
+# plus an optional "credit" map of option -> fraction used by partial-credit grading.
+QUESTION_BANK_FILE = os.environ.get(
+    "QUIZ_QUESTION_BANK", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "question_bank.json"))
+# Questions drawn for each student (capped at the size of the bank)
+PAPER_SIZE = int(os.environ.get("QUIZ_PAPER_SIZE", "5"))
+
+
+class QuestionBank:
+    def __init__(self, quiz_id, questions):
+        self.quiz_id = quiz_id
+        self.by_id = {}
+        self.by_topic = {}
+        self.by_difficulty = {}
+        for q in questions:
+            if q["id"] in self.by_id:
+                raise ValueError(f"Duplicate question id {q['id']}")
+            if q["answer"] not in q["options"]:
+                raise ValueError(f"Answer for question {q['id']} is not one of its options")
+            self.by_id[q["id"]] = q
+            self.by_topic.setdefault(q.get("topic", ""), []).append(q["id"])
+            self.by_difficulty.setdefault(q.get("difficulty", ""), []).append(q["id"])
+        self._all_ids = sorted(self.by_id)
+        self.paper_ids = functools.lru_cache(maxsize=4096)(self._paper_ids)
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def paper_size(self):
+        return min(PAPER_SIZE, len(self.by_id))
+
+    # The same seed always gives the same paper from the same bank. Adding or
+    # removing a question changes the paper of every seed, so attempts keep the
+    # ids they were given (quiz_app.attempts) rather than their seed.
+    def _paper_ids(self, seed, size=None, topic=None, difficulty=None):
+        pool = self._all_ids
+        if topic:
+            pool = sorted(set(pool) & set(self.by_topic.get(topic, [])))
+        if difficulty:
+            pool = sorted(set(pool) & set(self.by_difficulty.get(difficulty, [])))
+        size = min(size or self.paper_size(), len(pool))
+        return tuple(random.Random(seed).sample(pool, size))
+
+    def paper(self, seed, size=None, topic=None, difficulty=None):
+        return [self.by_id[qid] for qid in self.paper_ids(seed, size, topic, difficulty)]
+
+
+def new_paper_seed():
+    return secrets.randbits(31)
+
+
+def load_question_bank(path=QUESTION_BANK_FILE):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return QuestionBank(data.get("quiz_id", "default"), data["questions"])
+
+
+_bank = None
+_bank_mtime = None
+_bank_lock = threading.Lock()
+
+
+# Parsed once per process; reloaded only when the bank file changes on disk
+def get_question_bank():
+    global _bank, _bank_mtime
+    mtime = os.stat(QUESTION_BANK_FILE).st_mtime_ns
+    if _bank is None or mtime != _bank_mtime:
+        with _bank_lock:
+            if _bank is None or mtime != _bank_mtime:
+                _bank = load_question_bank()
+                _bank_mtime = mtime
+    return _bank
@@ -0,0 +1,120 @@
+import os
+import queue
+import re
+import threading
+import time
+from fractions import Fraction
+
+import av
+
+from quiz_app import metrics
+
+RECORDING_DIR = os.environ.get("QUIZ_RECORDING_DIR", "recordings")
+# Recordings are downscaled and frame-rate limited; proctoring doesn't need full webcam quality
+RECORD_WIDTH = int(os.environ.get("QUIZ_RECORD_WIDTH", "320"))
+RECORD_HEIGHT = int(os.environ.get("QUIZ_RECORD_HEIGHT", "240"))
+RECORD_FPS = int(os.environ.get("QUIZ_RECORD_FPS", "5"))
+SEGMENT_SECONDS = int(os.environ.get("QUIZ_RECORD_SEGMENT_SECONDS", "60"))
+# Frames waiting for the encoder; when full, new frames are dropped rather than blocking the stream
+FRAME_QUEUE_SIZE = 64
+
+
+def _safe_name(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value))
+
+
+def segment_path(username, attempt_no, segment_no):
+    return os.path.join(RECORDING_DIR, f"{_safe_name(username)}_attempt{attempt_no}_seg{segment_no:03d}.mp4")
+
+
+def _open_encoder(path):
+    container = av.open(path, mode="w", format="mp4")
+    try:
+        stream = container.add_stream("libx264", rate=RECORD_FPS)
+        stream.options = {"preset": "veryfast", "tune": "zerolatency"}
+    except Exception:
+        # ffmpeg builds without x264
+        stream = container.add_stream("mpeg4", rate=RECORD_FPS)
+    stream.width = RECORD_WIDTH
+    stream.height = RECORD_HEIGHT
+    stream.pix_fmt = "yuv420p"
+    stream.time_base = Fraction(1, RECORD_FPS)
+    return container, stream
+
+
+# Records one student's attempt as a series of MP4 segments. submit() is called
+# from the webrtc callback and only ever does a non-blocking queue put; scaling
+# and encoding happen on the recorder's own thread.
+class SegmentRecorder:
+    def __init__(self, username, attempt_no, on_segment_closed=None, first_segment=1):
+        self.username = username
+        self.attempt_no = attempt_no
+        self.first_segment = first_segment
+        self.on_segment_closed = on_segment_closed
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.dropped = 0
+        self._next_frame_at = 0.0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{username}", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        now = time.monotonic()
+        if now < self._next_frame_at:
+            return
+        self._next_frame_at = now + 1.0 / RECORD_FPS
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("recording_frames_dropped")
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        os.makedirs(RECORDING_DIR, exist_ok=True)
+        frames_per_segment = SEGMENT_SECONDS * RECORD_FPS
+        segment_no = self.first_segment - 1
+        container = stream = None
+        part_path = final_path = None
+        pts = 0
+        while True:
+            try:
+                frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+
+            if container is None:
+                segment_no += 1
+                final_path = segment_path(self.username, self.attempt_no, segment_no)
+                part_path = final_path + ".part"
+                container, stream = _open_encoder(part_path)
+                pts = 0
+
+            scaled = frame.reformat(width=RECORD_WIDTH, height=RECORD_HEIGHT, format="yuv420p")
+            scaled.pts = pts
+            # Not stream.time_base: the muxer changes that once the header is written
+            scaled.time_base = Fraction(1, RECORD_FPS)
+            pts += 1
+            for packet in stream.encode(scaled):
+                container.mux(packet)
+
+            if pts >= frames_per_segment:
+                self._close_segment(container, stream, part_path, final_path, pts)
+                container = None
+
+        if container is not None:
+            self._close_segment(container, stream, part_path, final_path, pts)
+
+    def _close_segment(self, container, stream, part_path, final_path, frame_count):
+        with metrics.timer("recording_segment_close"):
+            for packet in stream.encode():
+                container.mux(packet)
+            container.close()
+        # Only finished segments get the .mp4 name the recordings page looks for
+        os.replace(part_path, final_path)
+        if self.on_segment_closed is not None:
+            self.on_segment_closed(self, final_path, frame_count / RECORD_FPS)
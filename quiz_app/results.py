@@ -0,0 +1,395 @@
+import csv
+import glob
+import io
+import os
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+from quiz_app import metrics
+from quiz_app.db import backend, begin_write, get_db_connection, read_frame
+from quiz_app.events import SUBMISSION, add_event
+
+# Column names used by the CSV files this store replaces
+RESULT_COLUMNS = ["Username", "Hashed_Password", "USN", "Section", "Score", "Time_Taken", "Timestamp"]
+
+# quiz_id of results saved before results were partitioned by quiz
+LEGACY_QUIZ_ID = "legacy"
+
+# Results saved before pass/fail was stored come from the original
+# two-question quiz, where 1 mark was a pass
+LEGACY_PASS_MARK = 1
+
+CSV_MIGRATION_KEY = "csv_results_migrated"
+STATS_BUILT_KEY = "result_partitions_built"
+# Bumped on every change to quiz_results; used as the cache key for dashboards
+RESULTS_VERSION_KEY = "results_version"
+# Bumped only when existing rows are rewritten (re-grades), not when rows are
+# appended; readers that copy results incrementally rebuild when it moves
+RESULTS_GENERATION_KEY = "results_generation"
+# begin_write key: submissions hold it shared, rebuilds of the aggregates over
+# them (partitions, item sums, re-grades) exclusively
+RESULTS_LOCK = "quiz_results"
+_csv_migrated = False
+_stats_built = False
+
+# Newest submissions kept in memory for the monitoring view
+RECENT_BUFFER_SIZE = 50
+_recent = deque(maxlen=RECENT_BUFFER_SIZE)
+_recent_version = None
+_recent_lock = threading.Lock()
+
+
+def _bump_counter(conn, key):
+    row = conn.execute(backend.META_BUMP, (key,)).fetchone()
+    return int(row[0])
+
+
+def _bump_results_version(conn):
+    return _bump_counter(conn, RESULTS_VERSION_KEY)
+
+
+# Save one quiz submission (single-row insert, no rewrite of older results).
+# The section aggregates and, when given, the encoded responses (see
+# quiz_app.grading) are written in the same transaction. Returns the result ID.
+# Pass conn to make the save part of a larger transaction: the caller then
+# commits, and the return value is (result ID, recent entry), the entry to hand
+# to push_recent once the commit has succeeded.
+@metrics.timed("save_quiz_result")
+def save_quiz_result(username, hashed_password, usn, section, score, time_taken, passed, paper_seed=None,
+                     responses=None, timestamp=None, conn=None, quiz_id=LEGACY_QUIZ_ID):
+    if timestamp is None:
+        timestamp = datetime.now()
+    row = (username, hashed_password, usn, section, score, time_taken, timestamp.isoformat(sep=" "))
+    if conn is None:
+        with get_db_connection() as conn:
+            begin_write(conn, shared=(RESULTS_LOCK,))
+            result_id, version = _insert_result(conn, username, hashed_password, usn, section, score, time_taken,
+                                                passed, paper_seed, responses, timestamp, quiz_id)
+            conn.commit()
+        push_recent((version, row))
+        return result_id
+    result_id, version = _insert_result(conn, username, hashed_password, usn, section, score, time_taken,
+                                        passed, paper_seed, responses, timestamp, quiz_id)
+    return result_id, (version, row)
+
+
+def _insert_result(conn, username, hashed_password, usn, section, score, time_taken, passed, paper_seed,
+                   responses, timestamp, quiz_id):
+    ts = timestamp.isoformat(sep=" ")
+    result_id = conn.execute(backend.RESULT_ADD_RETURNING_ID, (username, hashed_password, usn, section, score,
+                                                              time_taken, ts, int(passed), paper_seed,
+                                                              quiz_id)).fetchone()[0]
+    if responses is not None:
+        question_ids, choices = responses
+        conn.execute(backend.RESULT_ADD_RESPONSES, (result_id, question_ids.tobytes(), choices.tobytes()))
+    conn.execute(backend.RESULT_ADD_TO_PARTITION, (quiz_id, section, score, int(passed), time_taken, score, score, ts, ts))
+    version = _bump_results_version(conn)
+    add_event(conn, SUBMISSION, username, section, USN=usn, Score=score, Time_Taken=time_taken, Timestamp=ts)
+    return result_id, version
+
+
+def _read_counter(conn, key):
+    row = conn.execute(backend.META_GET, (key,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def get_results_version(conn=None):
+    if conn is None:
+        with get_db_connection() as conn:
+            return _read_counter(conn, RESULTS_VERSION_KEY)
+    return _read_counter(conn, RESULTS_VERSION_KEY)
+
+
+def get_results_generation(conn=None):
+    if conn is None:
+        with get_db_connection() as conn:
+            return _read_counter(conn, RESULTS_GENERATION_KEY)
+    return _read_counter(conn, RESULTS_GENERATION_KEY)
+
+
+def _partition_filter(quiz_id=None, section=None):
+    clauses, params = [], []
+    if quiz_id:
+        clauses.append(f"quiz_id = {backend.PARAM}")
+        params.append(quiz_id)
+    if section:
+        clauses.append(f"section = {backend.PARAM}")
+        params.append(section)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+# Dashboard metrics straight from the partition catalog (one row per quiz and
+# section, so this costs the same whether there are ten results or a million)
+def get_result_stats(section=None, quiz_id=None):
+    where, params = _partition_filter(quiz_id, section)
+    with get_db_connection() as conn:
+        count, score_sum, pass_count, time_sum, min_score, max_score = conn.execute(
+            backend.RESULT_STATS.format(where=where), params).fetchone()
+    return {
+        "count": count,
+        "avg_score": score_sum / count if count else 0.0,
+        "pass_rate": pass_count / count * 100 if count else 0.0,
+        "avg_time": time_sum / count if count else 0.0,
+        "min_score": min_score,
+        "max_score": max_score,
+    }
+
+
+# Recompute the partition catalog from quiz_results, or only the partitions of
+# one quiz. Rows saved before pass/fail was stored are judged against pass_mark.
+# A caller passing conn holds RESULTS_LOCK.
+def rebuild_result_stats(pass_mark, conn=None, quiz_id=None):
+    if conn is None:
+        with get_db_connection() as conn:
+            begin_write(conn, RESULTS_LOCK)
+            rebuild_result_stats(pass_mark, conn, quiz_id)
+            conn.commit()
+        return
+    conn.execute(backend.RESULT_FILL_PASSED, (pass_mark,))
+    where, params = _partition_filter(quiz_id)
+    conn.execute(backend.RESULT_DELETE_PARTITIONS.format(where=where), params)
+    conn.execute(backend.RESULT_BUILD_PARTITIONS.format(where=where), params)
+    _bump_results_version(conn)
+    _bump_counter(conn, RESULTS_GENERATION_KEY)
+
+
+# Build the partition catalog once for databases that already hold results
+def ensure_result_stats(pass_mark=LEGACY_PASS_MARK):
+    global _stats_built
+    if _stats_built:
+        return
+    with get_db_connection() as conn:
+        begin_write(conn, RESULTS_LOCK)
+        done = conn.execute(backend.META_GET, (STATS_BUILT_KEY,)).fetchone()
+        if not done:
+            rebuild_result_stats(pass_mark, conn)
+            conn.execute(backend.META_ADD, (STATS_BUILT_KEY, datetime.now().isoformat(sep=" ")))
+        conn.commit()
+    _stats_built = True
+
+
+# Load results as a DataFrame, optionally for a single section
+def load_results(section=None):
+    with get_db_connection() as conn:
+        if section:
+            return read_frame(conn, backend.RESULT_SECTION, (section,))
+        return read_frame(conn, backend.RESULT_ALL)
+
+
+def list_quizzes():
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.RESULT_QUIZZES).fetchall()
+    return [r[0] for r in rows]
+
+
+def list_sections(quiz_id=None):
+    where, params = _partition_filter(quiz_id)
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.RESULT_SECTIONS.format(where=where), params).fetchall()
+    return [r[0] for r in rows if r[0]]
+
+
+def list_partitions(quiz_id=None):
+    where, params = _partition_filter(quiz_id)
+    with get_db_connection() as conn:
+        return read_frame(conn, backend.RESULT_PARTITIONS.format(where=where), params)
+
+
+# Whether any partition's catalog range overlaps the filter; if none does the
+# results query is not run at all
+def _any_partition_matches(conn, quiz_id=None, section=None, min_score=None, max_score=None):
+    where, params = _partition_filter(quiz_id, section)
+    ranges = []
+    if min_score is not None:
+        ranges.append(f"max_score >= {backend.PARAM}")
+        params.append(min_score)
+    if max_score is not None:
+        ranges.append(f"min_score <= {backend.PARAM}")
+        params.append(max_score)
+    if ranges:
+        where += (" AND " if where else " WHERE ") + " AND ".join(ranges)
+    return conn.execute(backend.RESULT_ANY_PARTITION.format(where=where), params).fetchone() is not None
+
+
+# Columns the results browser may sort on, mapped to quiz_results columns
+SORT_COLUMNS = {"Score": "score", "Time_Taken": "time_taken", "Timestamp": "timestamp", "Section": "section"}
+EXPORT_CHUNK_ROWS = 5000
+
+
+# WHERE clause for the results browser, or None when the catalog shows that no
+# partition can hold a matching row. The filters go on quiz_results' own
+# indexed columns; all partitions share the one table, so there is nothing
+# more to narrow down by partition.
+def _results_filter(conn, section=None, usn=None, min_score=None, max_score=None, quiz_id=None):
+    if not _any_partition_matches(conn, quiz_id, section, min_score, max_score):
+        return None, []
+    clauses, params = [], []
+    if quiz_id:
+        clauses.append(f"quiz_id = {backend.PARAM}")
+        params.append(quiz_id)
+    if section:
+        clauses.append(f"section = {backend.PARAM}")
+        params.append(section)
+    if usn:
+        clauses.append(f"usn = {backend.PARAM}")
+        params.append(usn)
+    if min_score is not None:
+        clauses.append(f"score >= {backend.PARAM}")
+        params.append(min_score)
+    if max_score is not None:
+        clauses.append(f"score <= {backend.PARAM}")
+        params.append(max_score)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+def _order_by(sort_by, ascending):
+    direction = "ASC" if ascending else "DESC"
+    # id as a tie-breaker keeps page boundaries stable
+    return f" ORDER BY {SORT_COLUMNS[sort_by]} {direction}, id {direction}"
+
+
+# One page of results, filtered and sorted by the database using the quiz_results indexes
+@metrics.timed("query_results")
+def query_results(section=None, usn=None, min_score=None, max_score=None,
+                  sort_by="Score", ascending=True, limit=50, offset=0, quiz_id=None):
+    with get_db_connection() as conn:
+        where, params = _results_filter(conn, section, usn, min_score, max_score, quiz_id)
+        if where is None:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        sql = backend.RESULT_PAGE.format(where=where, order=_order_by(sort_by, ascending))
+        return read_frame(conn, sql, params + [limit, offset])
+
+
+def count_results(section=None, usn=None, min_score=None, max_score=None, quiz_id=None):
+    # Unfiltered counts come from the catalog row counts
+    if not usn and min_score is None and max_score is None:
+        return get_result_stats(section, quiz_id)["count"]
+    with get_db_connection() as conn:
+        where, params = _results_filter(conn, section, usn, min_score, max_score, quiz_id)
+        if where is None:
+            return 0
+        return conn.execute(backend.RESULT_COUNT.format(where=where), params).fetchone()[0]
+
+
+# The CSV of the filtered, sorted results as UTF-8 chunks of EXPORT_CHUNK_ROWS
+# rows, read from the database as they are consumed
+def iter_results_csv(section=None, usn=None, min_score=None, max_score=None, sort_by="Score", ascending=True,
+                     quiz_id=None):
+    chunk = io.StringIO()
+    writer = csv.writer(chunk, lineterminator="\n")
+    writer.writerow(RESULT_COLUMNS)
+    yield chunk.getvalue().encode()
+    with get_db_connection() as conn:
+        where, params = _results_filter(conn, section, usn, min_score, max_score, quiz_id)
+        if where is None:
+            return
+        cursor = conn.execute(backend.RESULT_FILTERED.format(where=where, order=_order_by(sort_by, ascending)),
+                              params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if not rows:
+                break
+            chunk.seek(0)
+            chunk.truncate()
+            writer.writerows(rows)
+            yield chunk.getvalue().encode()
+
+
+# The CSV for download, written to an anonymous temporary file a chunk at a
+# time and returned rewound. st.download_button reads a file into one bytes
+# object itself, so building it in memory as well would hold it twice.
+@metrics.timed("export_results_csv")
+def export_results_csv(section=None, usn=None, min_score=None, max_score=None, sort_by="Score", ascending=True,
+                       quiz_id=None):
+    # Unbuffered: a raw file is one of the types st.download_button accepts
+    out = tempfile.TemporaryFile(buffering=0)
+    for chunk in iter_results_csv(section, usn, min_score, max_score, sort_by, ascending, quiz_id):
+        out.write(chunk)
+    out.seek(0)
+    return out
+
+
+# The ring buffer follows results_version: a committed submission from this
+# process that is the very next version is pushed on the front; anything else
+# (another process saving, a re-grade) makes the next read reload it from the
+# index. entry is the (version, row) pair from save_quiz_result.
+def push_recent(entry):
+    global _recent_version
+    version, row = entry
+    with _recent_lock:
+        if _recent_version == version - 1:
+            _recent.appendleft(row)
+            _recent_version = version
+
+
+def recent_results(limit=5):
+    global _recent_version
+    if limit > RECENT_BUFFER_SIZE:
+        with get_db_connection() as conn:
+            return read_frame(conn, backend.RESULT_LATEST, (limit,))
+    version = get_results_version()
+    with _recent_lock:
+        if version != _recent_version:
+            with get_db_connection() as conn:
+                rows = conn.execute(backend.RESULT_LATEST, (RECENT_BUFFER_SIZE,)).fetchall()
+            _recent.clear()
+            _recent.extend(rows)
+            _recent_version = version
+        rows = list(_recent)[:limit]
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+# Results saved after the given time, oldest first (range scan on idx_quiz_results_timestamp)
+def results_since(since, limit=None):
+    if isinstance(since, datetime):
+        since = since.isoformat(sep=" ")
+    query, params = backend.RESULT_SINCE, (since,)
+    if limit:
+        query, params = backend.RESULT_SINCE_LIMIT, (since, limit)
+    with get_db_connection() as conn:
+        return read_frame(conn, query, params)
+
+
+# One-time import of the legacy CSV results into quiz_results.
+# The professor CSV already holds every submission; the per-section files are
+# only imported when it is missing, otherwise rows would be duplicated.
+# Rows with a blank or non-numeric score or time are skipped and counted in
+# the csv_rows_skipped metric.
+def migrate_csv_results(prof_csv_file, section_pattern="*_results.csv"):
+    global _csv_migrated
+    if _csv_migrated:
+        return 0
+
+    if os.path.exists(prof_csv_file):
+        csv_files = [prof_csv_file]
+    else:
+        csv_files = sorted(glob.glob(section_pattern))
+
+    imported = 0
+    with get_db_connection() as conn:
+        # Under the lock, so two processes starting together don't both import
+        begin_write(conn, RESULTS_LOCK)
+        done = conn.execute(backend.META_GET, (CSV_MIGRATION_KEY,)).fetchone()
+        if not done:
+            for csv_file in csv_files:
+                df = pd.read_csv(csv_file)
+                df = df.reindex(columns=RESULT_COLUMNS)
+                df["Score"] = pd.to_numeric(df["Score"], errors="coerce")
+                df["Time_Taken"] = pd.to_numeric(df["Time_Taken"], errors="coerce")
+                bad = df["Score"].isna() | df["Time_Taken"].isna()
+                if bad.any():
+                    metrics.inc("csv_rows_skipped", int(bad.sum()))
+                rows = [(r.Username, r.Hashed_Password, r.USN, r.Section, int(r.Score), float(r.Time_Taken),
+                         str(r.Timestamp), None, None, LEGACY_QUIZ_ID) for r in df[~bad].itertuples(index=False)]
+                conn.executemany(backend.RESULT_ADD, rows)
+                imported += len(rows)
+            conn.execute(backend.META_ADD, (CSV_MIGRATION_KEY, datetime.now().isoformat(sep=" ")))
+        conn.commit()
+
+    _csv_migrated = True
+    return imported
@@ -0,0 +1,200 @@
+import csv
+import io
+import secrets
+import time
+
+from email_validator import EmailNotValidError, validate_email
+
+from quiz_app import metrics
+from quiz_app.credentials import generate_password, hash_generated_password
+from quiz_app.db import backend, begin_write, get_db_connection
+from quiz_app.mailer import add_emails, start_email_worker
+
+# Bulk account provisioning from a roster CSV with a header row. "username" and
+# "email" are required columns; an optional "name" is used in the greeting and
+# other columns are ignored. Rows are read one at a time and accounts are
+# created ROSTER_CHUNK_SIZE at a time, each chunk in one write transaction
+# together with its credentials emails. The plaintext password exists only in
+# the email body, which the outbox blanks once the message is sent.
+ROSTER_COLUMNS = ["username", "email"]
+ROSTER_CHUNK_SIZE = 500
+USERNAME_MAX_LENGTH = 64
+ERROR_COLUMNS = ["Line", "Username", "Email", "Error"]
+
+# Professor IDs are "PROF-" and five digits; one that is taken is redrawn
+PROFESSOR_ID_ATTEMPTS = 20
+
+_SUBJECTS = {"student": "Student Account Credentials", "professor": "Professor Account Credentials"}
+
+
+def _credentials_body(name, username, password, role):
+    return f"""Dear {name},
+
+Your {role} account has been created:
+
+Username: {username}
+Password: {password}
+
+Please login and change your password immediately.
+
+Regards,
+Quiz App Team"""
+
+
+# Normalized form of an address; raises EmailNotValidError. Deliverability
+# (DNS) is not checked, it would cost a lookup per row.
+def normalize_email(address):
+    return validate_email(address.strip(), check_deliverability=False).normalized
+
+
+# (line number, row) for each data row of an uploaded file or a path
+def _read_roster(source):
+    if isinstance(source, str):
+        with open(source, encoding="utf-8-sig", newline="") as f:
+            yield from _read_rows(f)
+        return
+    # An upload is kept across reruns, so it may have been read already
+    source.seek(0)
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    try:
+        yield from _read_rows(text)
+    finally:
+        # Leave the upload open for Streamlit
+        text.detach()
+
+
+def _read_rows(f):
+    reader = csv.DictReader(f)
+    if reader.fieldnames is None:
+        raise ValueError("The roster is empty")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in ROSTER_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"The roster is missing column(s): {', '.join(missing)}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _row_error(line_no, username, address, problem):
+    return {"Line": line_no, "Username": username, "Email": address, "Error": problem}
+
+
+# (line number, username, email, name) for each row that passes the checks;
+# every row is counted in the report and the others are added to its errors
+def _valid_rows(rows, report):
+    seen = {}
+    for line_no, row in rows:
+        report["rows"] += 1
+        username = (row.get("username") or "").strip()
+        address = (row.get("email") or "").strip()
+        if not username:
+            problem = "Missing username"
+        elif len(username) > USERNAME_MAX_LENGTH:
+            problem = f"Username is longer than {USERNAME_MAX_LENGTH} characters"
+        elif username in seen:
+            problem = f"Duplicate of line {seen[username]}"
+        else:
+            try:
+                address = normalize_email(address)
+                problem = None
+            except EmailNotValidError as e:
+                problem = str(e)
+        if problem:
+            report["errors"].append(_row_error(line_no, username, address, problem))
+            continue
+        seen[username] = line_no
+        yield line_no, username, address, (row.get("name") or "").strip() or username
+
+
+# Each row of a chunk with a generated password and its hash
+def _with_passwords(chunk):
+    accounts = []
+    for line_no, username, address, name in chunk:
+        password = generate_password()
+        accounts.append((line_no, username, address, name, password, hash_generated_password(password)))
+    return accounts
+
+
+# Create a chunk of accounts and queue their emails in a single write
+# transaction. Usernames that already exist are reported and skipped. Returns
+# the number created.
+def _create_accounts(accounts, role, errors):
+    with get_db_connection() as conn:
+        begin_write(conn, *(f"user:{account[1]}" for account in accounts))
+        placeholders = ", ".join([backend.PARAM] * len(accounts))
+        taken = {row[0] for row in conn.execute(backend.USER_TAKEN.format(placeholders=placeholders),
+                                                [account[1] for account in accounts])}
+        users, emails = [], []
+        for line_no, username, address, name, password, password_hash in accounts:
+            if username in taken:
+                errors.append(_row_error(line_no, username, address, "Username already exists"))
+                continue
+            users.append((username, password_hash, role, address))
+            emails.append((address, _SUBJECTS[role], _credentials_body(name, username, password, role)))
+        conn.executemany(backend.USER_ADD, users)
+        add_emails(conn, emails)
+        conn.commit()
+    return len(users)
+
+
+# Import a roster CSV (an uploaded file or a path). Returns a report with the
+# rows read, the accounts created, the per-row errors (dicts with
+# ERROR_COLUMNS) and the time spent in total and in database writes. Raises
+# ValueError when the header lacks a required column.
+@metrics.timed("roster_import")
+def import_roster(source, role="student", chunk_size=ROSTER_CHUNK_SIZE):
+    started = time.perf_counter()
+    report = {"rows": 0, "created": 0, "errors": [], "db_seconds": 0.0}
+    chunk = []
+    for account in _valid_rows(_read_roster(source), report):
+        chunk.append(account)
+        if len(chunk) == chunk_size:
+            report["created"] += _timed_create(chunk, role, report)
+            chunk = []
+    if chunk:
+        report["created"] += _timed_create(chunk, role, report)
+
+    if report["created"]:
+        metrics.inc("accounts_created", report["created"])
+        start_email_worker().wake()
+    report["errors"].sort(key=lambda error: error["Line"])
+    report["total_seconds"] = time.perf_counter() - started
+    return report
+
+
+# Passwords are hashed before the write transaction starts
+def _timed_create(chunk, role, report):
+    accounts = _with_passwords(chunk)
+    started = time.perf_counter()
+    created = _create_accounts(accounts, role, report["errors"])
+    report["db_seconds"] += time.perf_counter() - started
+    return created
+
+
+# The per-row errors of a report as CSV, for download
+def errors_csv(errors):
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=ERROR_COLUMNS)
+    writer.writeheader()
+    writer.writerows(errors)
+    return out.getvalue()
+
+
+# Create a professor account with a generated ID and password and queue its
+# credentials email. Returns the ID.
+def create_professor(full_name, address):
+    password = generate_password()
+    password_hash = hash_generated_password(password)
+    with get_db_connection() as conn:
+        for _ in range(PROFESSOR_ID_ATTEMPTS):
+            prof_id = f"PROF-{10000 + secrets.randbelow(90000)}"
+            if conn.execute(backend.USER_ADD_NEW, (prof_id, password_hash, "professor", address)).rowcount:
+                add_emails(conn, [(address, _SUBJECTS["professor"],
+                                   _credentials_body(full_name, prof_id, password, "professor"))])
+                conn.commit()
+                break
+            conn.rollback()
+        else:
+            raise RuntimeError("No free professor ID, please try again")
+    start_email_worker().wake()
+    return prof_id
@@ -0,0 +1,240 @@
+import json
+import os
+import secrets
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+from numpy.lib import format as npy_format
+
+from quiz_app import metrics
+from quiz_app.db import backend, get_db_connection
+from quiz_app.results import get_results_generation, get_results_version
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialized
+    fcntl = None
+
+# Typed, columnar copy of quiz_results for analytics: one .npy file per column,
+# loaded as read-only memory maps instead of parsing text. New results are
+# appended in place (the .npy header is rewritten with the new length); a
+# re-grade, which rewrites existing rows, makes the next refresh rebuild it.
+#
+# Layout: SNAPSHOT_DIR/manifest.json names the current data directory and how
+# many rows of it are complete, and holds the Section and Quiz categories.
+# Readers only trust the first manifest["rows"] rows, so a crash mid-append
+# leaves a valid snapshot behind.
+SNAPSHOT_DIR = os.environ.get("QUIZ_SNAPSHOT_DIR", "results_snapshot")
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_CHUNK_ROWS = 20000
+
+# Column file -> dtype. Section and Quiz are codes into the manifest categories
+# (-1 for missing); Score is float32 because partial-credit grading stores
+# fractional marks; Timestamp is NaT where the stored text did not parse.
+COLUMNS = {
+    "id": np.dtype("<i8"),
+    "quiz": np.dtype("<i4"),
+    "section": np.dtype("<i4"),
+    "score": np.dtype("<f4"),
+    "time_taken": np.dtype("<f8"),
+    "timestamp": np.dtype("<M8[us]"),
+    "passed": np.dtype("i1"),
+}
+
+_refresh_lock = threading.Lock()
+
+
+def _manifest_path(path):
+    return os.path.join(path, "manifest.json")
+
+
+def _read_manifest(path):
+    try:
+        with open(_manifest_path(path)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def _write_manifest(path, manifest):
+    tmp_path = _manifest_path(path) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, _manifest_path(path))
+
+
+def _column_path(path, manifest, name):
+    return os.path.join(path, manifest["dir"], f"{name}.npy")
+
+
+def _write_header(f, dtype, rows):
+    f.seek(0)
+    npy_format.write_array_header_1_0(f, {"descr": npy_format.dtype_to_descr(dtype), "fortran_order": False,
+                                          "shape": (rows,)})
+    return f.tell()
+
+
+# Set a column file's length to rows, dropping anything past it, and return
+# the data offset. numpy pads .npy headers so the length can grow in place.
+def _resize_column(file_path, dtype, rows):
+    with open(file_path, "r+b") as f:
+        npy_format.read_magic(f)
+        npy_format.read_array_header_1_0(f)
+        offset = f.tell()
+        if _write_header(f, dtype, rows) != offset:
+            raise ValueError(f"{file_path}: header size changed")
+        f.truncate(offset + rows * dtype.itemsize)
+    return offset
+
+
+def _append_column(file_path, dtype, rows, values):
+    with open(file_path, "r+b") as f:
+        npy_format.read_magic(f)
+        npy_format.read_array_header_1_0(f)
+        offset = f.tell()
+        # Data first, then the new length, so a crash leaves the old length valid
+        f.seek(offset + rows * dtype.itemsize)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        f.flush()
+        if _write_header(f, dtype, rows + len(values)) != offset:
+            raise ValueError(f"{file_path}: header size changed")
+
+
+def _new_snapshot(path, generation):
+    manifest = {"format": SNAPSHOT_FORMAT, "dir": f"data-{generation}-{secrets.token_hex(4)}", "rows": 0,
+                "last_id": 0, "version": None, "generation": generation, "quizzes": [], "sections": []}
+    os.makedirs(os.path.join(path, manifest["dir"]))
+    for name, dtype in COLUMNS.items():
+        with open(_column_path(path, manifest, name), "wb") as f:
+            _write_header(f, dtype, 0)
+    return manifest
+
+
+def _encode(values, categories):
+    index = {value: code for code, value in enumerate(categories)}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(categories)
+            categories.append(value)
+        codes[i] = code
+    return codes
+
+
+def _chunk_columns(rows, manifest):
+    ids, quiz_ids, sections, scores, times, timestamps, passed = zip(*rows)
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "quiz": _encode(quiz_ids, manifest["quizzes"]),
+        "section": _encode(sections, manifest["sections"]),
+        "score": np.array(scores, dtype=float),
+        "time_taken": np.array(times, dtype=float),
+        "timestamp": pd.to_datetime(pd.Series(timestamps, dtype=object), format="ISO8601",
+                                    errors="coerce").to_numpy(dtype="datetime64[us]"),
+        "passed": np.array([bool(p) for p in passed], dtype=np.int8),
+    }
+
+
+def _remove_stale_dirs(path, keep):
+    for entry in os.listdir(path):
+        if entry.startswith("data-") and entry != keep:
+            # A reader may still have the old files mapped; on Windows that
+            # blocks the delete and a later refresh tries again
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = os.path.join(path, ".lock")
+
+    def __enter__(self):
+        self._f = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+# Bring the snapshot up to date with quiz_results: append rows saved since the
+# last refresh, or rebuild from scratch after a re-grade. Returns the manifest.
+@metrics.timed("snapshot_refresh")
+def refresh_snapshot(path=SNAPSHOT_DIR):
+    os.makedirs(path, exist_ok=True)
+    with _refresh_lock, _FileLock(path):
+        manifest = _read_manifest(path)
+        with get_db_connection() as conn:
+            # One read transaction, so the counters and the rows agree
+            backend.begin_snapshot(conn)
+            version = get_results_version(conn)
+            if manifest is not None and manifest["version"] == version:
+                return manifest
+            generation = get_results_generation(conn)
+            if manifest is None or manifest["generation"] != generation:
+                manifest = _new_snapshot(path, generation)
+                metrics.inc("snapshot_rebuilds")
+            else:
+                for name, dtype in COLUMNS.items():
+                    _resize_column(_column_path(path, manifest, name), dtype, manifest["rows"])
+            cursor = conn.execute(backend.RESULT_ROWS_AFTER, (manifest["last_id"],))
+            while True:
+                rows = cursor.fetchmany(SNAPSHOT_CHUNK_ROWS)
+                if not rows:
+                    break
+                columns = _chunk_columns(rows, manifest)
+                for name, dtype in COLUMNS.items():
+                    _append_column(_column_path(path, manifest, name), dtype, manifest["rows"], columns[name])
+                manifest["rows"] += len(rows)
+                manifest["last_id"] = int(columns["id"][-1])
+                metrics.inc("snapshot_rows_appended", len(rows))
+            conn.rollback()
+        manifest["version"] = version
+        _write_manifest(path, manifest)
+        _remove_stale_dirs(path, manifest["dir"])
+    return manifest
+
+
+def _load_column(path, manifest, name):
+    rows = manifest["rows"]
+    if not rows:
+        return np.empty(0, dtype=COLUMNS[name])
+    return np.load(_column_path(path, manifest, name), mmap_mode="r")[:rows]
+
+
+# Results as a typed DataFrame (categorical Section and Quiz, float Score and
+# Time_Taken, datetime64 Timestamp, bool Passed), optionally for one quiz or
+# section. Numeric columns are backed by the memory-mapped files.
+def load_snapshot(section=None, quiz_id=None, path=SNAPSHOT_DIR, refresh=True):
+    manifest = refresh_snapshot(path) if refresh else _read_manifest(path)
+    if manifest is None:
+        manifest = {"rows": 0, "quizzes": [], "sections": []}
+    columns = {name: _load_column(path, manifest, name) for name in COLUMNS}
+    mask = None
+    for value, name, categories in ((section, "section", manifest["sections"]),
+                                    (quiz_id, "quiz", manifest["quizzes"])):
+        if value:
+            code = categories.index(value) if value in categories else -2
+            selected = columns[name] == code
+            mask = selected if mask is None else mask & selected
+    if mask is not None:
+        columns = {name: values[mask] for name, values in columns.items()}
+    return pd.DataFrame({
+        "Quiz": pd.Categorical.from_codes(columns["quiz"], categories=manifest["quizzes"]),
+        "Section": pd.Categorical.from_codes(columns["section"], categories=manifest["sections"]),
+        "Score": columns["score"],
+        "Time_Taken": columns["time_taken"],
+        "Timestamp": columns["timestamp"],
+        "Passed": columns["passed"].astype(bool),
+    }, index=pd.Index(columns["id"], name="id"), copy=False)
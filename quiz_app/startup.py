@@ -0,0 +1,60 @@
+import threading
+
+from quiz_app import metrics
+from quiz_app.db import get_pool
+from quiz_app.mailer import start_email_worker
+
+# Results file written by versions before the SQLite results store
+PROF_CSV_FILE = "prof_quiz_results.csv"
+
+_started = False
+_start_lock = threading.Lock()
+_results_ready = threading.Event()
+
+
+# Import results from the old CSV files (once per database) and build the
+# dashboard aggregates and item analysis for results saved before they
+# existed. Pages that show results call this too; after the first call it only
+# checks flags.
+def prepare_results():
+    from quiz_app.item_analysis import ensure_item_stats
+    from quiz_app.questions import get_question_bank
+    from quiz_app.results import ensure_result_stats, migrate_csv_results
+    migrate_csv_results(PROF_CSV_FILE)
+    ensure_result_stats()
+    ensure_item_stats(get_question_bank())
+    _results_ready.set()
+
+
+# The services whose modules pull in pandas, numpy or av are started here, off
+# the script thread, so the first render of a page doesn't wait on those imports
+def _start_background_services():
+    with metrics.timer("startup_background"):
+        try:
+            prepare_results()
+        except Exception:
+            metrics.inc("startup_errors")
+        # Finalizes attempts left open past their deadline (see quiz_app.attempts)
+        from quiz_app.attempts import start_attempt_sweeper
+        start_attempt_sweeper()
+        # Catalogs recorded segments and builds their thumbnails (see quiz_app.video_catalog)
+        from quiz_app.video_catalog import start_catalog_worker
+        start_catalog_worker()
+
+
+# Once per server process: create the schema and the connection pool, start
+# the mail sender and the metrics writer, and hand the rest to a background thread
+def start_services():
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        get_pool()
+        # Outgoing mail is queued and sent by a background thread (see quiz_app.mailer)
+        start_email_worker()
+        # Writes a Prometheus-style metrics snapshot when QUIZ_METRICS_FILE is set
+        metrics.start_metrics_writer()
+        threading.Thread(target=_start_background_services, name="startup", daemon=True).start()
+        _started = True
@@ -0,0 +1,231 @@
+import io
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+
+import av
+from PIL import Image
+
+from quiz_app import media, metrics
+from quiz_app.db import backend, get_db_connection, read_frame
+from quiz_app.recording import RECORDING_DIR
+
+# Index of recorded segments (quiz_app.recording writes one MP4 per
+# SEGMENT_SECONDS of an attempt), so the recordings page reads a table instead
+# of listing the directory, and plays one segment at a time. A background
+# worker adds a thumbnail per segment (a frame from its middle) and keeps a
+# contact sheet per attempt: the segment thumbnails in a grid, in order.
+# Segments, thumbnails and sheets are published to quiz_app.media as they are
+# made, so with a shared media store any replica can play them.
+THUMBNAIL_DIR = os.path.join(RECORDING_DIR, "thumbnails")
+THUMBNAIL_WIDTH = 160
+THUMBNAIL_HEIGHT = 120
+SHEET_COLUMNS = 8
+
+_SEGMENT_NAME = re.compile(r"^(?P<user>.+)_attempt(?P<attempt>\d+)_seg(?P<segment>\d+)\.mp4$")
+
+
+def _parse_name(filename):
+    match = _SEGMENT_NAME.match(filename)
+    if match is None:
+        # Whole-file recordings from older versions: one segment, attempt 0
+        return os.path.splitext(filename)[0], 0, 1
+    return match["user"], int(match["attempt"]), int(match["segment"])
+
+
+def _probe_duration(path):
+    with av.open(path) as container:
+        if container.duration is not None:
+            return container.duration / av.time_base
+        stream = container.streams.video[0]
+        return float(stream.frames / stream.average_rate) if stream.frames and stream.average_rate else 0.0
+
+
+def thumbnail_path(segment_path):
+    return os.path.join(THUMBNAIL_DIR, os.path.splitext(os.path.basename(segment_path))[0] + ".jpg")
+
+
+def contact_sheet_path(username, attempt_no):
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", str(username))
+    return os.path.join(THUMBNAIL_DIR, f"{safe}_attempt{attempt_no}_sheet.jpg")
+
+
+# Decode one frame from the middle of a segment and save it as a JPEG
+def make_thumbnail(segment_path, duration):
+    with av.open(segment_path) as container:
+        stream = container.streams.video[0]
+        if duration and stream.time_base:
+            container.seek(int(duration / 2 / stream.time_base), stream=stream)
+        frame = next(container.decode(stream), None)
+    if frame is None:
+        return None
+    image = frame.to_image()
+    image.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    path = thumbnail_path(segment_path)
+    image.save(path + ".tmp", format="JPEG", quality=80)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def build_contact_sheet(username, attempt_no):
+    with get_db_connection() as conn:
+        thumbnails = [row[3] for row in conn.execute(backend.SEGMENT_LIST, (username, attempt_no))]
+    if not thumbnails or None in thumbnails:
+        return None
+    # Segments of one attempt may have been recorded by different replicas
+    tiles = [media.read(thumbnail) for thumbnail in thumbnails]
+    if None in tiles:
+        return None
+    rows = -(-len(thumbnails) // SHEET_COLUMNS)
+    columns = min(len(thumbnails), SHEET_COLUMNS)
+    sheet = Image.new("RGB", (columns * THUMBNAIL_WIDTH, rows * THUMBNAIL_HEIGHT))
+    for i, data in enumerate(tiles):
+        with Image.open(io.BytesIO(data)) as tile:
+            sheet.paste(tile, ((i % SHEET_COLUMNS) * THUMBNAIL_WIDTH, (i // SHEET_COLUMNS) * THUMBNAIL_HEIGHT))
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+    path = contact_sheet_path(username, attempt_no)
+    sheet.save(path + ".tmp", format="JPEG", quality=80)
+    os.replace(path + ".tmp", path)
+    media.publish(path)
+    return path
+
+
+# Record a finished segment and queue its thumbnail. The duration is probed
+# from the file when not given. The segment is published before it is
+# cataloged, so every catalog row can be played from any replica.
+def add_segment(path, username=None, attempt_no=None, duration=None):
+    parsed_user, parsed_attempt, segment_no = _parse_name(os.path.basename(path))
+    username = parsed_user if username is None else username
+    attempt_no = parsed_attempt if attempt_no is None else attempt_no
+    if duration is None:
+        duration = _probe_duration(path)
+    media.publish(path)
+    with get_db_connection() as conn:
+        conn.execute(backend.SEGMENT_ADD,
+                     (path, username, attempt_no, segment_no, duration, os.path.getsize(path),
+                      os.path.getmtime(path)))
+        conn.commit()
+    start_catalog_worker().put(path, username, attempt_no, duration)
+
+
+# SegmentRecorder's on_segment_closed callback
+def segment_closed(recorder, path, duration):
+    add_segment(path, recorder.username, recorder.attempt_no, duration)
+
+
+class CatalogWorker(threading.Thread):
+    def __init__(self):
+        super().__init__(name="recording-catalog", daemon=True)
+        self.jobs = queue.Queue()
+
+    def put(self, path, username, attempt_no, duration):
+        self.jobs.put((path, username, attempt_no, duration))
+
+    def run(self):
+        try:
+            sync_recordings()
+        except Exception:
+            pass
+        while True:
+            path, username, attempt_no, duration = self.jobs.get()
+            try:
+                with metrics.timer("recording_thumbnail"):
+                    thumbnail = make_thumbnail(path, duration)
+                if thumbnail is not None:
+                    media.publish(thumbnail)
+                with get_db_connection() as conn:
+                    conn.execute(backend.SEGMENT_SET_THUMBNAIL, (thumbnail, path))
+                    conn.commit()
+                if thumbnail is not None:
+                    build_contact_sheet(username, attempt_no)
+            except Exception:
+                metrics.inc("recording_thumbnail_errors")
+
+
+# Bring the catalog in line with the recordings directory: add segments it
+# does not know (recorded before the catalog, or by a process that died before
+# cataloging), drop rows whose files are gone and retry missing thumbnails.
+# With a shared media store, rows for segments published by other replicas are
+# kept. Runs once when the worker starts, not on page reruns.
+def sync_recordings():
+    os.makedirs(RECORDING_DIR, exist_ok=True)
+    on_disk = {os.path.join(RECORDING_DIR, f) for f in os.listdir(RECORDING_DIR) if f.endswith(".mp4")}
+    published = media.published_paths()
+    with get_db_connection() as conn:
+        known = dict(conn.execute(backend.SEGMENT_THUMBNAILS).fetchall())
+        gone = [(path,) for path in known if path not in on_disk and path not in published]
+        if gone:
+            conn.executemany(backend.SEGMENT_DELETE, gone)
+            conn.commit()
+    for path in sorted(on_disk - known.keys()):
+        try:
+            add_segment(path)
+        except Exception:
+            # Unreadable file (e.g. truncated); left out of the catalog
+            metrics.inc("recording_catalog_errors")
+    worker = start_catalog_worker()
+    with get_db_connection() as conn:
+        missing = conn.execute(backend.SEGMENT_NO_THUMBNAIL).fetchall()
+    for row in missing:
+        # Thumbnails are made from the local file, by the replica that recorded it
+        if row[0] in known and row[0] in on_disk:
+            worker.put(*row)
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+# One catalog worker per process
+def start_catalog_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = CatalogWorker()
+                _worker.start()
+    return _worker
+
+
+# One row per recorded attempt: duration, size and proctoring flag count
+def list_recordings():
+    with get_db_connection() as conn:
+        recordings = read_frame(conn, backend.SEGMENT_RECORDINGS)
+    # Units and rounding are applied here, the same for either backend
+    recordings["Duration_Seconds"] = recordings["Duration_Seconds"].astype(float).round(1)
+    recordings["Size_MB"] = (recordings["Size_MB"].astype(float) / 1048576).round(2)
+    recordings["Recorded"] = [datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+                              for ts in recordings["Recorded"]]
+    return recordings
+
+
+# Segment number to start a new recorder at: after the attempt's cataloged
+# segments, so a reconnect (possibly to another replica) doesn't overwrite them
+def next_segment_no(username, attempt_no):
+    with get_db_connection() as conn:
+        row = conn.execute(backend.SEGMENT_LAST_NO, (username, attempt_no)).fetchone()
+    return (row[0] or 0) + 1
+
+
+# Segments of one attempt in order, each with its start offset in the recording
+def recording_segments(username, attempt_no):
+    with get_db_connection() as conn:
+        rows = conn.execute(backend.SEGMENT_LIST, (username, attempt_no)).fetchall()
+    segments, offset = [], 0.0
+    for segment_no, path, duration, thumbnail in rows:
+        segments.append({"segment_no": segment_no, "path": path, "start": offset, "duration": duration or 0.0,
+                         "thumbnail": thumbnail})
+        offset += duration or 0.0
+    return segments
+
+
+# The segment holding a position (seconds from the start of the recording),
+# and the offset into that segment
+def locate(segments, position):
+    for segment in segments:
+        if position < segment["start"] + segment["duration"]:
+            return segment, max(0.0, position - segment["start"])
+    return segments[-1], 0.0
@@ -0,0 +1,4 @@
+# Pages of the Streamlit app, one module per menu entry, each with a render()
+# function. Student-Quiz.py imports a page's module the first time it is
+# opened, so the heavy imports (webrtc, pandas, the video stack) are only paid
+# for by the pages that use them.
@@ -0,0 +1,26 @@
+import streamlit as st
+
+from quiz_app.credentials import PASSWORD_CHANGE_LIMIT, LoginThrottled, change_password
+from quiz_app.views.common import authenticate_user
+
+
+def render():
+    if not st.session_state.logged_in:
+        st.warning("Please login first!")
+    else:
+        username = st.session_state.username
+        old_pass = st.text_input("Old Password", type="password")
+        new_pass = st.text_input("New Password", type="password")
+        if st.button("Change Password"):
+            try:
+                old_pass_ok = authenticate_user(username, old_pass) is not None
+            except LoginThrottled as e:
+                old_pass_ok = None
+                st.error(f"Too many attempts. Please try again in {e.retry_after} seconds.")
+            if old_pass_ok is False:
+                st.error("Old password is incorrect!")
+            elif old_pass_ok:
+                if change_password(username, new_pass, limit=PASSWORD_CHANGE_LIMIT):
+                    st.success("Password updated successfully.")
+                else:
+                    st.error(f"Password can only be changed {PASSWORD_CHANGE_LIMIT} times.")
@@ -0,0 +1,12 @@
+import streamlit as st
+
+from quiz_app.credentials import authenticate, client_address
+
+# Secret key for professor panel
+PROFESSOR_SECRET_KEY = "RRCE@123"
+
+
+# Authenticate user; returns the user's role, or None for bad credentials
+def authenticate_user(username, password):
+    ip = client_address(st.context.ip_address, st.context.headers.get("X-Forwarded-For"))
+    return authenticate(username, password, ip=ip)
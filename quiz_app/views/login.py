@@ -0,0 +1,93 @@
+import streamlit as st
+
+from quiz_app.credentials import LoginThrottled, change_password
+from quiz_app.db import backend, get_db_connection
+from quiz_app.otp import PASSWORD_RESET, OtpExpired, OtpThrottled, issue_otp, otp_pending, verify_otp
+from quiz_app.views.common import authenticate_user
+
+
+def render():
+    st.subheader("Login")
+
+    # Initialize login form fields in session state if they don't exist
+    if 'login_username' not in st.session_state:
+        st.session_state.login_username = ""
+    if 'login_password' not in st.session_state:
+        st.session_state.login_password = ""
+
+    # ---------- Login Form ----------
+    username = st.text_input("Username", value=st.session_state.login_username, key="login_username_widget")
+    password = st.text_input("Password", type="password", value=st.session_state.login_password, key="login_password_widget")
+    
+    if st.button("Login"):
+        try:
+            role = authenticate_user(username, password)
+        except LoginThrottled as e:
+            role = None
+            st.error(f"Too many login attempts. Please try again in {e.retry_after} seconds.")
+        else:
+            if role:
+                st.session_state.logged_in = True
+                st.session_state.username = username
+                st.session_state.role = role
+                st.success("Login successful!")
+            else:
+                st.error("Invalid username or password.")
+
+    # ---------- Forgot Password ----------
+    st.markdown("### Forgot Password?")
+    forgot_email = st.text_input("Enter registered email", key="forgot_email_input")
+    
+    if st.button("Send Reset OTP"):
+        with get_db_connection() as conn:
+            user = conn.execute(backend.USER_BY_EMAIL, (forgot_email,)).fetchone()
+
+        if user:
+            try:
+                issue_otp(PASSWORD_RESET, forgot_email, {"username": user[0]})
+                st.session_state['reset_email'] = forgot_email
+                st.success("OTP sent to your email.")
+            except OtpThrottled as e:
+                st.error(f"An OTP was sent recently. Please try again in {e.retry_after} seconds.")
+        else:
+            st.error("Email not registered.")
+
+    # ---------- Reset Password ----------
+    # Also shown after a reconnect, once the email with a pending code is entered again
+    reset_email = st.session_state.get('reset_email')
+    if not reset_email and forgot_email and otp_pending(PASSWORD_RESET, forgot_email):
+        reset_email = forgot_email
+    if reset_email:
+        st.markdown("### Reset Your Password")
+        entered_otp = st.text_input("Enter OTP to reset password", key="reset_otp_input")
+        new_password = st.text_input("New Password", type="password", key="reset_new_password")
+        confirm_password = st.text_input("Confirm New Password", type="password", key="reset_confirm_password")
+
+        if st.button("Reset Password"):
+            if new_password != confirm_password:
+                st.error("Passwords do not match. Please try again.")
+            else:
+                try:
+                    pending = verify_otp(PASSWORD_RESET, reset_email, entered_otp)
+                    if not pending:
+                        st.error("Incorrect OTP. Please try again.")
+                    # Set the password and count the change in one transaction
+                    elif change_password(pending["username"], new_password):
+                        # Store credentials for auto-fill (without modifying widget state directly)
+                        st.session_state.login_username = pending["username"]
+                        st.session_state.login_password = new_password
+
+                        st.success("Password reset successfully! Your credentials have been filled below. Click Login to continue.")
+
+                        # Clear reset-related session state
+                        st.session_state.pop('reset_email', None)
+
+                        # Rerun to update the UI with filled credentials
+                        st.rerun()
+                    else:
+                        st.error("Password update failed. Please try again.")
+                except OtpExpired:
+                    st.error("OTP expired. Please request a new one.")
+                    st.session_state.pop('reset_email', None)
+                except Exception as e:
+                    st.error(f"Error updating password: {str(e)}")
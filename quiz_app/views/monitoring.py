@@ -0,0 +1,116 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from quiz_app import metrics
+from quiz_app.events import MonitorView, latest_event_id
+from quiz_app.presence import get_active_students, expire_stale_students
+from quiz_app.proctoring import FLAG_KINDS, flag_counts, recent_flags
+from quiz_app.results import recent_results
+from quiz_app.startup import prepare_results
+from quiz_app.views.common import PROFESSOR_SECRET_KEY
+
+# The monitoring dashboard polls the event feed this often (only its own fragment reruns)
+MONITOR_REFRESH_SECONDS = 5
+MONITOR_SUBMISSION_COLUMNS = ["Username", "USN", "Section", "Score", "Time_Taken", "Timestamp"]
+
+
+# Live view of the event feed; only this fragment reruns on each tick
+@st.fragment(run_every=MONITOR_REFRESH_SECONDS)
+def live_monitor(view):
+    expire_stale_students()
+    view.refresh()
+    if not view.active:
+        st.write("No active students at the moment.")
+    else:
+        st.write(f"Active students ({len(view.active)}):")
+        section_counts = view.section_counts()
+        cols = st.columns(len(section_counts))
+        for col, (sec, count) in zip(cols, section_counts.items()):
+            col.metric(f"Section {sec or '-'}", count)
+        for student in view.active:
+            flags = view.flag_counts.get(student, 0)
+            st.write(f"- {student}" + (f" ⚠️ {flags} proctoring flag(s)" if flags else ""))
+
+        st.markdown("---")
+        st.markdown("### Proctoring Flags")
+        if view.flags:
+            st.dataframe(pd.DataFrame(
+                [(user, attempt, FLAG_KINDS.get(kind, kind), detail, datetime.fromtimestamp(ts).strftime("%H:%M:%S"))
+                 for user, attempt, kind, detail, ts in view.flags],
+                columns=["Username", "Attempt", "Flag", "Detail", "Time"]))
+        else:
+            st.write("No proctoring flags raised.")
+
+        st.markdown("---")
+        st.markdown("### Recent Quiz Submissions")
+        if view.submissions:
+            st.dataframe(pd.DataFrame(list(view.submissions), columns=MONITOR_SUBMISSION_COLUMNS))
+        else:
+            st.warning("No quiz submissions yet.")
+
+
+# Admin view of quiz_app.metrics for this server process
+@st.fragment(run_every=MONITOR_REFRESH_SECONDS)
+def server_metrics():
+    histograms, counters = metrics.registry.snapshot()
+    if not histograms:
+        st.write("No metrics recorded yet.")
+        return
+    st.markdown("### Server Metrics")
+    st.dataframe(pd.DataFrame(
+        [(op, page, h.count, h.sum / h.count * 1000, h.quantile(0.5) * 1000, h.quantile(0.95) * 1000,
+          h.quantile(0.99) * 1000, h.sum) for (op, page), h in sorted(histograms.items())],
+        columns=["Operation", "Page", "Count", "Mean ms", "p50 ms", "p95 ms", "p99 ms", "Total s"]).round(2))
+    op = st.selectbox("Latency histogram for", sorted({op for op, _ in histograms}))
+    buckets = [0] * len(metrics.BUCKETS)
+    for (name, _), h in histograms.items():
+        if name == op:
+            buckets = [a + b for a, b in zip(buckets, h.counts)]
+    labels = [f"≤{b * 1000:g} ms" if b != float("inf") else "> 10 s" for b in metrics.BUCKETS]
+    st.bar_chart(pd.DataFrame({"Count": buckets}, index=pd.Index(labels, name="Latency")), sort=False)
+    if counters:
+        st.dataframe(pd.DataFrame([(name, page, value) for (name, page), value in sorted(counters.items())],
+                                  columns=["Event", "Page", "Count"]))
+    st.download_button("Download metrics (Prometheus text)", data=metrics.render_prometheus(),
+                       file_name="quiz_metrics.prom", mime="text/plain")
+
+
+def render():
+    if not st.session_state.get('prof_verified', False):
+        secret_key = st.text_input("Enter Professor Secret Key to continue", type="password")
+        
+        if st.button("Verify Key"):
+            if secret_key == PROFESSOR_SECRET_KEY:
+                st.session_state.prof_verified = True
+                st.rerun()
+            else:
+                st.error("Invalid secret key! Access denied.")
+    else:
+        st.header("\U0001F4E1 Live Monitoring Dashboard")
+        st.info("Monitoring students currently taking the quiz")
+
+        try:
+            prepare_results()
+        except Exception as e:
+            # Results saved since are still shown; the import is retried on the next run
+            st.warning(f"Older results could not be prepared: {e}")
+
+        # Seeded from the tables once per session; after that each tick only
+        # reads the events published since the view's cursor
+        if 'monitor_view' not in st.session_state:
+            quiz_window_start = time.time() - 60 * 60
+            # Read first, so events published while the tables are read are still applied
+            cursor = latest_event_id()
+            st.session_state.monitor_view = MonitorView(
+                cursor,
+                get_active_students(),
+                recent_results(5).drop(columns=["Hashed_Password"]).to_dict("records"),
+                recent_flags(20),
+                flag_counts(since=quiz_window_start))
+        live_monitor(st.session_state.monitor_view)
+
+        if st.checkbox("Show server metrics"):
+            server_metrics()
@@ -0,0 +1,262 @@
+import functools
+import os
+
+import streamlit as st
+from email_validator import EmailNotValidError
+
+from quiz_app.credentials import LoginThrottled
+from quiz_app.grading import GRADING_SCHEMES, active_scheme, regrade_all
+from quiz_app.item_analysis import get_item_stats
+from quiz_app.questions import get_question_bank
+from quiz_app.results import (SORT_COLUMNS, list_quizzes, list_sections, list_partitions, get_result_stats,
+                              get_results_version, count_results, query_results, export_results_csv)
+from quiz_app.roster import create_professor, errors_csv, import_roster, normalize_email
+from quiz_app.snapshots import load_snapshot
+from quiz_app.startup import prepare_results
+from quiz_app.views.common import PROFESSOR_SECRET_KEY, authenticate_user
+
+
+# Dashboard caches, keyed on the results version so a new submission invalidates them
+@st.cache_data(max_entries=64)
+def cached_result_stats(section, quiz_id, version):
+    return get_result_stats(section, quiz_id)
+
+@st.cache_data(max_entries=64)
+def cached_result_count(version, **filters):
+    return count_results(**filters)
+
+@st.cache_data(max_entries=64)
+def cached_results_page(version, sort_by, ascending, limit, offset, **filters):
+    return query_results(sort_by=sort_by, ascending=ascending, limit=limit, offset=offset, **filters)
+
+# Score distribution and daily submissions, from the typed results snapshot
+@st.cache_data(max_entries=16)
+def cached_score_analytics(section, quiz_id, version):
+    df = load_snapshot(section, quiz_id)
+    distribution = df["Score"].round().astype(int).value_counts().sort_index().rename("Students")
+    daily = df.groupby(df["Timestamp"].dt.date).agg(Submissions=("Score", "size"), Average_Score=("Score", "mean"))
+    return distribution, daily
+
+# Per-question statistics for the current question bank, from the running sums
+@st.cache_data(max_entries=16)
+def cached_item_stats(quiz_id, section, version):
+    return get_item_stats(get_question_bank(), section)
+
+
+def render():
+    st.subheader("\U0001F9D1‍\U0001F3EB Professor Access Panel")
+    
+    # First check for secret key
+    if 'prof_secret_verified' not in st.session_state:
+        secret_key = st.text_input("Enter Professor Secret Key to continue", type="password")
+        
+        if st.button("Verify Key"):
+            if secret_key == PROFESSOR_SECRET_KEY:
+                st.session_state.prof_secret_verified = True
+                st.rerun()
+            else:
+                st.error("Invalid secret key! Access denied.")
+    else:
+        # After secret key verification, show login/registration tabs
+        tab1, tab2 = st.tabs(["Professor Login", "Professor Registration"])
+        
+        with tab1:  # Login tab
+            if not st.session_state.get('prof_logged_in', False):
+                prof_id = st.text_input("Professor ID")
+                prof_pass = st.text_input("Professor Password", type="password")
+                
+                if st.button("Login as Professor"):
+                    try:
+                        prof_role = authenticate_user(prof_id, prof_pass)
+                    except LoginThrottled as e:
+                        prof_role = False
+                        st.error(f"Too many login attempts. Please try again in {e.retry_after} seconds.")
+
+                    if prof_role == "professor":
+                        st.session_state.prof_logged_in = True
+                        st.session_state.username = prof_id
+                        st.session_state.role = "professor"
+                        st.success(f"Welcome Professor {prof_id}!")
+                        os.makedirs(st.session_state.prof_dir, exist_ok=True)
+                        st.rerun()
+                    elif prof_role is not False:
+                        st.error("Invalid Professor credentials")
+            else:
+                # Show professor dashboard after successful login
+                st.success(f"Welcome Professor {st.session_state.username}!")
+                st.subheader("Student Results Management")
+                
+                try:
+                    prepare_results()
+                except Exception as e:
+                    # Results saved since are still shown; the import is retried on the next run
+                    st.warning(f"Older results could not be prepared: {e}")
+                paper_length = get_question_bank().paper_size()
+
+                # View results section (result sets are listed from the partition catalog)
+                quizzes = list_quizzes()
+                quiz_filter = None
+                if len(quizzes) > 1:
+                    selected_quiz = st.selectbox("Quiz", ["All Quizzes"] + quizzes)
+                    quiz_filter = None if selected_quiz == "All Quizzes" else selected_quiz
+                sections = list_sections(quiz_filter)
+                if sections:
+                    result_sets = ["All Sections"] + sections
+                    selected_set = st.selectbox("Select results", result_sets)
+                    section_filter = None if selected_set == "All Sections" else selected_set
+                    results_version = get_results_version()
+                    try:
+                        stats = cached_result_stats(section_filter, quiz_filter, results_version)
+
+                        # Display statistics
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Total Students", stats["count"])
+                        with col2:
+                            st.metric("Average Score", f"{stats['avg_score']:.1f}/{paper_length}")
+                        with col3:
+                            st.metric("Pass Rate", f"{stats['pass_rate']:.1f}%")
+
+                        # Show results one page at a time (sorted and filtered in the database)
+                        st.markdown("### Detailed Results")
+                        fcol1, fcol2 = st.columns(2)
+                        with fcol1:
+                            usn_filter = st.text_input("Filter by USN").strip().upper() or None
+                        with fcol2:
+                            min_score, max_score = st.slider("Score range", 0, paper_length, (0, paper_length))
+                        if (min_score, max_score) == (0, paper_length):
+                            min_score = max_score = None
+                        filters = dict(section=section_filter, usn=usn_filter, min_score=min_score, max_score=max_score,
+                                       quiz_id=quiz_filter)
+
+                        scol1, scol2, scol3 = st.columns(3)
+                        with scol1:
+                            sort_by = st.selectbox("Sort by", list(SORT_COLUMNS))
+                        with scol2:
+                            page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+                        with scol3:
+                            ascending = st.checkbox("Ascending order", True)
+
+                        total_rows = cached_result_count(results_version, **filters)
+                        page_count = max(1, -(-total_rows // page_size))
+                        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+                        page_df = cached_results_page(results_version, sort_by, ascending, page_size,
+                                                      (page - 1) * page_size, **filters)
+                        first_row = (page - 1) * page_size + 1 if total_rows else 0
+                        st.caption(f"Showing rows {first_row}-{(page - 1) * page_size + len(page_df)} of {total_rows}")
+                        st.dataframe(page_df)
+
+                        # Download option (the CSV is only built when the button is clicked)
+                        st.download_button(
+                            label="Download Results",
+                            data=functools.partial(export_results_csv, sort_by=sort_by, ascending=ascending, **filters),
+                            file_name=f"sorted_{selected_set.replace(' ', '_').lower()}_results.csv",
+                            mime="text/csv"
+                        )
+                        
+                        with st.expander("Score analytics"):
+                            distribution, daily = cached_score_analytics(section_filter, quiz_filter, results_version)
+                            st.markdown("Score distribution")
+                            st.bar_chart(distribution)
+                            st.markdown("Submissions per day")
+                            st.bar_chart(daily["Submissions"])
+                            st.markdown("Average score per day")
+                            st.line_chart(daily["Average_Score"])
+
+                        with st.expander("Item analysis"):
+                            bank = get_question_bank()
+                            if quiz_filter and quiz_filter != bank.quiz_id:
+                                st.info(f"Item analysis covers the current question bank ({bank.quiz_id}) only.")
+                            else:
+                                items, choices, summary = cached_item_stats(bank.quiz_id, section_filter,
+                                                                            results_version)
+                                icol1, icol2, icol3 = st.columns(3)
+                                with icol1:
+                                    st.metric("Papers analysed", summary["papers"])
+                                with icol2:
+                                    alpha = summary["alpha"]
+                                    st.metric("Cronbach's alpha", "n/a" if alpha is None else f"{alpha:.2f}")
+                                with icol3:
+                                    mean_total = summary["mean_total"]
+                                    st.metric("Average correct", "n/a" if mean_total is None else
+                                              f"{mean_total:.1f}/{summary['paper_length']}")
+                                st.caption("Difficulty is the share of students answering correctly; "
+                                           "discrimination is the point-biserial correlation with the rest "
+                                           "of the paper (below 0.2 is worth reviewing).")
+                                st.dataframe(items, hide_index=True)
+                                if not items.empty:
+                                    labels = dict(zip(items["Question"], items["Text"]))
+                                    question = st.selectbox("Option choices for question", items["Question"],
+                                                            format_func=lambda qid: f"{qid}: {labels[qid]}")
+                                    st.dataframe(choices[choices["Question"] == question].drop(columns="Question"),
+                                                 hide_index=True)
+
+                        with st.expander("Result partitions"):
+                            st.dataframe(list_partitions(quiz_filter))
+
+                    except Exception as e:
+                        st.error(f"Error loading results: {e}")
+                else:
+                    st.warning("No results available yet.")
+                
+                # Re-score every stored attempt after an answer key correction
+                with st.expander("Re-grade all attempts"):
+                    st.caption("Edit question_bank.json first; the bank is reloaded when the file changes. "
+                               "New submissions are graded with the scheme chosen here.")
+                    scheme = st.selectbox("Grading scheme", GRADING_SCHEMES,
+                                          index=GRADING_SCHEMES.index(active_scheme()))
+                    if st.button("Re-grade"):
+                        report = regrade_all(get_question_bank(), scheme)
+                        st.success(f"Re-graded {report['attempts']} attempts ({report['changed']} changed) in "
+                                   f"{report['total_seconds']:.2f}s (scoring took {report['grade_seconds'] * 1000:.0f} ms, "
+                                   f"writing {report['lock_seconds'] * 1000:.0f} ms).")
+
+                # Create student accounts from a roster CSV; credentials are emailed
+                with st.expander("Import student roster"):
+                    st.caption("CSV with a header row: username, email and optionally name. "
+                               "Each student is emailed a generated password.")
+                    roster = st.file_uploader("Roster CSV", type="csv")
+                    if roster is not None and st.button("Create accounts"):
+                        try:
+                            report = import_roster(roster)
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.success(f"Created {report['created']} of {report['rows']} accounts in "
+                                       f"{report['total_seconds']:.2f}s. Credentials emails are queued.")
+                            if report["errors"]:
+                                st.warning(f"{len(report['errors'])} rows were not imported.")
+                                st.dataframe(report["errors"])
+                                st.download_button("Download error report", errors_csv(report["errors"]),
+                                                   file_name="roster_errors.csv", mime="text/csv")
+
+                # Logout button
+                if st.button("Logout"):
+                    st.session_state.prof_logged_in = False
+                    st.session_state.username = ""
+                    st.session_state.role = ""
+                    st.rerun()
+        
+        with tab2:  # Registration tab
+            st.subheader("Professor Registration")
+            st.warning("Professor accounts require verification.")
+            
+            # Registration form
+            full_name = st.text_input("Full Name")
+            designation = st.text_input("Designation")
+            department = st.selectbox("Department", ["CSE", "ISE", "ECE", "EEE", "MECH", "CIVIL"])
+            institutional_email = st.text_input("Institutional Email")
+            
+            if st.button("Request Account"):
+                if full_name and designation and department and institutional_email:
+                    try:
+                        prof_id = create_professor(full_name, normalize_email(institutional_email))
+                    except EmailNotValidError as e:
+                        st.error(f"Invalid email: {e}")
+                    except RuntimeError as e:
+                        st.error(str(e))
+                    else:
+                        os.makedirs(f"professor_data/{prof_id}", exist_ok=True)
+                        st.success("Account created! Credentials will be sent to your email.")
+                else:
+                    st.error("Please fill all fields!")
@@ -0,0 +1,32 @@
+import streamlit as st
+
+from quiz_app import media
+from quiz_app.recording import SEGMENT_SECONDS
+from quiz_app.video_catalog import contact_sheet_path, list_recordings, locate, recording_segments
+
+
+def render():
+    st.subheader("Recorded Sessions")
+    # Listed from the recordings catalog; only the segment being watched is loaded
+    recordings = list_recordings()
+
+    if not recordings.empty:
+        st.dataframe(recordings, hide_index=True)
+        labels = [f"{r.Student} - attempt {r.Attempt}" for r in recordings.itertuples()]
+        selected = st.selectbox("Select recording", range(len(labels)), format_func=labels.__getitem__)
+        student, attempt_no = recordings.iloc[selected][["Student", "Attempt"]]
+        segments = recording_segments(student, int(attempt_no))
+        sheet = media.read(contact_sheet_path(student, int(attempt_no)))
+        if sheet is not None:
+            st.image(sheet, caption=f"One frame per {SEGMENT_SECONDS}-second segment")
+        total_seconds = int(sum(segment["duration"] for segment in segments))
+        position = st.slider("Position (seconds)", 0, total_seconds - 1, 0) if total_seconds > 1 else 0
+        segment, offset = locate(segments, position)
+        st.caption(f"Segment {segment['segment_no']} of {len(segments)}")
+        video = media.read(segment["path"])
+        if video is not None:
+            st.video(video, format="video/mp4", start_time=int(offset))
+        else:
+            st.warning("This segment is not available on this server.")
+    else:
+        st.warning("No recordings available.")
@@ -0,0 +1,47 @@
+import streamlit as st
+
+from quiz_app.db import backend, begin_write, get_db_connection
+from quiz_app.credentials import hash_password
+from quiz_app.otp import REGISTRATION, OtpExpired, OtpThrottled, issue_otp, verify_otp
+
+
+# Register user (the password is hashed when the OTP is requested)
+def register_user(username, password_hash, role, email):
+    with get_db_connection() as conn:
+        try:
+            # Keyed like a roster import, which checks for taken usernames first
+            begin_write(conn, f"user:{username}")
+            conn.execute(backend.USER_ADD, (username, password_hash, role, email))
+            conn.commit()
+            st.success("Registration successful! Please login.")
+        except backend.IntegrityError:
+            st.error("Username already exists!")
+
+
+def render():
+    username = st.text_input("Username")
+    email = st.text_input("Email")
+    password = st.text_input("Password", type="password")
+    role = st.selectbox("Role", ["student"])
+
+    if st.button("Send OTP"):
+        if username and email and password:
+            # The code and the pending registration are kept on the server
+            # (quiz_app.otp), so only the email and code are needed to finish
+            try:
+                issue_otp(REGISTRATION, email, {"username": username, "password": hash_password(password), "role": role})
+                st.success("OTP sent to your email.")
+            except OtpThrottled as e:
+                st.error(f"An OTP was sent recently. Please try again in {e.retry_after} seconds.")
+    
+    otp_entered = st.text_input("Enter OTP")
+    if st.button("Verify and Register"):
+        try:
+            pending = verify_otp(REGISTRATION, email, otp_entered) if email else None
+        except OtpExpired:
+            st.error("OTP expired or not requested. Please send a new OTP.")
+        else:
+            if pending:
+                register_user(pending["username"], pending["password"], pending["role"], email)
+            else:
+                st.error("Incorrect OTP!")
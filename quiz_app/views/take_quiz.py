@@ -0,0 +1,164 @@
+import functools
+import time
+
+import streamlit as st
+from streamlit_webrtc import webrtc_streamer, WebRtcMode, VideoTransformerBase
+
+from quiz_app.attempts import (ATTEMPT_LIMIT, SWEEP_GRACE_SECONDS, AttemptLimitReached, attempt_paper,
+                               attempts_used, autosave_answer, claim_attempt, finalize_attempt,
+                               get_active_attempt, get_attempt)
+from quiz_app.presence import HEARTBEAT_SECONDS, add_active_student, heartbeat
+from quiz_app.proctoring import ProctorFeed
+from quiz_app.questions import get_question_bank, new_paper_seed
+from quiz_app.recording import SegmentRecorder
+from quiz_app.video_catalog import next_segment_no, segment_closed
+
+
+# Video processor: passes frames straight through and hands them to the
+# attempt's recorder and to the shared proctoring analyzer, both of which do
+# their work on other threads
+class VideoProcessor(VideoTransformerBase):
+    def __init__(self, username="", attempt_no=0):
+        self.recorder = SegmentRecorder(username, attempt_no, segment_closed,
+                                        next_segment_no(username, attempt_no)) if username else None
+        self.proctor = ProctorFeed(username, attempt_no) if username else None
+
+    def recv(self, frame):
+        if self.recorder is not None:
+            self.recorder.submit(frame)
+            self.proctor.submit(frame)
+        return frame
+
+    def on_ended(self):
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.proctor.close()
+
+
+# Keeps the student's presence row fresh without rerunning the whole quiz page
+@st.fragment(run_every=HEARTBEAT_SECONDS)
+def presence_heartbeat(username, section, attempt_no, deadline):
+    if not heartbeat(username):
+        # Row expired (e.g. laptop slept past the TTL): join again, but only
+        # while the attempt is still open
+        attempt = get_attempt(username, attempt_no)
+        if attempt is not None and attempt["status"] == "active":
+            add_active_student(username, section)
+    # Past the deadline the sweeper finalizes the attempt; rerun to show it
+    if time.time() > deadline + SWEEP_GRACE_SECONDS:
+        st.rerun()
+
+
+# Radio on_change: queue the answer for the debounced autosave
+def save_answer(username, attempt_no, question_id, key):
+    autosave_answer(username, attempt_no, question_id, st.session_state[key])
+
+
+# Explains what starting costs and claims the next attempt on Start. From then
+# the timer runs and the attempt counts, submitted or not.
+def start_quiz(username, used):
+    if used >= ATTEMPT_LIMIT:
+        st.error(f"You have already taken the quiz {ATTEMPT_LIMIT} times. No more attempts allowed.")
+        return
+    if used == ATTEMPT_LIMIT - 1:
+        st.warning(f"⚠️ This is your last attempt ({ATTEMPT_LIMIT} of {ATTEMPT_LIMIT}). Once you start, it counts "
+                   "even if you leave before submitting.")
+    else:
+        st.info(f"This will be attempt {used + 1} of {ATTEMPT_LIMIT}. Once you start, the timer runs and the "
+                "attempt counts even if you leave before submitting.")
+    if st.button("Start Quiz"):
+        try:
+            attempt = claim_attempt(username, st.session_state.usn, st.session_state.section, new_paper_seed())
+        except AttemptLimitReached as e:
+            st.error(f"You have already taken the quiz {e.limit} times. No more attempts allowed.")
+            return
+        st.session_state.quiz_attempt_no = attempt["attempt_no"]
+        st.rerun()
+
+
+def render():
+    if not st.session_state.logged_in:
+        st.warning("Please login first!")
+    else:
+        username = st.session_state.username
+        usn = st.text_input("Enter your USN")
+        section = st.text_input("Enter your Section")
+        st.session_state.usn = usn.strip().upper()
+        st.session_state.section = section.strip().upper()
+
+        if usn and section:
+            # The attempt (start time, deadline, answers) is kept on the server,
+            # so reconnecting resumes it instead of starting over
+            attempt = None
+            if 'quiz_attempt_no' in st.session_state:
+                attempt = get_attempt(username, st.session_state.quiz_attempt_no)
+            if attempt is None and not st.session_state.quiz_submitted:
+                # An open attempt (e.g. from before a reconnect) resumes as is;
+                # a new one is only claimed when the student presses Start
+                attempt = get_active_attempt(username)
+                if attempt is None:
+                    start_quiz(username, attempts_used(username))
+
+            if attempt is not None and attempt["status"] != "active":
+                # Finalized by the deadline sweeper while the page was open
+                if not st.session_state.quiz_submitted:
+                    st.warning("⏰ Time is up! Your quiz was submitted automatically.")
+                    st.session_state.quiz_submitted = True
+                    st.session_state.camera_active = False
+                outcome = st.session_state.pop("quiz_outcome", None)
+                if outcome is not None:
+                    st.success("Your quiz result will be emailed to you shortly.")
+                    st.success(f"✅ Quiz submitted successfully! You scored {outcome['score']} out of {outcome['total']}.")
+                else:
+                    st.info("Your quiz has been submitted.")
+            elif attempt is not None:
+                attempt_no = attempt["attempt_no"]
+                st.session_state.quiz_attempt_no = attempt_no
+                paper = attempt_paper(get_question_bank(), attempt)
+
+                time_left = int(attempt["deadline"] - time.time())
+                auto_submit_triggered = time_left <= 0
+                if auto_submit_triggered:
+                    st.warning("⏰ Time is up! Auto-submitting your quiz.")
+                else:
+                    mins, secs = divmod(time_left, 60)
+                    st.info(f"⏳ Time left: {mins:02d}:{secs:02d}")
+
+                answers = {}
+
+                if not st.session_state.quiz_submitted and not st.session_state.camera_active:
+                    add_active_student(username, st.session_state.section)
+                    st.session_state.camera_active = True
+
+                if st.session_state.camera_active and not st.session_state.quiz_submitted:
+                    presence_heartbeat(username, st.session_state.section, attempt_no, attempt["deadline"])
+                    st.markdown("<span style='color:red;'>\U0001F7E2 Webcam is ON</span>", unsafe_allow_html=True)
+                    webrtc_streamer(
+                        key="camera",
+                        mode=WebRtcMode.SENDRECV,
+                        media_stream_constraints={"video": True, "audio": False},
+                        video_processor_factory=functools.partial(VideoProcessor, username, attempt_no),
+                    )
+
+                for idx, question in enumerate(paper):
+                    st.markdown(f"**Q{idx+1}:** {question['question']}")
+                    saved = attempt["answers"].get(question['id'])
+                    key = f"q_{question['id']}"
+                    ans = st.radio("Select your answer:", question['options'], key=key,
+                                   index=question['options'].index(saved) if saved in question['options'] else None,
+                                   on_change=save_answer, args=(username, attempt_no, question['id'], key))
+                    answers[question['id']] = ans
+
+                submit_btn = st.button("Submit Quiz")
+
+                if (submit_btn or auto_submit_triggered) and not st.session_state.quiz_submitted:
+                    if submit_btn and None in answers.values():
+                        st.error("Please answer all questions before submitting the quiz.")
+                    else:
+                        st.session_state.quiz_outcome = finalize_attempt(username, attempt_no, answers)
+                        # Cleanup session & camera
+                        st.session_state.quiz_submitted = True
+                        st.session_state.camera_active = False
+                        # Rerun without the heartbeat fragment and webcam, and
+                        # show the outcome from the finalized attempt
+                        st.rerun()